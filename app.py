@@ -1,25 +1,37 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib.parse import urlparse
 from requests_toolbelt import MultipartEncoder
 import os
 import time
 import json
 import contextlib
 import mimetypes
-from flask import Flask, render_template, request, send_file, jsonify
+import socket
+from flask import Flask, render_template, request, send_file, jsonify, Response, stream_with_context
 import tempfile
 import shutil
 import re
 import base64
 from io import BytesIO
-from config import Config
+from config import Config, to_bool
 import threading
 import uuid
+import hashlib
+import functools
+import sqlite3
+import contextvars
+import collections
+import heapq
+import math
 from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
-# 任务存储（内存中）
-# 结构: {task_id: {status, progress, message, result_path, error, created_at, updated_at}}
-translation_tasks = {}
-tasks_lock = threading.Lock()
+# 当前线程正在处理的任务ID（提交到线程池时通过 _submit_with_context 传递）
+current_task_id = contextvars.ContextVar('current_task_id', default=None)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
@@ -51,23 +63,851 @@ def after_request(response):
     return response
 
 
-def _to_bool(value, default=False):
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return value
-    return str(value).strip().lower() in {"true", "1", "yes", "on"}
+class TokenBucket:
+    """线程安全的令牌桶限流器：按 rate 个/秒补充令牌，最多累积 burst 个"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """获取令牌，令牌不足时阻塞等待；返回实际等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait_time = (tokens - self.tokens) / self.rate
+            cancellable_sleep(wait_time, reason='rate_limit')
+            waited += wait_time
+
+
+# DeepLX 共享限流器（所有任务、所有线程共用同一份配额）
+deeplx_rate_limiter = TokenBucket(Config.DEEPLX_RATE_PER_SECOND, Config.DEEPLX_BURST)
+
+
+# 按目标主机共享的 HTTP 连接池（复用 TCP+TLS 连接）
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+_http_sessions_pid = os.getpid()
+
+# 当前线程正在执行的可取消HTTP调用（由 cancellable_call 设置）
+_http_call = threading.local()
+
+
+class _HTTPCall:
+    """一次可取消的HTTP调用：记录调用过程中使用的连接，取消时关闭其套接字"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = []
+        self.aborted = False
+
+    def attach(self, conn):
+        with self.lock:
+            if self.aborted:
+                raise ConnectionAbortedError('任务已取消')
+            self.connections.append(conn)
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            connections = list(self.connections)
+        for conn in connections:
+            sock = getattr(conn, 'sock', None)
+            if sock is None:
+                continue
+            try:
+                # shutdown 会唤醒阻塞在该套接字上的读写，服务器也会看到连接断开
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 
-def parse_pdf_with_mineru(filepath, options=None, api_token=None):
-    """使用MinerU API解析PDF"""
-    from config import Config
-    
-    # 使用传入的token或配置文件中的token
-    token = api_token or Config.MINERU_API_TOKEN
-    api_url = Config.MINERU_API_URL
-    
-    base_payload = {
+class _AbortableConnectionMixin:
+    def request(self, *args, **kwargs):
+        call = getattr(_http_call, 'current', None)
+        if call is not None:
+            call.attach(self)
+        return super().request(*args, **kwargs)
+
+
+class _AbortableHTTPConnection(_AbortableConnectionMixin, HTTPConnection):
+    pass
+
+
+class _AbortableHTTPSConnection(_AbortableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _AbortableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _AbortableHTTPConnection
+
+
+class _AbortableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _AbortableHTTPSConnection
+
+
+_ABORTABLE_POOL_CLASSES = {'http': _AbortableHTTPConnectionPool, 'https': _AbortableHTTPSConnectionPool}
+
+
+class AbortableHTTPAdapter(HTTPAdapter):
+    """连接可被 cancellable_call 中断的 HTTPAdapter（包括经代理的连接）"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _ABORTABLE_POOL_CLASSES
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        manager.pool_classes_by_scheme = _ABORTABLE_POOL_CLASSES
+        return manager
+
+
+def _create_http_session():
+    """创建带连接池和传输层重试的 Session"""
+    session = requests.Session()
+    # 传输层只重试连接阶段的错误（请求尚未发出，重试安全）；
+    # GET 额外重试网关类错误。业务层的超时/格式异常重试仍由各调用函数负责。
+    retry = Retry(
+        total=Config.HTTP_RETRIES,
+        connect=Config.HTTP_RETRIES,
+        read=0,
+        status=Config.HTTP_RETRIES,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        backoff_factor=Config.HTTP_RETRY_BACKOFF,
+        raise_on_status=False,
+    )
+    adapter = AbortableHTTPAdapter(
+        pool_connections=Config.HTTP_POOL_SIZE,
+        pool_maxsize=Config.HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not Config.HTTP_KEEPALIVE:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def get_http_session(url):
+    """按目标主机返回共享的 Session（线程安全，fork 出的子进程会重新创建）"""
+    global _http_sessions_pid
+    parsed = urlparse(url)
+    host_key = f"{parsed.scheme}://{parsed.netloc}"
+    with _http_sessions_lock:
+        if _http_sessions_pid != os.getpid():
+            # 不与父进程共享套接字
+            _http_sessions.clear()
+            _http_sessions_pid = os.getpid()
+        session = _http_sessions.get(host_key)
+        if session is None:
+            session = _create_http_session()
+            _http_sessions[host_key] = session
+        return session
+
+
+class Metric:
+    """Prometheus 指标基类：按标签值元组保存数据，线程安全"""
+
+    type = 'untyped'
+    # 是否写入共享目录、与其他进程的数据合并
+    shared = True
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    @staticmethod
+    def _format_labels(names, values):
+        if not names:
+            return ''
+        pairs = []
+        for name, value in zip(names, values):
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{name}="{value}"')
+        return '{' + ','.join(pairs) + '}'
+
+    @staticmethod
+    def _format_value(value):
+        return str(value) if isinstance(value, int) else repr(float(value))
+
+    def current_values(self):
+        """本进程的取值副本 {标签值元组: 数值}"""
+        with self.lock:
+            return dict(self.values)
+
+    def dump(self):
+        """转换为可写入 JSON 的列表"""
+        return [[list(key), value] for key, value in self.current_values().items()]
+
+    def merge(self, values, dumped):
+        """把其他进程 dump() 的数据累加到 values"""
+        for key, value in dumped:
+            key = tuple(key)
+            values[key] = values.get(key, 0) + value
+        return values
+
+    def samples(self, values=None):
+        values = self.current_values() if values is None else values
+        return [(self.name, self.labelnames, key, value) for key, value in sorted(values.items())]
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labelnames, key, value in self.samples(values):
+            lines.append(f"{name}{self._format_labels(labelnames, key)} {self._format_value(value)}")
+        return '\n'.join(lines)
+
+
+class MetricCounter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class MetricGauge(Metric):
+    """
+    取值在抓取时由 collect() 计算的指标，返回 {标签值元组: 数值}。
+    shared=True 时各进程的取值相加（只计仍在运行的进程），否则只由处理抓取请求的进程计算
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None, shared=True):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self.shared = shared
+
+    def current_values(self):
+        return dict(self.collect())
+
+
+class MetricHistogram(Metric):
+    type = 'histogram'
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.setdefault(key, {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def current_values(self):
+        with self.lock:
+            return {key: dict(state, counts=list(state['counts'])) for key, state in self.values.items()}
+
+    def merge(self, values, dumped):
+        for key, other in dumped:
+            key = tuple(key)
+            state = values.setdefault(key, {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            state['counts'] = [a + b for a, b in zip(state['counts'], other['counts'])]
+            state['sum'] += other['sum']
+            state['count'] += other['count']
+        return values
+
+    def samples(self, values=None):
+        values = self.current_values() if values is None else values
+        samples = []
+        for key, state in sorted(values.items()):
+            for bound, count in zip(self.buckets, state['counts']):
+                samples.append((f"{self.name}_bucket", self.labelnames + ('le',), key + (f"{bound:g}",), count))
+            samples.append((f"{self.name}_bucket", self.labelnames + ('le',), key + ('+Inf',), state['count']))
+            samples.append((f"{self.name}_sum", self.labelnames, key, state['sum']))
+            samples.append((f"{self.name}_count", self.labelnames, key, state['count']))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    指标注册表，按 Prometheus 文本格式输出。
+    设置了共享目录时，每个进程定期把自己的数据写入其中的一个文件，/metrics 合并所有进程
+    （计数器和直方图包括已退出的进程，保持单调递增），多个 gunicorn worker 时抓到任一 worker 结果都完整。
+    """
+
+    def __init__(self, directory=None, flush_interval=5):
+        self.metrics = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def _path(self, identity):
+        return os.path.join(self.directory, identity.replace(':', '_') + '.json')
+
+    def flush(self):
+        """把本进程的数据写入共享目录（写临时文件后原子替换）"""
+        if not self.directory:
+            return
+        identity = _process_identity()
+        data = {'process': identity, 'metrics': {m.name: m.dump() for m in self.metrics if m.shared}}
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(identity)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    def start(self):
+        """启动定期写入线程（每个进程一个，在 fork 之后调用）"""
+        with self.lock:
+            if not self.directory or self.flush_interval <= 0 or self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        threading.Thread(target=self._loop, name="metrics-flush", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ 写入指标文件失败: {e}", flush=True)
+            time.sleep(self.flush_interval)
+
+    def _other_processes(self):
+        """共享目录中其他进程最近一次写入的数据"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        own = _process_identity()
+        others = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get('process') != own:
+                others.append(data)
+        return others
+
+    def merged(self, metric, others=None):
+        """本进程的实时数据加上其他进程写入的数据"""
+        values = metric.current_values()
+        for data in self._other_processes() if others is None else others:
+            dumped = data.get('metrics', {}).get(metric.name)
+            if dumped is None or (isinstance(metric, MetricGauge) and not _owner_alive(data.get('process'))):
+                continue
+            values = metric.merge(values, dumped)
+        return values
+
+    def render(self):
+        others = self._other_processes()
+        return '\n'.join(metric.render(self.merged(metric, others) if metric.shared else None)
+                         for metric in self.metrics) + '\n'
+
+
+metrics = MetricsRegistry(Config.METRICS_DIR, Config.METRICS_FLUSH_INTERVAL)
+STAGE_SECONDS = metrics.register(MetricHistogram(
+    'translater_stage_duration_seconds', '各处理阶段耗时（秒）', ['stage']))
+OUTBOUND_REQUESTS = metrics.register(MetricCounter(
+    'translater_outbound_requests_total', '外部服务请求次数（按后端和状态码）', ['backend', 'status']))
+OUTBOUND_RETRIES = metrics.register(MetricCounter(
+    'translater_outbound_retries_total', '外部服务请求重试次数', ['backend']))
+CHARACTERS = metrics.register(MetricCounter(
+    'translater_characters_total', '发送给翻译后端和从后端收到的字符数', ['backend', 'direction']))
+CACHE_LOOKUPS = metrics.register(MetricCounter(
+    'translater_cache_lookups_total', '缓存查询次数', ['cache', 'result']))
+
+
+def _cache_hit_ratios():
+    # 按所有进程合并后的查询次数计算
+    lookups = metrics.merged(CACHE_LOOKUPS)
+    ratios = {}
+    for cache in ('translation_memory', 'parse'):
+        hits = lookups.get((cache, 'hit'), 0)
+        total = hits + lookups.get((cache, 'miss'), 0)
+        if total:
+            ratios[(cache,)] = hits / total
+    return ratios
+
+
+metrics.register(MetricGauge(
+    'translater_cache_hit_ratio', '缓存命中率', ['cache'], collect=_cache_hit_ratios, shared=False))
+
+
+class TaskTracer:
+    """
+    记录一个任务内的耗时区间（span），导出为 Chrome trace 格式，可在 chrome://tracing 或 Perfetto 中查看。
+    区间按线程记录，同一线程内的嵌套关系由时间包含关系体现。
+    """
+
+    MAX_EVENTS = 20000
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = {}
+        self.dropped = 0
+
+    def record(self, name, start, end, **args):
+        tid = threading.get_ident()
+        with self.lock:
+            self.threads.setdefault(tid, threading.current_thread().name)
+            if len(self.events) >= self.MAX_EVENTS:
+                self.dropped += 1
+                return
+            self.events.append({
+                'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                'ts': round(start * 1e6), 'dur': round((end - start) * 1e6), 'args': args,
+            })
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """记录一个区间；可向 yield 出的 args 字典补充结果信息（如状态码）"""
+        start = time.time()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.record(name, start, time.time(), **args)
+
+    def to_chrome_trace(self):
+        with self.lock:
+            pid = os.getpid()
+            metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': f"任务 {self.task_id}"}}]
+            metadata += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                         for tid, name in self.threads.items()]
+            return {
+                'traceEvents': metadata + sorted(self.events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms',
+                'otherData': {'task_id': self.task_id, 'dropped_events': self.dropped},
+            }
+
+    def _path(self):
+        return os.path.join(Config.TRACE_DIR, f"{self.task_id}.json")
+
+    def save(self):
+        try:
+            os.makedirs(Config.TRACE_DIR, exist_ok=True)
+            with open(self._path(), 'w', encoding='utf-8') as f:
+                json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        except OSError as e:
+            print(f"⚠️ 无法保存任务跟踪数据: {e}", flush=True)
+
+
+_tracers = {}
+_tracers_lock = threading.Lock()
+
+
+def register_tracer(task_id):
+    with _tracers_lock:
+        tracer = _tracers[task_id] = TaskTracer(task_id)
+        return tracer
+
+
+def release_tracer(task_id):
+    with _tracers_lock:
+        tracer = _tracers.pop(task_id, None)
+    if tracer is not None:
+        tracer.save()
+
+
+def current_tracer():
+    """当前后台任务的跟踪器；同步接口中为None"""
+    task_id = current_task_id.get()
+    if task_id is None:
+        return None
+    with _tracers_lock:
+        return _tracers.get(task_id)
+
+
+def trace_span(name, tracer=None, **args):
+    """在当前任务（或指定跟踪器）中记录一个区间，没有跟踪器时不做任何事"""
+    tracer = tracer or current_tracer()
+    if tracer is None:
+        return contextlib.nullcontext(args)
+    return tracer.span(name, **args)
+
+
+def load_trace(task_id):
+    """读取任务的跟踪数据：运行中的任务从内存读取，已结束的任务从文件读取"""
+    with _tracers_lock:
+        tracer = _tracers.get(task_id)
+    if tracer is not None:
+        return tracer.to_chrome_trace()
+    try:
+        with open(os.path.join(Config.TRACE_DIR, f"{task_id}.json"), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def timed_stage(stage):
+    """装饰器：记录函数耗时到阶段耗时直方图，并在任务跟踪中记录一个区间"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(stage=stage), trace_span(fn.__name__, stage=stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def outbound_request(backend, method, url, **kwargs):
+    """发出外部HTTP请求（可被任务取消打断），并按后端统计状态码"""
+    with trace_span(f"{backend} {method.upper()}", host=urlparse(url).netloc) as span:
+        try:
+            response = cancellable_call(getattr(get_http_session(url), method), url, **kwargs)
+        except requests.exceptions.Timeout:
+            OUTBOUND_REQUESTS.inc(backend=backend, status='timeout')
+            raise
+        except requests.exceptions.RequestException:
+            OUTBOUND_REQUESTS.inc(backend=backend, status='error')
+            raise
+        status = getattr(response, 'status_code', 'unknown')
+        span['status'] = status
+        OUTBOUND_REQUESTS.inc(backend=backend, status=status)
+        return response
+
+
+def _submit_with_context(pool, fn, *args, **kwargs):
+    """向线程池提交任务，并携带当前的上下文变量（如 current_task_id）"""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class TaskCancelled(BaseException):
+    """
+    任务已被取消。继承 BaseException，使各处重试循环中的 except Exception 不会吞掉它，
+    异常一路传到 run_translation_task。
+    """
+
+
+class CancellationToken:
+    """
+    任务取消令牌：本进程内由取消接口直接置位，其他 worker 收到的取消请求从任务存储中读取。
+    任务有HTTP调用进行中时由一个监视线程（每个任务一个）等待取消，取消后中止所有进行中的调用。
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.event = threading.Event()
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.calls = set()
+        self.watcher = None
+        self.closed = False
+
+    def cancel(self):
+        self.event.set()
+
+    def close(self):
+        """任务结束：监视线程随之退出"""
+        self.closed = True
+
+    @contextlib.contextmanager
+    def watch(self, call):
+        """在监视期间取消任务时中止 call"""
+        with self.lock:
+            self.calls.add(call)
+            if self.watcher is None and not self.event.is_set():
+                self.watcher = threading.Thread(target=self._watch_loop, name=f"cancel-watch-{self.task_id}", daemon=True)
+                self.watcher.start()
+        try:
+            if self.event.is_set():
+                call.abort()
+            yield
+        finally:
+            with self.lock:
+                self.calls.discard(call)
+
+    def _watch_loop(self):
+        while not self.closed and not self.cancelled():
+            self.event.wait(self.CHECK_INTERVAL / 2)
+        with self.lock:
+            self.watcher = None
+            calls = list(self.calls) if self.event.is_set() else []
+        for call in calls:
+            call.abort()
+
+    def cancelled(self):
+        if self.event.is_set():
+            return True
+        now = time.monotonic()
+        if now - self.checked_at >= self.CHECK_INTERVAL:
+            self.checked_at = now
+            task = task_store.get(self.task_id)
+            if task and task.get('cancel_requested'):
+                self.event.set()
+        return self.event.is_set()
+
+    def check(self):
+        if self.cancelled():
+            raise TaskCancelled(self.task_id)
+
+    def sleep(self, seconds):
+        """可被取消打断的休眠"""
+        deadline = time.monotonic() + seconds
+        while True:
+            self.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self.event.wait(min(remaining, 0.5))
+
+
+_cancel_tokens = {}
+_cancel_tokens_lock = threading.Lock()
+
+
+def register_cancel_token(task_id):
+    with _cancel_tokens_lock:
+        return _cancel_tokens.setdefault(task_id, CancellationToken(task_id))
+
+
+def release_cancel_token(task_id):
+    with _cancel_tokens_lock:
+        token = _cancel_tokens.pop(task_id, None)
+    if token is not None:
+        token.close()
+
+
+def current_cancel_token():
+    """当前后台任务的取消令牌；同步接口中为None"""
+    task_id = current_task_id.get()
+    if task_id is None:
+        return None
+    with _cancel_tokens_lock:
+        return _cancel_tokens.get(task_id)
+
+
+def check_cancelled():
+    token = current_cancel_token()
+    if token is not None:
+        token.check()
+
+
+def cancellable_sleep(seconds, reason='backoff'):
+    token = current_cancel_token()
+    with trace_span('sleep', reason=reason, seconds=round(seconds, 3)):
+        if token is None:
+            time.sleep(seconds)
+        else:
+            token.sleep(seconds)
+
+
+def cancellable_call(fn, *args, **kwargs):
+    """
+    在后台任务中执行可能长时间阻塞的HTTP调用：任务的监视线程在取消后关闭该调用正在使用的套接字，
+    中止已发出的请求（服务器随即看到连接断开，阻塞的读写立即返回），然后抛出 TaskCancelled。
+    """
+    token = current_cancel_token()
+    if token is None:
+        return fn(*args, **kwargs)
+    token.check()
+
+    call = _HTTPCall()
+    _http_call.current = call
+    try:
+        with token.watch(call):
+            result = fn(*args, **kwargs)
+    except Exception:
+        if call.aborted:
+            raise TaskCancelled(token.task_id) from None
+        raise
+    finally:
+        _http_call.current = None
+    if call.aborted:
+        if isinstance(result, requests.Response):
+            result.close()
+        raise TaskCancelled(token.task_id)
+    return result
+
+
+def _prompt_version(prompt):
+    """根据提示词内容生成版本号，提示词修改后缓存自动失效"""
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]
+
+
+def _sqlite_connection(local, path, schema):
+    """返回当前线程的 SQLite 连接（WAL 模式，支持多进程并发读写；fork 后重新连接）"""
+    conn = getattr(local, 'conn', None)
+    if conn is None or getattr(local, 'pid', None) != os.getpid():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in schema:
+            conn.execute(statement)
+        local.conn = conn
+        local.pid = os.getpid()
+    return conn
+
+
+class TranslationMemory:
+    """
+    基于SQLite的持久化翻译记忆（多进程、多线程共享）
+    键为 规范化原文 + 模式 + 模型 + 提示词版本 + 接口地址 的哈希，超过容量上限时按最近最少使用淘汰。
+    条目总大小由触发器维护在 memory_size 表中，写入时无需扫描全表。
+    """
+
+    def __init__(self, path, max_bytes, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.task_stats = {}
+        if self.enabled:
+            try:
+                self._connect()
+            except Exception as e:
+                print(f"⚠️ 翻译记忆初始化失败，已禁用: {e}", flush=True)
+                self.enabled = False
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS memory ("
+        " key TEXT PRIMARY KEY, mode TEXT, value TEXT,"
+        " size INTEGER, created_at REAL, last_used REAL)",
+        "CREATE INDEX IF NOT EXISTS idx_memory_last_used ON memory(last_used)",
+        "CREATE TABLE IF NOT EXISTS memory_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)",
+        # 旧版本创建的数据库首次打开时统计一次现有条目
+        "INSERT OR IGNORE INTO memory_size (id, total)"
+        " SELECT 0, COALESCE(SUM(size), 0) FROM memory WHERE NOT EXISTS (SELECT 1 FROM memory_size)",
+        "CREATE TRIGGER IF NOT EXISTS memory_size_insert AFTER INSERT ON memory"
+        " BEGIN UPDATE memory_size SET total = total + NEW.size WHERE id = 0; END",
+        "CREATE TRIGGER IF NOT EXISTS memory_size_update AFTER UPDATE OF size ON memory"
+        " BEGIN UPDATE memory_size SET total = total + NEW.size - OLD.size WHERE id = 0; END",
+        "CREATE TRIGGER IF NOT EXISTS memory_size_delete AFTER DELETE ON memory"
+        " BEGIN UPDATE memory_size SET total = total - OLD.size WHERE id = 0; END",
+    )
+
+    def _connect(self):
+        return _sqlite_connection(self.local, self.path, self.SCHEMA)
+
+    @staticmethod
+    def normalize(text):
+        """规范化原文：统一换行、去掉首尾及行尾空白"""
+        text = text.replace('\r\n', '\n').replace('\r', '\n').strip()
+        return '\n'.join(line.rstrip() for line in text.split('\n'))
+
+    def make_key(self, text, mode, model='', prompt_version='', endpoint=''):
+        raw = '\x1f'.join([mode, model or '', prompt_version or '', endpoint or '', self.normalize(text)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _record(self, hit):
+        task_id = current_task_id.get()
+        if task_id is None:
+            return
+        with self.stats_lock:
+            stats = self.task_stats.setdefault(task_id, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+
+    def get(self, key):
+        """查询翻译记忆，命中返回译文，未命中返回 None"""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value FROM memory WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE memory SET last_used = ? WHERE key = ?", (time.time(), key))
+        except Exception as e:
+            print(f"⚠️ 读取翻译记忆失败: {e}", flush=True)
+            row = None
+        self._record(row is not None)
+        CACHE_LOOKUPS.inc(cache='translation_memory', result='hit' if row is not None else 'miss')
+        return row[0] if row is not None else None
+
+    def put(self, key, mode, value):
+        """写入翻译记忆，并在超过容量上限时淘汰最久未使用的条目"""
+        if not self.enabled or value is None:
+            return
+        size = len(value.encode('utf-8'))
+        now = time.time()
+        try:
+            conn = self._connect()
+            # 用 UPSERT 而不是 INSERT OR REPLACE：REPLACE 删除旧行时不触发删除触发器，总大小会偏大
+            conn.execute(
+                "INSERT INTO memory (key, mode, value, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET mode = excluded.mode, value = excluded.value,"
+                " size = excluded.size, created_at = excluded.created_at, last_used = excluded.last_used",
+                (key, mode, value, size, now, now)
+            )
+            self._evict(conn)
+        except Exception as e:
+            print(f"⚠️ 写入翻译记忆失败: {e}", flush=True)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT total FROM memory_size WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 一次淘汰到容量的90%，避免每次写入都触发淘汰
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM memory ORDER BY last_used ASC"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM memory WHERE key = ?", stale_keys)
+        print(f"🧹 翻译记忆淘汰 {len(stale_keys)} 条（释放 {freed // 1024} KB）", flush=True)
+
+    def pop_task_stats(self, task_id):
+        """取出并清除某个任务的命中统计"""
+        with self.stats_lock:
+            return self.task_stats.pop(task_id, {'hits': 0, 'misses': 0})
+
+
+translation_memory = TranslationMemory(
+    Config.TRANSLATION_CACHE_PATH,
+    Config.TRANSLATION_CACHE_MAX_BYTES,
+    enabled=Config.TRANSLATION_CACHE_ENABLED
+)
+
+
+def _mineru_payload(options=None):
+    """合并默认参数与用户选项，得到实际发送给MinerU的参数"""
+    payload = {
         "model": "MinerU2.5",
         "is_ocr": True,
         "include_image_base64": True,
@@ -76,12 +916,113 @@ def parse_pdf_with_mineru(filepath, options=None, api_token=None):
         "layout_model": "doclayout_yolo",
         "output_format": "md"
     }
-
-    payload = base_payload.copy()
     if options:
         for key, value in options.items():
             if value is not None:
                 payload[key] = value
+    return payload
+
+
+class ParseCache:
+    """
+    MinerU解析结果缓存（按内容寻址）
+    键为上传文件字节与实际解析参数的哈希，值为提取出的Markdown，
+    每条一个文件，按修改时间实现过期和LRU淘汰。
+    """
+
+    def __init__(self, directory, max_bytes, ttl, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(filepath, options=None):
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        digest.update(json.dumps(_mineru_payload(options), sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.md")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        markdown = self._load(key)
+        CACHE_LOOKUPS.inc(cache='parse', result='hit' if markdown is not None else 'miss')
+        return markdown
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                markdown = f.read()
+            os.utime(path)  # 记录最近使用时间
+            return markdown
+        except OSError:
+            return None
+
+    def put(self, key, markdown):
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(markdown)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except OSError as e:
+            print(f"⚠️ 无法写入解析缓存: {e}")
+
+    def _evict(self):
+        """删除过期条目，超过容量时从最久未使用的开始淘汰到上限的90%"""
+        with self.lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.md'):
+                    continue
+                stat = entry.stat()
+                if now - stat.st_mtime > self.ttl:
+                    os.remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * 0.9:
+                    break
+                os.remove(path)
+                total -= size
+
+
+parse_cache = ParseCache(
+    Config.PARSE_CACHE_DIR,
+    Config.PARSE_CACHE_MAX_BYTES,
+    Config.PARSE_CACHE_TTL,
+    enabled=Config.PARSE_CACHE_ENABLED
+)
+
+
+@timed_stage('parse')
+def parse_pdf_with_mineru(filepath, options=None, api_token=None):
+    """使用MinerU API解析PDF"""
+    from config import Config
+    
+    # 使用传入的token或配置文件中的token
+    token = api_token or Config.MINERU_API_TOKEN
+    api_url = Config.MINERU_API_URL
+    
+    payload = _mineru_payload(options)
     
     # 调试：打印 payload
     print("\n" + "=" * 50)
@@ -135,82 +1076,204 @@ def parse_pdf_with_mineru(filepath, options=None, api_token=None):
             "Content-Type": encoder.content_type
         }
         
-        response = requests.post(api_url, headers=headers, data=encoder)
+        response = outbound_request('mineru', 'post', api_url, headers=headers, data=encoder)
         return response.json()
 
 
-def poll_mineru_task(task_id, api_token=None):
-    """轮询MinerU任务状态"""
-    from config import Config
+class MinerUWatch:
+    """一个等待中的MinerU任务"""
 
-    # 使用传入的token或配置文件中的token
-    token = api_token or Config.MINERU_API_TOKEN
-
-    # 动态构建状态查询URL（基于API的base URL）
-    status_url = f"https://ai.gitee.com/v1/task/{task_id}"
+    def __init__(self, task_id, token, size_bytes):
+        self.task_id = task_id
+        self.token = token
+        self.size_mb = max((size_bytes or 0) / (1024 * 1024), 0.1)
+        self.started = time.time()
+        self.interval = Config.MINERU_POLL_MIN_INTERVAL
+        self.next_at = self.started
+        self.last_report = self.started
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.tracer = current_tracer()  # 轮询在后台线程进行，区间记录到发起等待的任务中
+        self.polls = 0
 
-    # 减少总超时时间到10分钟，更适合云环境
-    timeout = 10 * 60  # 10分钟
-    retry_interval = 3  # 3秒检查一次，减少阻塞时间
-    attempts = 0
-    max_attempts = int(timeout / retry_interval)
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
 
-    # 构建headers
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
 
-    print(f"开始轮询任务状态，总超时: {timeout//60}分钟...")
-
-    while attempts < max_attempts:
-        attempts += 1
+class MinerUPoller:
+    """
+    共享的MinerU状态轮询器：一个后台线程跟踪所有未完成的MinerU任务，
+    按各自的自适应间隔查询状态，完成后唤醒等待的流水线线程。
 
-        # 每30次检查（90秒）显示一次进度
-        if attempts % 30 == 1:
-            elapsed = (attempts - 1) * retry_interval
-            print(f"  📊 已等待 {elapsed//60}分{elapsed%60}秒，正在处理PDF...")
+    间隔从 MINERU_POLL_MIN_INTERVAL 开始按1.5倍退避到 MINERU_POLL_MAX_INTERVAL；
+    根据历史任务的每MB耗时估算预计完成时间，预计完成前轮询更稀疏。
+    """
 
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.watches = {}
+        self.heap = []  # [(next_at, task_id)]
+        self.seconds_per_mb = None  # 历史每MB处理耗时（指数滑动平均）
+        self.pid = None
+        self.pool = None
+
+    def _ensure_thread(self):
+        # 与任务队列一样延迟启动，兼容 gunicorn 预加载
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.watches.clear()
+        self.heap.clear()
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mineru-poll")
+        threading.Thread(target=self._loop, name="mineru-poller", daemon=True).start()
+
+    def watch(self, task_id, api_token, size_bytes=None):
+        with self.cond:
+            self._ensure_thread()
+            entry = MinerUWatch(task_id, api_token, size_bytes)
+            self.watches[task_id] = entry
+            heapq.heappush(self.heap, (entry.next_at, task_id))
+            self.cond.notify()
+        return entry
+
+    def forget(self, task_id):
+        """停止跟踪任务（等待方已取消）"""
+        with self.cond:
+            self.watches.pop(task_id, None)
+
+    def _next_interval(self, entry, now):
+        interval = entry.interval
+        entry.interval = min(entry.interval * 1.5, Config.MINERU_POLL_MAX_INTERVAL)
+        if self.seconds_per_mb is not None:
+            remaining = self.seconds_per_mb * entry.size_mb - (now - entry.started)
+            if remaining > 0:
+                interval = max(interval, remaining / 2)
+        return min(interval, Config.MINERU_POLL_MAX_INTERVAL)
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.time():
+                    self.cond.wait(self.heap[0][0] - time.time() if self.heap else None)
+                now = time.time()
+                due = []
+                while self.heap and self.heap[0][0] <= now:
+                    _, task_id = heapq.heappop(self.heap)
+                    if task_id in self.watches:
+                        due.append(self.watches[task_id])
+
+            for entry, finished in zip(due, self.pool.map(self._poll_one, due)):
+                with self.cond:
+                    if finished:
+                        self.watches.pop(entry.task_id, None)
+                    elif entry.task_id in self.watches:
+                        entry.next_at = time.time() + self._next_interval(entry, time.time())
+                        heapq.heappush(self.heap, (entry.next_at, entry.task_id))
+
+    def _poll_one(self, entry):
+        """查询一次状态，任务结束时返回True；意外异常只结束这一个任务，不影响轮询线程"""
+        entry.polls += 1
+        try:
+            if entry.tracer is None:
+                return self._check_status(entry)
+            with entry.tracer.span('mineru_poll', mineru_task_id=entry.task_id, attempt=entry.polls) as span:
+                span['finished'] = self._check_status(entry)
+                return span['finished']
+        except Exception as e:
+            print(f"  ❌ 查询MinerU任务 {entry.task_id} 状态时出错: {e}")
+            entry.finish(error=e)
+            return True
+
+    def _check_status(self, entry):
+        elapsed = int(time.time() - entry.started)
+        if elapsed > Config.MINERU_POLL_TIMEOUT:
+            print(f"  ⏰ MinerU任务 {entry.task_id} 超时 (已等待 {elapsed // 60}分钟)")
+            entry.finish(error=TimeoutError(f"任务处理超时，已等待 {elapsed // 60} 分钟"))
+            return True
+        if time.time() - entry.last_report >= 90:
+            entry.last_report = time.time()
+            print(f"  📊 MinerU任务 {entry.task_id} 已等待 {elapsed // 60}分{elapsed % 60}秒，正在处理PDF...")
+
+        url = Config.MINERU_TASK_URL.format(task_id=entry.task_id)
         try:
-            response = requests.get(status_url, headers=headers, timeout=10)
+            response = outbound_request('mineru', 'get', url, headers={"Authorization": f"Bearer {entry.token}"},
+                                        timeout=10)
             result = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"  ⚠️ 网络请求失败，稍后重试: {e}")
+            return False
+        if not isinstance(result, dict):
+            print(f"  ⚠️ MinerU返回了无法识别的状态，稍后重试: {str(result)[:200]}")
+            return False
+
+        if result.get("error"):
+            print(f"  ❌ API错误: {result['error']}: {result.get('message', '未知错误')}")
+            entry.finish(error=ValueError(f"{result['error']}: {result.get('message', '未知错误')}"))
+            return True
+
+        status = result.get("status", "unknown")
+        if status == "success":
+            duration = time.time() - entry.started
+            rate = duration / entry.size_mb
+            with self.cond:
+                self.seconds_per_mb = rate if self.seconds_per_mb is None else \
+                    0.7 * self.seconds_per_mb + 0.3 * rate
+            print(f"  ✅ MinerU任务 {entry.task_id} 完成，用时 {duration:.0f} 秒")
+            _save_mineru_debug_result(entry.task_id, result)
+            entry.finish(result=result)
+            return True
+        if status in ["failed", "cancelled"]:
+            print(f"  ❌ 任务{status}")
+            entry.finish(error=ValueError(f"任务{status}"))
+            return True
+        return False
+
+
+def _save_mineru_debug_result(task_id, result):
+    """保存完整结果到文件用于调试"""
+    debug_dir = '/tmp/debug_logs'
+    if not os.path.exists(debug_dir):
+        os.makedirs(debug_dir, exist_ok=True)
+    debug_file = os.path.join(debug_dir, f"mineru_result_{task_id}.json")
+    try:
+        with open(debug_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"  📄 调试文件已保存: {debug_file}")
+    except Exception as e:
+        print(f"  ⚠️ 无法保存调试文件: {e}")
 
-            if result.get("error"):
-                print(f"  ❌ API错误: {result['error']}: {result.get('message', '未知错误')}")
-                raise ValueError(f"{result['error']}: {result.get('message', '未知错误')}")
 
-            status = result.get("status", "unknown")
+mineru_poller = MinerUPoller()
 
-            if status == "success":
-                print("  ✅ 任务完成！")
-                # 保存完整结果到文件用于调试
-                debug_dir = '/tmp/debug_logs'
-                if not os.path.exists(debug_dir):
-                    os.makedirs(debug_dir, exist_ok=True)
-                debug_file = os.path.join(debug_dir, f"mineru_result_{task_id}.json")
-                try:
-                    with open(debug_file, 'w', encoding='utf-8') as f:
-                        json.dump(result, f, indent=2, ensure_ascii=False)
-                    print(f"  📄 调试文件已保存: {debug_file}")
-                except Exception as e:
-                    print(f"  ⚠️ 无法保存调试文件: {e}")
-                return result
-            elif status in ["failed", "cancelled"]:
-                print(f"  ❌ 任务{status}")
-                raise ValueError(f"任务{status}")
-            else:
-                # 短暂休眠，避免过度占用资源
-                time.sleep(retry_interval)
-                continue
 
-        except requests.exceptions.RequestException as e:
-            print(f"  ⚠️ 网络请求失败，重试中: {e}")
-            time.sleep(retry_interval)
-            continue
+@timed_stage('poll')
+def poll_mineru_task(task_id, api_token=None, size_bytes=None):
+    """等待MinerU任务完成（由共享轮询器查询状态，当前线程只阻塞等待通知）"""
+    from config import Config
+
+    # 使用传入的token或配置文件中的token
+    token = api_token or Config.MINERU_API_TOKEN
 
-    print(f"  ⏰ 任务超时 (已等待 {timeout//60}分钟)")
-    raise TimeoutError(f"任务处理超时，已等待 {timeout//60} 分钟")
+    print(f"开始等待MinerU任务 {task_id}，总超时: {Config.MINERU_POLL_TIMEOUT // 60}分钟...")
+    watch = mineru_poller.watch(task_id, token, size_bytes)
+    deadline = time.time() + Config.MINERU_POLL_TIMEOUT + 60
+    try:
+        while not watch.done.wait(0.5):
+            check_cancelled()
+            if time.time() > deadline:
+                raise TimeoutError(f"任务处理超时，已等待 {Config.MINERU_POLL_TIMEOUT // 60} 分钟")
+    except TaskCancelled:
+        mineru_poller.forget(task_id)
+        raise
+    if watch.error is not None:
+        raise watch.error
+    return watch.result
 
 
+@timed_stage('translate_ai')
 def translate_with_ai(text, source_lang="EN", target_lang="ZH", api_url=None, api_key=None, model=None, max_retries=None):
     """使用AI API翻译文本并处理数学公式，支持自动重试"""
     from config import Config
@@ -304,6 +1367,16 @@ def translate_with_ai(text, source_lang="EN", target_lang="ZH", api_url=None, ap
 - [ ] 没有英文句子残留
 - [ ] 保持了原文的完整结构"""
 
+    # 查询翻译记忆，命中则跳过API调用
+    cache_key = translation_memory.make_key(
+        text, 'ai', f"{translate_model}:{source_lang}->{target_lang}", _prompt_version(system_prompt),
+        endpoint=translate_api_url
+    )
+    cached = translation_memory.get(cache_key)
+    if cached is not None:
+        print(f"💾 翻译记忆命中（长度: {len(text)} 字符），跳过AI翻译", flush=True)
+        return cached
+
     # 构建请求
     headers = {
         "Authorization": f"Bearer {translate_api_key}",
@@ -327,13 +1400,16 @@ def translate_with_ai(text, source_lang="EN", target_lang="ZH", api_url=None, ap
                 # 重试前等待，使用指数退避策略
                 wait_time = min(2 ** attempt, 10)  # 最多等待10秒
                 print(f"⏳ 等待 {wait_time} 秒后重试（第 {attempt + 1}/{max_retries} 次）...", flush=True)
-                time.sleep(wait_time)
+                OUTBOUND_RETRIES.inc(backend='ai')
+                cancellable_sleep(wait_time)
             
             print(f"正在使用AI翻译（长度: {len(text)} 字符）{'[重试 ' + str(attempt + 1) + ']' if attempt > 0 else ''}...", flush=True)
             if attempt == 0:  # 只在第一次尝试时打印模型信息
                 print(f"使用模型: {translate_model}", flush=True)
             
-            response = requests.post(
+            response = outbound_request(
+                'ai',
+                'post',
                 translate_api_url,
                 headers=headers,
                 json=payload,
@@ -369,7 +1445,13 @@ def translate_with_ai(text, source_lang="EN", target_lang="ZH", api_url=None, ap
                 else:
                     print(f"✓ 翻译完整性检查通过（残留英文单词: {remaining_words}/{original_words}）", flush=True)
                 
-                return translated_text.strip()
+                translated_text = translated_text.strip()
+                CHARACTERS.inc(len(text), backend='ai', direction='input')
+                CHARACTERS.inc(len(translated_text), backend='ai', direction='output')
+                # 只缓存完整的译文，不完整的下次重新翻译
+                if is_complete:
+                    translation_memory.put(cache_key, 'ai', translated_text)
+                return translated_text
             else:
                 print(f"⚠️ AI翻译响应格式异常: {result}", flush=True)
                 # 响应格式异常时也重试
@@ -406,6 +1488,7 @@ def translate_with_ai(text, source_lang="EN", target_lang="ZH", api_url=None, ap
     return text
 
 
+@timed_stage('translate_deeplx')
 def translate_with_deeplx(text, source_lang="EN", target_lang="ZH", max_retries=None):
     """使用DeepLX API快速翻译文本（支持重试）"""
     from config import Config
@@ -416,6 +1499,12 @@ def translate_with_deeplx(text, source_lang="EN", target_lang="ZH", max_retries=
     
     max_retries = max_retries or Config.DEEPLX_MAX_RETRIES
     
+    # 查询翻译记忆，命中则跳过API调用（也不占用限流配额）
+    cache_key = translation_memory.make_key(text, 'deeplx', f"{source_lang}->{target_lang}")
+    cached = translation_memory.get(cache_key)
+    if cached is not None:
+        return cached
+    
     payload = {
         "text": text,
         "source_lang": source_lang,
@@ -427,14 +1516,21 @@ def translate_with_deeplx(text, source_lang="EN", target_lang="ZH", max_retries=
             if attempt > 0:
                 wait_time = min(2 ** attempt, 5)
                 print(f"⏳ DeepLX重试等待 {wait_time} 秒（第 {attempt + 1}/{max_retries} 次）...", flush=True)
-                time.sleep(wait_time)
+                OUTBOUND_RETRIES.inc(backend='deeplx')
+                cancellable_sleep(wait_time)
             
-            response = requests.post(Config.DEEPLX_API_URL, json=payload, timeout=Config.DEEPLX_TIMEOUT)
+            # 按共享令牌桶限流，而不是每块固定休眠
+            deeplx_rate_limiter.acquire()
+            response = outbound_request('deeplx', 'post', Config.DEEPLX_API_URL,
+                                        json=payload, timeout=Config.DEEPLX_TIMEOUT)
             response.raise_for_status()
             result = response.json()
             
             if result.get("code") == 200:
                 translated = result.get("data", text)
+                CHARACTERS.inc(len(text), backend='deeplx', direction='input')
+                CHARACTERS.inc(len(translated), backend='deeplx', direction='output')
+                translation_memory.put(cache_key, 'deeplx', translated)
                 return translated
             else:
                 print(f"⚠️ DeepLX翻译失败: {result}", flush=True)
@@ -456,10 +1552,172 @@ def translate_with_deeplx(text, source_lang="EN", target_lang="ZH", max_retries=
     return text
 
 
-def translate_markdown_content_with_ai(markdown_text, api_url=None, api_key=None, model=None):
+def _split_markdown_chunks(markdown_text, max_chunk_size):
+    """按段落将Markdown切分为不超过 max_chunk_size 的块，超大段落按句子二次分割"""
+    paragraphs = markdown_text.split('\n\n')
+    chunks = []
+    current_chunk = ""
+    
+    for para in paragraphs:
+        # 如果单个段落就超过限制，需要进一步分割
+        if len(para) > max_chunk_size:
+            # 先收尾当前累积的块
+            if current_chunk:
+                chunks.append(current_chunk)
+                current_chunk = ""
+            
+            # 对超大段落按句子分割
+            print(f"⚠️ 发现超大段落（{len(para)} 字符），进行二次分割...", flush=True)
+            sentences = para.split('. ')
+            temp_chunk = ""
+            
+            for sentence in sentences:
+                if len(temp_chunk) + len(sentence) + 2 <= max_chunk_size:
+                    temp_chunk += sentence + '. ' if not sentence.endswith('.') else sentence + ' '
+                else:
+                    if temp_chunk:
+                        chunks.append(temp_chunk.strip())
+                    temp_chunk = sentence + '. ' if not sentence.endswith('.') else sentence + ' '
+            
+            # 剩余的句子
+            if temp_chunk.strip():
+                chunks.append(temp_chunk.strip())
+            continue
+        
+        # 如果当前块加上这个段落不超过限制，就累积
+        if len(current_chunk) + len(para) + 2 <= max_chunk_size:
+            if current_chunk:
+                current_chunk += "\n\n" + para
+            else:
+                current_chunk = para
+        else:
+            if current_chunk:
+                chunks.append(current_chunk)
+            # 开始新块
+            current_chunk = para
+    
+    # 最后一块
+    if current_chunk:
+        chunks.append(current_chunk)
+    
+    return chunks
+
+
+def _group_paragraphs(text, max_chunk_size):
+    """按段落把文本合并为不超过 max_chunk_size 的块（不拆分单个段落）"""
+    groups = []
+    current = ""
+    for para in text.split('\n\n'):
+        if len(current) + len(para) + 2 <= max_chunk_size:
+            current = current + "\n\n" + para if current else para
+        else:
+            if current:
+                groups.append(current)
+            current = para
+    if current:
+        groups.append(current)
+    return groups or [text]
+
+
+class TranslationProgress:
+    """
+    翻译进度统计：各阶段已完成/总块数、吞吐量（字符/秒）和按当前速率估算的剩余时间。
+    每次变化都把快照传给 callback（可为None）。
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, stage, chunks, chars):
+        """登记阶段的待处理块（混合模式的修正块随DeepLX完成逐步加入）"""
+        with self.lock:
+            state = self.stages.setdefault(stage, {
+                'started': time.time(), 'chunks_done': 0, 'chunks_total': 0, 'chars_done': 0, 'chars_total': 0
+            })
+            state['chunks_total'] += chunks
+            state['chars_total'] += chars
+        self._report()
+
+    def advance(self, stage, chars):
+        with self.lock:
+            state = self.stages[stage]
+            state['chunks_done'] += 1
+            state['chars_done'] += chars
+        self._report()
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            stages = {}
+            for name, state in self.stages.items():
+                rate = state['chars_done'] / max(now - state['started'], 1e-6)
+                remaining = state['chars_total'] - state['chars_done']
+                if remaining <= 0:
+                    eta = 0
+                elif rate > 0:
+                    eta = round(remaining / rate)
+                else:
+                    eta = None
+                stages[name] = {
+                    'chunks_done': state['chunks_done'],
+                    'chunks_total': state['chunks_total'],
+                    'chars_per_sec': round(rate, 1),
+                    'eta_seconds': eta,
+                }
+        etas = [stage['eta_seconds'] for stage in stages.values()]
+        return {
+            'chunks_done': sum(stage['chunks_done'] for stage in stages.values()),
+            'chunks_total': sum(stage['chunks_total'] for stage in stages.values()),
+            # 各阶段流水线并行，整体剩余时间取最慢的阶段
+            'eta_seconds': None if None in etas else max(etas, default=0),
+            'stages': stages,
+        }
+
+    def _report(self):
+        if self.callback is None:
+            return
+        try:
+            self.callback(self.snapshot())
+        except Exception as e:
+            print(f"⚠️ 进度回调出错: {e}", flush=True)
+
+
+def _run_chunks_concurrently(chunks, worker, max_workers, label="块", on_done=None):
+    """
+    使用有界线程池并发处理分块，并按原文顺序返回结果。
+    worker(index, chunk) 返回该块的处理结果；on_done(index, chunk) 在每块完成后调用。
+    """
+    total = len(chunks)
+    if total == 0:
+        return []
+    
+    max_workers = max(1, min(max_workers or 1, total))
+    
+    def run(index):
+        check_cancelled()
+        chunk = chunks[index]
+        print(f"📝 {label} {index + 1}/{total} (长度: {len(chunk)} 字符)...", flush=True)
+        result = worker(index, chunk)
+        if on_done:
+            on_done(index, chunk)
+        return result
+    
+    if max_workers == 1:
+        return [run(i) for i in range(total)]
+    
+    # 按提交顺序收集结果，保证重组后的文档顺序不变
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chunk") as executor:
+        futures = [_submit_with_context(executor, run, i) for i in range(total)]
+        return [future.result() for future in futures]
+
+
+def translate_markdown_content_with_ai(markdown_text, api_url=None, api_key=None, model=None, progress_callback=None):
     """使用AI翻译Markdown内容，智能处理格式和数学公式"""
     # 先清理整个文本的Unicode字符
     markdown_text = clean_unicode_characters(markdown_text, debug=False)
+    progress = TranslationProgress(progress_callback)
     
     # 优化分块大小，减少单次请求的负担
     from config import Config
@@ -468,7 +1726,9 @@ def translate_markdown_content_with_ai(markdown_text, api_url=None, api_key=None
     if len(markdown_text) <= max_chunk_size:
         # 如果内容不长，一次性翻译
         print(f"内容适中（{len(markdown_text)}字符），一次性翻译...", flush=True)
+        progress.add('ai', 1, len(markdown_text))
         translated_text = translate_with_ai(markdown_text, api_url=api_url, api_key=api_key, model=model)
+        progress.advance('ai', len(markdown_text))
         
         # 验证翻译是否完整
         if len(translated_text) < len(markdown_text) * 0.5:
@@ -476,88 +1736,88 @@ def translate_markdown_content_with_ai(markdown_text, api_url=None, api_key=None
         
         return translated_text
     else:
-        # 如果内容较长，按段落分块翻译
+        # 如果内容较长，按段落分块并发翻译
         print(f"内容较长（{len(markdown_text)}字符），分块翻译...", flush=True)
         print(f"📊 使用分块大小: {max_chunk_size} 字符", flush=True)
         
-        # 按双换行符分割段落
-        paragraphs = markdown_text.split('\n\n')
-        translated_paragraphs = []
+        chunks = _split_markdown_chunks(markdown_text, max_chunk_size)
+        concurrency = Config.AI_TRANSLATE_CONCURRENCY
+        print(f"📊 共 {len(chunks)} 块，并发数: {concurrency}", flush=True)
         
-        current_chunk = ""
-        chunk_count = 0
-        total_chunks_estimate = len(markdown_text) // max_chunk_size + 1
-        
-        for i, para in enumerate(paragraphs):
-            # 如果单个段落就超过限制，需要进一步分割
-            if len(para) > max_chunk_size:
-                # 先翻译当前累积的块
-                if current_chunk:
-                    chunk_count += 1
-                    print(f"📝 翻译块 {chunk_count}/{total_chunks_estimate} (长度: {len(current_chunk)} 字符)...", flush=True)
-                    translated_chunk = translate_with_ai(current_chunk, api_url=api_url, api_key=api_key, model=model)
-                    translated_paragraphs.append(translated_chunk)
-                    current_chunk = ""
-                    time.sleep(0.5)  # 减少延迟
-                
-                # 对超大段落按句子分割
-                print(f"⚠️ 发现超大段落（{len(para)} 字符），进行二次分割...", flush=True)
-                sentences = para.split('. ')
-                temp_chunk = ""
-                
-                for sentence in sentences:
-                    if len(temp_chunk) + len(sentence) + 2 <= max_chunk_size:
-                        temp_chunk += sentence + '. ' if not sentence.endswith('.') else sentence + ' '
-                    else:
-                        if temp_chunk:
-                            chunk_count += 1
-                            print(f"📝 翻译块 {chunk_count}/{total_chunks_estimate} (长度: {len(temp_chunk)} 字符)...", flush=True)
-                            translated_chunk = translate_with_ai(temp_chunk.strip(), api_url=api_url, api_key=api_key, model=model)
-                            translated_paragraphs.append(translated_chunk)
-                            time.sleep(0.5)
-                        temp_chunk = sentence + '. ' if not sentence.endswith('.') else sentence + ' '
-                
-                # 翻译剩余的句子
-                if temp_chunk.strip():
-                    chunk_count += 1
-                    print(f"📝 翻译块 {chunk_count}/{total_chunks_estimate} (长度: {len(temp_chunk)} 字符)...", flush=True)
-                    translated_chunk = translate_with_ai(temp_chunk.strip(), api_url=api_url, api_key=api_key, model=model)
-                    translated_paragraphs.append(translated_chunk)
-                    time.sleep(0.5)
-                
-                continue
-            
-            # 如果当前块加上这个段落不超过限制，就累积
-            if len(current_chunk) + len(para) + 2 <= max_chunk_size:
-                if current_chunk:
-                    current_chunk += "\n\n" + para
-                else:
-                    current_chunk = para
-            else:
-                # 翻译当前块
-                if current_chunk:
-                    chunk_count += 1
-                    print(f"📝 翻译块 {chunk_count}/{total_chunks_estimate} (长度: {len(current_chunk)} 字符)...", flush=True)
-                    translated_chunk = translate_with_ai(current_chunk, api_url=api_url, api_key=api_key, model=model)
-                    translated_paragraphs.append(translated_chunk)
-                    time.sleep(0.5)  # 减少延迟
-                
-                # 开始新块
-                current_chunk = para
-        
-        # 翻译最后一块
-        if current_chunk:
-            chunk_count += 1
-            print(f"📝 翻译块 {chunk_count}/{total_chunks_estimate} (长度: {len(current_chunk)} 字符)...", flush=True)
-            translated_chunk = translate_with_ai(current_chunk, api_url=api_url, api_key=api_key, model=model)
-            translated_paragraphs.append(translated_chunk)
+        progress.add('ai', len(chunks), sum(len(chunk) for chunk in chunks))
+        translated_paragraphs = _run_chunks_concurrently(
+            chunks,
+            lambda index, chunk: _checkpointed(
+                'ai', chunk, lambda: translate_with_ai(chunk, api_url=api_url, api_key=api_key, model=model)),
+            max_workers=concurrency,
+            label="翻译块",
+            on_done=lambda index, chunk: progress.advance('ai', len(chunk))
+        )
         
         # 合并所有翻译结果
         result = "\n\n".join(translated_paragraphs)
-        print(f"✅ 完成分块翻译，共 {chunk_count} 块", flush=True)
+        print(f"✅ 完成分块翻译，共 {len(chunks)} 块", flush=True)
         return result
 
 
+# 行间公式 $$...$$ 与行内公式 $...$；行内公式的 $ 内侧不能是空白、结尾 $ 后不能紧跟数字，
+# 避免把 "$5 and $10" 这样的金额当作公式
+_MATH_SEGMENT_RE = re.compile(r'\$\$([^\$]+)\$\$|\$(?!\s)([^\$\n]*?[^\s\$])\$(?!\d)')
+_MATH_PLACEHOLDER_RE = re.compile(r'<<<\s*MATH_PLACEHOLDER_(\d+)\s*>>>', re.IGNORECASE)
+_IMAGE_MARKDOWN_RE = re.compile(r'!\[[^\]]*\]\([^\)]+\)')
+
+
+def _needs_formula_fix(text):
+    """
+    文本是否需要AI修正公式：有规则转换无法完整表达的公式、公式外残留的LaTeX命令或HTML上下标时需要。
+    图片数据和金额中的 $ 不计
+    """
+    text = _IMAGE_MARKDOWN_RE.sub('', text)
+    for match in _MATH_SEGMENT_RE.finditer(text):
+        if not latex_fully_convertible(match.group(1) or match.group(2)):
+            return True
+    return bool(re.search(r'\\|<su[bp]>', _MATH_SEGMENT_RE.sub('', text)))
+
+
+def protect_math(text):
+    """
+    把 $$...$$ 和 $...$ 公式替换为 <<<MATH_PLACEHOLDER_N>>> 占位符
+    返回 (替换后的文本, 公式原文列表)；公式在生成PDF时才转换为Unicode
+    """
+    formulas = []
+
+    def save_formula(match):
+        formulas.append(match.group(0))
+        return f"<<<MATH_PLACEHOLDER_{len(formulas) - 1}>>>"
+
+    return _MATH_SEGMENT_RE.sub(save_formula, text), formulas
+
+
+def restore_math(text, formulas):
+    """把占位符恢复为公式原文；有占位符丢失或重复时返回None"""
+    found = sorted(int(index) for index in _MATH_PLACEHOLDER_RE.findall(text))
+    if found != list(range(len(formulas))):
+        return None
+    return _MATH_PLACEHOLDER_RE.sub(lambda match: formulas[int(match.group(1))], text)
+
+
+def _translate_protecting_math(text):
+    """
+    DeepLX翻译前用占位符保护公式，译后恢复原文。返回 [译文, 是否回退]：占位符未完整保留时直接翻译原文，
+    此时公式可能已被DeepLX改坏，调用方应整块交给AI修正
+    """
+    protected, formulas = protect_math(text)
+    if not formulas:
+        return [translate_with_deeplx(text), False]
+
+    restored = restore_math(translate_with_deeplx(protected), formulas)
+    if restored is None:
+        print(f"⚠️ DeepLX未完整保留 {len(formulas)} 个公式占位符，改为直接翻译原文", flush=True)
+        return [translate_with_deeplx(text), True]
+    return [restored, False]
+
+
+@timed_stage('fix')
 def fix_formulas_with_ai(text, api_url=None, api_key=None, model=None):
     """使用AI API专门修正翻译后文本中的数学公式"""
     from config import Config
@@ -580,8 +1840,7 @@ def fix_formulas_with_ai(text, api_url=None, api_key=None, model=None):
     text_without_images = re.sub(image_pattern, save_image, text)
     
     # 检查是否有实际的公式需要修正（如果没有，直接返回）
-    has_formulas = bool(re.search(r'[\$\\]', text_without_images))
-    if not has_formulas and not re.search(r'<su[bp]>', text_without_images):
+    if not _needs_formula_fix(text_without_images):
         print(f"✓ 未检测到需要修正的公式，跳过AI修正", flush=True)
         return text  # 直接返回原文，保留图片
     
@@ -619,6 +1878,22 @@ def fix_formulas_with_ai(text, api_url=None, api_key=None, model=None):
 **输出要求**：
 只返回修正后的文本，保持所有内容、段落、格式完全一致。"""
 
+    def restore_images(fixed):
+        # 恢复图片占位符为原始图片
+        for i, img in enumerate(images):
+            placeholder = f"<<<IMAGE_PLACEHOLDER_{i}>>>"
+            fixed = fixed.replace(placeholder, img)
+        return fixed
+
+    # 查询翻译记忆（以去除图片后的文本为键，图片按本次调用恢复）
+    cache_key = translation_memory.make_key(
+        text_without_images, 'fix', translate_model, _prompt_version(system_prompt), endpoint=translate_api_url
+    )
+    cached = translation_memory.get(cache_key)
+    if cached is not None:
+        print(f"💾 翻译记忆命中（长度: {len(text_without_images)} 字符），跳过公式修正", flush=True)
+        return restore_images(cached)
+
     headers = {
         "Authorization": f"Bearer {translate_api_key}",
         "Content-Type": "application/json"
@@ -639,11 +1914,14 @@ def fix_formulas_with_ai(text, api_url=None, api_key=None, model=None):
             if attempt > 0:
                 wait_time = min(2 ** attempt, 10)
                 print(f"⏳ 公式修正重试等待 {wait_time} 秒（第 {attempt + 1}/{max_retries} 次）...", flush=True)
-                time.sleep(wait_time)
+                OUTBOUND_RETRIES.inc(backend='ai')
+                cancellable_sleep(wait_time)
             
             print(f"🔧 正在修正数学公式（长度: {len(text_without_images)} 字符）{'[重试 ' + str(attempt + 1) + ']' if attempt > 0 else ''}...", flush=True)
             
-            response = requests.post(
+            response = outbound_request(
+                'ai',
+                'post',
                 translate_api_url,
                 headers=headers,
                 json=payload,
@@ -666,20 +1944,25 @@ def fix_formulas_with_ai(text, api_url=None, api_key=None, model=None):
                 original_len = len(text_without_images)
                 output_len = len(fixed_text)
                 
+                accepted = True
                 # 如果输出长度差异超过50%，可能是AI生成了无关内容
                 if abs(output_len - original_len) > original_len * 0.5:
                     print(f"⚠️ 警告：AI输出长度异常（原文:{original_len}, 输出:{output_len}），使用原文", flush=True)
                     fixed_text = text_without_images
+                    accepted = False
                 
                 # 检查AI是否返回了提问或解释
                 if any(phrase in fixed_text[:200] for phrase in ['I need', 'I can see', 'Could you', 'Please provide', '我需要', '请提供']):
                     print(f"⚠️ 警告：AI返回了提问而非修正结果，使用原文", flush=True)
                     fixed_text = text_without_images
+                    accepted = False
+                
+                CHARACTERS.inc(len(text_without_images), backend='ai_fix', direction='input')
+                CHARACTERS.inc(len(fixed_text), backend='ai_fix', direction='output')
+                if accepted:
+                    translation_memory.put(cache_key, 'fix', fixed_text.strip())
                 
-                # 恢复图片占位符为原始图片
-                for i, img in enumerate(images):
-                    placeholder = f"<<<IMAGE_PLACEHOLDER_{i}>>>"
-                    fixed_text = fixed_text.replace(placeholder, img)
+                fixed_text = restore_images(fixed_text)
                 
                 print(f"✓ 公式修正完成（输出长度: {len(fixed_text)} 字符）", flush=True)
                 print(f"✓ 已恢复 {len(images)} 张图片", flush=True)
@@ -701,12 +1984,14 @@ def fix_formulas_with_ai(text, api_url=None, api_key=None, model=None):
     return text
 
 
-def translate_markdown_hybrid(markdown_text, api_url=None, api_key=None, model=None):
+def translate_markdown_hybrid(markdown_text, api_url=None, api_key=None, model=None, progress_callback=None):
     """
     混合翻译模式（三步走策略）：
     1. 使用MinerU提取内容（已完成）
-    2. 使用DeepLX快速翻译
-    3. 使用AI修正数学公式
+    2. 使用DeepLX快速翻译（公式先替换为占位符，不经过DeepLX）
+    3. 使用AI修正仍有问题的数学公式
+    
+    第2、3步以生产者/消费者流水线运行：DeepLX块完成后立即进入公式修正队列。
     """
     from config import Config
     import time
@@ -721,26 +2006,26 @@ def translate_markdown_hybrid(markdown_text, api_url=None, api_key=None, model=N
     print(f"✓ 文本清理完成（长度: {len(markdown_text)} 字符）")
     
     # 第二步：使用DeepLX快速翻译
-    print("\n⚡ 步骤 2/3: DeepLX快速翻译...")
+    print("\n⚡ 步骤 2/3: 切分DeepLX翻译块...")
     
     # 按段落分块翻译（DeepLX对长文本支持较好，可以用较大的块）
     max_chunk_size = 5000  # DeepLX可以处理更大的块
     paragraphs = markdown_text.split('\n\n')
-    translated_paragraphs = []
     
+    # 先切分出有序的片段列表：图片原样保留，文本按块累积
+    segments = []  # [(is_text, content)]
     current_chunk = ""
-    chunk_count = 0
-    total_paragraphs = len(paragraphs)
     image_count = 0
     
-    start_time = time.time()
-    
-    for i, para in enumerate(paragraphs):
+    for para in paragraphs:
         # 跳过图片标记（完整保留，不翻译）
         if para.strip().startswith('![') or para.strip().startswith('<img'):
-            translated_paragraphs.append(para)
+            # 先收尾当前文本块，保证图片在文档中的位置不变
+            if current_chunk:
+                segments.append((True, current_chunk))
+                current_chunk = ""
+            segments.append((False, para))
             image_count += 1
-            print(f"  🖼️ 保留图片 {image_count}", flush=True)
             continue
         
         # 累积段落到当前块
@@ -750,116 +2035,176 @@ def translate_markdown_hybrid(markdown_text, api_url=None, api_key=None, model=N
             else:
                 current_chunk = para
         else:
-            # 翻译当前块
             if current_chunk:
-                chunk_count += 1
-                print(f"  📝 翻译块 {chunk_count} (长度: {len(current_chunk)} 字符, 进度: {i}/{total_paragraphs} 段落)...", flush=True)
-                translated_chunk = translate_with_deeplx(current_chunk)
-                translated_paragraphs.append(translated_chunk)
-                time.sleep(Config.DEEPLX_RATE_LIMIT)
-            
+                segments.append((True, current_chunk))
             # 开始新块
             current_chunk = para
     
-    # 翻译最后一块
     if current_chunk:
-        chunk_count += 1
-        print(f"  📝 翻译块 {chunk_count} (长度: {len(current_chunk)} 字符)...", flush=True)
-        translated_chunk = translate_with_deeplx(current_chunk)
-        translated_paragraphs.append(translated_chunk)
+        segments.append((True, current_chunk))
     
-    deeplx_result = "\n\n".join(translated_paragraphs)
-    deeplx_time = time.time() - start_time
+    text_chunks = [content for is_text, content in segments if is_text]
+    chunk_count = len(text_chunks)
+    print(f"  共 {chunk_count} 个文本块，保留 {image_count} 张图片，并发数: {Config.DEEPLX_CONCURRENCY}"
+          f"（限流 {Config.DEEPLX_RATE_PER_SECOND}/秒，突发 {Config.DEEPLX_BURST}）", flush=True)
     
-    print(f"✓ DeepLX翻译完成！共 {chunk_count} 块，耗时 {deeplx_time:.1f} 秒")
-    print(f"  原文长度: {len(markdown_text)} 字符")
-    print(f"  译文长度: {len(deeplx_result)} 字符")
-    print(f"  保留图片: {image_count} 张")
+    start_time = time.time()
+    progress = TranslationProgress(progress_callback)
+    progress.add('deeplx', chunk_count, sum(len(chunk) for chunk in text_chunks))
     
-    # 第三步：使用AI修正数学公式
-    print("\n🔧 步骤 3/3: AI修正数学公式...")
+    # 第三步：使用AI修正数学公式，与DeepLX组成流水线：
+    # 每个DeepLX块一完成就立即进入AI修正队列，两个网络阶段重叠执行
+    print("\n🔧 步骤 3/3: AI修正数学公式（与DeepLX流水线并行）...")
     
     # 分块修正（避免超长文本）
     max_fix_chunk_size = 4000
     
-    if len(deeplx_result) <= max_fix_chunk_size:
-        print(f"  文本适中，一次性修正...")
-        final_result = fix_formulas_with_ai(deeplx_result, api_url=api_url, api_key=api_key, model=model)
-    else:
-        print(f"  文本较长，分块修正...")
-        fix_paragraphs = deeplx_result.split('\n\n')
-        fixed_results = []
-        
-        current_fix_chunk = ""
-        fix_chunk_count = 0
+    deeplx_results = [None] * chunk_count
+    fix_futures = [None] * chunk_count
+    deeplx_time = 0.0
+    fix_chunk_count = 0
+    
+    with ThreadPoolExecutor(max_workers=max(1, Config.DEEPLX_CONCURRENCY), thread_name_prefix="deeplx") as deeplx_pool, \
+         ThreadPoolExecutor(max_workers=max(1, Config.AI_TRANSLATE_CONCURRENCY), thread_name_prefix="formula-fix") as fix_pool:
+        # 生产者：多个DeepLX请求同时进行，由共享令牌桶控制总速率
+        deeplx_futures = {}
+        for index, chunk in enumerate(text_chunks):
+            deeplx_futures[_submit_with_context(
+                deeplx_pool, lambda chunk=chunk: json.loads(_checkpointed(
+                    'deeplx_math', chunk, lambda: json.dumps(_translate_protecting_math(chunk), ensure_ascii=False)))
+            )] = index
         
-        for para in fix_paragraphs:
-            if len(current_fix_chunk) + len(para) + 2 <= max_fix_chunk_size:
-                if current_fix_chunk:
-                    current_fix_chunk += "\n\n" + para
-                else:
-                    current_fix_chunk = para
-            else:
-                if current_fix_chunk:
-                    fix_chunk_count += 1
-                    print(f"  🔧 修正块 {fix_chunk_count} (长度: {len(current_fix_chunk)} 字符)...", flush=True)
-                    fixed_chunk = fix_formulas_with_ai(current_fix_chunk, api_url=api_url, api_key=api_key, model=model)
-                    fixed_results.append(fixed_chunk)
-                    time.sleep(0.5)
-                
-                current_fix_chunk = para
+        # 消费者：按完成顺序把译文送入修正队列
+        for done, future in enumerate(as_completed(deeplx_futures), 1):
+            index = deeplx_futures[future]
+            translated_chunk, fell_back = future.result()
+            deeplx_results[index] = translated_chunk
+            print(f"  📝 DeepLX块 {index + 1} 完成 ({done}/{chunk_count})，送入公式修正...", flush=True)
+            progress.advance('deeplx', len(text_chunks[index]))
+            
+            # 规则转换能完整处理的公式留给生成PDF时转换，只有含复杂公式、残留LaTeX或HTML上下标的片段才需要AI修正；
+            # 公式未经保护直接翻译的块无法判断是否被改坏，全部修正
+            pieces = _group_paragraphs(translated_chunk, max_fix_chunk_size)
+            needs_fix = [fell_back or _needs_formula_fix(piece) for piece in pieces]
+            fix_pieces = [piece for piece, needed in zip(pieces, needs_fix) if needed]
+            fix_chunk_count += len(fix_pieces)
+            if fix_pieces:
+                progress.add('fix', len(fix_pieces), sum(len(piece) for piece in fix_pieces))
+            fix_futures[index] = []
+            for piece, needed in zip(pieces, needs_fix):
+                if not needed:
+                    unchanged = Future()
+                    unchanged.set_result(piece)
+                    fix_futures[index].append(unchanged)
+                    continue
+                fix_future = _submit_with_context(fix_pool, _checkpointed, 'fix', piece, functools.partial(
+                    fix_formulas_with_ai, piece, api_url=api_url, api_key=api_key, model=model))
+                fix_future.add_done_callback(lambda f, size=len(piece): progress.advance('fix', size))
+                fix_futures[index].append(fix_future)
         
-        # 修正最后一块
-        if current_fix_chunk:
-            fix_chunk_count += 1
-            print(f"  🔧 修正块 {fix_chunk_count} (长度: {len(current_fix_chunk)} 字符)...", flush=True)
-            fixed_chunk = fix_formulas_with_ai(current_fix_chunk, api_url=api_url, api_key=api_key, model=model)
-            fixed_results.append(fixed_chunk)
+        deeplx_time = time.time() - start_time
+        print(f"✓ DeepLX翻译完成！共 {chunk_count} 块，耗时 {deeplx_time:.1f} 秒")
+        print(f"  原文长度: {len(markdown_text)} 字符")
+        print(f"  译文长度: {sum(len(t) for t in deeplx_results)} 字符（不含图片）")
+        print(f"  保留图片: {image_count} 张")
         
-        final_result = "\n\n".join(fixed_results)
-        print(f"✓ 公式修正完成！共修正 {fix_chunk_count} 块")
+        # 按原文顺序收集修正结果
+        fixed_chunks = ["\n\n".join(f.result() for f in futures) for futures in fix_futures]
     
-    total_time = time.time() - start_time
+    print(f"✓ 公式修正完成！共修正 {fix_chunk_count} 块（其余块无需修正）")
+    
+    fixed_iter = iter(fixed_chunks)
+    final_result = "\n\n".join(next(fixed_iter) if is_text else content for is_text, content in segments)
+    
+    total_time = max(time.time() - start_time, 1e-6)
     
     print("\n" + "=" * 60)
     print(f"🎉 混合翻译完成！总耗时: {total_time:.1f} 秒")
     print(f"   DeepLX翻译: {deeplx_time:.1f} 秒 ({deeplx_time/total_time*100:.1f}%)")
-    print(f"   AI公式修正: {total_time - deeplx_time:.1f} 秒 ({(total_time - deeplx_time)/total_time*100:.1f}%)")
+    print(f"   DeepLX完成后的AI公式修正: {total_time - deeplx_time:.1f} 秒 ({(total_time - deeplx_time)/total_time*100:.1f}%)")
     print("=" * 60 + "\n")
     
     return final_result
 
 
-def translate_markdown_content(markdown_text):
-    """翻译Markdown内容，保留格式（纯DeepLX模式）"""
+_LINE_MARKER_RE = re.compile(r'<<<\s*LINE_(\d+)\s*>>>', re.IGNORECASE)
+
+
+def _translate_line_batch(lines):
+    """
+    批量翻译多行文本：每行前加编号标记 <<<LINE_N>>> 后合并为一个请求，译后按编号拆回。
+    标记丢失、重复或顺序错乱（DeepLX合并或拆分了行）时二分为更小的批次重试
+    """
+    if len(lines) == 1:
+        return [translate_with_deeplx(lines[0])]
+
+    translated = translate_with_deeplx('\n'.join(f"<<<LINE_{i}>>> {line}" for i, line in enumerate(lines)))
+    # 拆分结果为 [第一个标记前的文本, 编号0, 译文0, 编号1, 译文1, ...]
+    parts = _LINE_MARKER_RE.split(translated)
+    if not parts[0].strip() and [int(index) for index in parts[1::2]] == list(range(len(lines))):
+        return [segment.strip() for segment in parts[2::2]]
+
+    print(f"⚠️ 批量翻译的行标记不完整（{len(lines)} 行），拆分为更小的批次重试", flush=True)
+    mid = len(lines) // 2
+    return _translate_line_batch(lines[:mid]) + _translate_line_batch(lines[mid:])
+
+
+def translate_markdown_content(markdown_text, progress_callback=None):
+    """翻译Markdown内容，保留格式（纯DeepLX模式，多行合并为一个请求）"""
+    from config import Config
+    
     # 先清理整个文本的Unicode字符
     markdown_text = clean_unicode_characters(markdown_text, debug=False)
     
     lines = markdown_text.split('\n')
-    translated_lines = []
+    translated_lines = list(lines)
     
-    for line in lines:
-        # 跳过空行
-        if not line.strip():
-            translated_lines.append(line)
+    # 收集需要翻译的行；空行、代码块标记、图片标记保留原样
+    pending = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
             continue
-        
-        # 跳过代码块标记
-        if line.strip().startswith('```'):
-            translated_lines.append(line)
+        if stripped.startswith('```'):
             continue
-        
-        # 跳过图片标记（保留原样）
-        if line.strip().startswith('![') or line.strip().startswith('<img'):
-            translated_lines.append(line)
+        if stripped.startswith('![') or stripped.startswith('<img'):
             continue
-        
-        # 翻译其他内容
-        translated_line = translate_with_deeplx(line)
-        # 翻译后的内容也清理一下
-        translated_line = clean_unicode_characters(translated_line, debug=False)
-        translated_lines.append(translated_line)
-        time.sleep(0.5)  # 避免API限流
+        pending.append(index)
+    
+    # 按字符数和行数上限把待翻译的行合并为批次
+    batches = []
+    current, current_size = [], 0
+    for index in pending:
+        size = len(lines[index]) + 1
+        if current and (current_size + size > Config.DEEPLX_BATCH_MAX_CHARS
+                        or len(current) >= Config.DEEPLX_BATCH_MAX_LINES):
+            batches.append(current)
+            current, current_size = [], 0
+        current.append(index)
+        current_size += size
+    if current:
+        batches.append(current)
+    
+    print(f"📊 DeepLX批量翻译：{len(pending)} 行合并为 {len(batches)} 个请求", flush=True)
+    
+    batch_texts = ['\n'.join(lines[i] for i in batch) for batch in batches]
+    progress = TranslationProgress(progress_callback)
+    progress.add('deeplx', len(batch_texts), sum(len(text) for text in batch_texts))
+    results = _run_chunks_concurrently(
+        batch_texts,
+        # 检查点按JSON列表保存：单行译文内可能含有换行，不能按换行拼接再拆分
+        lambda index, chunk: json.loads(_checkpointed(
+            'line_batch', chunk,
+            lambda: json.dumps(_translate_line_batch(chunk.split('\n')), ensure_ascii=False))),
+        max_workers=Config.DEEPLX_CONCURRENCY,
+        label="DeepLX批次",
+        on_done=lambda index, chunk: progress.advance('deeplx', len(chunk))
+    )
+    
+    for batch, translated_batch in zip(batches, results):
+        for index, translated_line in zip(batch, translated_batch):
+            # 翻译后的内容也清理一下
+            translated_lines[index] = clean_unicode_characters(translated_line, debug=False)
     
     return '\n'.join(translated_lines)
 
@@ -929,53 +2274,61 @@ def clean_html_tags(text):
     return text
 
 
-def clean_unicode_characters(text, debug=False):
-    """清理文本中无法显示的Unicode字符"""
-    from config import Config
-    import unicodedata
+def _build_unicode_clean_table():
+    """
+    预先构建 clean_unicode_characters 使用的字符表（导入时只构建一次）：
+    - 替换表：Config.UNICODE_REPLACEMENTS 以及需要删除的控制字符/私有区字符
+    - 正则：匹配所有需要处理的字符，整篇文本只扫描一遍
+    """
+    # 需要删除的字符：REPLACEMENT CHARACTER、控制字符（保留tab、LF、CR）、私有使用区
+    removal_ranges = (
+        '\ufffd'
+        '\x00-\x08\x0b\x0c\x0e-\x1f'
+        '\ue000-\uf8ff'              # 私有使用区
+        '\U000f0000-\U000ffffd'      # 补充私有使用区-A
+        '\U00100000-\U0010fffd'      # 补充私有使用区-B
+    )
+    replace_chars = ''.join(re.escape(ch) for ch in Config.UNICODE_REPLACEMENTS)
     
-    original_text = text
+    class _Table(dict):
+        # 不在替换规则中的匹配字符都属于删除区间
+        def __missing__(self, key):
+            return None
     
-    # 第一步：应用配置中的字符替换规则
-    for old_char, new_char in Config.UNICODE_REPLACEMENTS.items():
-        text = text.replace(old_char, new_char)
+    table = _Table({ord(old): new for old, new in Config.UNICODE_REPLACEMENTS.items()})
+    clean_re = re.compile(f'[{replace_chars}{removal_ranges}]+')
+    # 仅用于调试输出：被删除（而不是被替换）的字符
+    removed_re = re.compile(f'[{removal_ranges}]')
+    replaced_re = re.compile(f'[{replace_chars}]')
+    return table, clean_re, removed_re, replaced_re
+
+
+_UNICODE_CLEAN_TABLE, _UNICODE_CLEAN_RE, _UNICODE_REMOVED_RE, _UNICODE_REPLACED_RE = _build_unicode_clean_table()
+
+
+def _translate_unicode_run(match):
+    return match.group().translate(_UNICODE_CLEAN_TABLE)
+
+
+def clean_unicode_characters(text, debug=False):
+    """清理文本中无法显示的Unicode字符（替换与删除在一次扫描中完成）"""
+    import unicodedata
     
-    # 第二步：查找并处理剩余的问题字符
-    cleaned_text = []
-    removed_chars = set()
+    result = _UNICODE_CLEAN_RE.sub(_translate_unicode_run, text)
     
-    for char in text:
-        code_point = ord(char)
-        
-        # REPLACEMENT CHARACTER (U+FFFD) 是显示方框的主要原因
-        if code_point == 0xFFFD:
-            removed_chars.add((char, code_point, 'REPLACEMENT CHARACTER'))
-            continue
-        
-        # 私有使用区字符通常无法显示
-        if (0xE000 <= code_point <= 0xF8FF or  # 私有使用区
-            0xF0000 <= code_point <= 0xFFFFD or  # 补充私有使用区-A
-            0x100000 <= code_point <= 0x10FFFD):  # 补充私有使用区-B
-            try:
+    # 打印调试信息
+    if debug:
+        removed_chars = set()
+        for char in set(_UNICODE_REMOVED_RE.findall(text)):
+            if char in Config.UNICODE_REPLACEMENTS:
+                continue  # 已被替换规则处理
+            code_point = ord(char)
+            if 0x00 <= code_point <= 0x1F:
+                char_name = 'CONTROL_CHARACTER'
+            else:
                 char_name = unicodedata.name(char, f'PRIVATE_USE_U+{code_point:04X}')
-            except:
-                char_name = f'PRIVATE_USE_U+{code_point:04X}'
             removed_chars.add((char, code_point, char_name))
-            continue
-        
-        # 控制字符（除了常见的换行、制表符等）
-        if (0x00 <= code_point <= 0x1F and 
-            code_point not in [0x09, 0x0A, 0x0D]):  # 保留tab, LF, CR
-            removed_chars.add((char, code_point, 'CONTROL_CHARACTER'))
-            continue
         
-        # 保留其他字符
-        cleaned_text.append(char)
-    
-    result = ''.join(cleaned_text)
-    
-    # 打印调试信息
-    if debug:
         if removed_chars:
             print(f"⚠️ 清理文本时移除了 {len(removed_chars)} 种问题字符:", flush=True)
             for char, code, name in list(removed_chars)[:20]:  # 最多显示20个
@@ -984,151 +2337,237 @@ def clean_unicode_characters(text, debug=False):
             print("✓ 没有发现需要移除的问题字符", flush=True)
         
         # 统计被替换的字符
-        replaced_count = 0
-        for old_char in Config.UNICODE_REPLACEMENTS.keys():
-            if old_char in original_text:
-                replaced_count += original_text.count(old_char)
+        replaced_count = len(_UNICODE_REPLACED_RE.findall(text))
         if replaced_count > 0:
             print(f"✓ 替换了 {replaced_count} 个特殊Unicode字符", flush=True)
     
     # 如果文本有变化，打印简要信息
-    elif result != original_text:
+    elif result != text:
         print(f"✓ 清理了文本中的特殊字符", flush=True)
     
     return result
 
 
-def convert_latex_to_unicode(text):
-    """将常见的 LaTeX 数学符号转换为 Unicode"""
-    original_text = text  # 保存原始文本用于调试
-    
-    # 上标数字映射
-    superscripts = {
-        '0': '⁰', '1': '¹', '2': '²', '3': '³', '4': '⁴',
-        '5': '⁵', '6': '⁶', '7': '⁷', '8': '⁸', '9': '⁹',
-        '+': '⁺', '-': '⁻', '=': '⁼', '(': '⁽', ')': '⁾'
-    }
-    
-    # 下标数字映射
-    subscripts = {
-        '0': '₀', '1': '₁', '2': '₂', '3': '₃', '4': '₄',
-        '5': '₅', '6': '₆', '7': '₇', '8': '₈', '9': '₉',
-        '+': '₊', '-': '₋', '=': '₌', '(': '₍', ')': '₎'
-    }
-    
-    # 希腊字母映射
-    greek_letters = {
-        r'\alpha': 'α', r'\beta': 'β', r'\gamma': 'γ', r'\delta': 'δ',
-        r'\Delta': 'Δ', r'\epsilon': 'ε', r'\zeta': 'ζ', r'\eta': 'η',
-        r'\theta': 'θ', r'\Theta': 'Θ', r'\lambda': 'λ', r'\Lambda': 'Λ',
-        r'\mu': 'μ', r'\nu': 'ν', r'\xi': 'ξ', r'\pi': 'π', r'\Pi': 'Π',
-        r'\rho': 'ρ', r'\sigma': 'σ', r'\Sigma': 'Σ', r'\tau': 'τ',
-        r'\phi': 'φ', r'\Phi': 'Φ', r'\chi': 'χ', r'\psi': 'ψ', r'\Psi': 'Ψ',
-        r'\omega': 'ω', r'\Omega': 'Ω'
-    }
-    
+# LaTeX → Unicode 查找表（导入时构建一次）
+_LATEX_SUPERSCRIPTS = {
+    '0': '⁰', '1': '¹', '2': '²', '3': '³', '4': '⁴',
+    '5': '⁵', '6': '⁶', '7': '⁷', '8': '⁸', '9': '⁹',
+    '+': '⁺', '-': '⁻', '=': '⁼', '(': '⁽', ')': '⁾'
+}
+
+_LATEX_SUBSCRIPTS = {
+    '0': '₀', '1': '₁', '2': '₂', '3': '₃', '4': '₄',
+    '5': '₅', '6': '₆', '7': '₇', '8': '₈', '9': '₉',
+    '+': '₊', '-': '₋', '=': '₌', '(': '₍', ')': '₎'
+}
+
+# 不带花括号的简单上/下标（如 ^2、_-）只转换这些字符，其余保留 ^x / _x 原样
+_LATEX_SIMPLE_SCRIPT_CHARS = frozenset('0123456789+-')
+
+_LATEX_COMMANDS = {
+    # 希腊字母
+    'alpha': 'α', 'beta': 'β', 'gamma': 'γ', 'Gamma': 'Γ', 'delta': 'δ',
+    'Delta': 'Δ', 'epsilon': 'ε', 'varepsilon': 'ε', 'zeta': 'ζ', 'eta': 'η',
+    'theta': 'θ', 'vartheta': 'ϑ', 'Theta': 'Θ', 'iota': 'ι', 'kappa': 'κ',
+    'lambda': 'λ', 'Lambda': 'Λ', 'mu': 'μ', 'nu': 'ν', 'xi': 'ξ', 'Xi': 'Ξ',
+    'pi': 'π', 'Pi': 'Π', 'rho': 'ρ', 'sigma': 'σ', 'Sigma': 'Σ', 'tau': 'τ',
+    'upsilon': 'υ', 'Upsilon': 'Υ', 'phi': 'φ', 'varphi': 'φ', 'Phi': 'Φ',
+    'chi': 'χ', 'psi': 'ψ', 'Psi': 'Ψ', 'omega': 'ω', 'Omega': 'Ω',
     # 其他常用符号
-    symbols = {
-        r'\sim': '∼', r'\approx': '≈', r'\pm': '±', r'\times': '×',
-        r'\div': '÷', r'\leq': '≤', r'\geq': '≥', r'\neq': '≠',
-        r'\infty': '∞', r'\sum': '∑', r'\prod': '∏', r'\int': '∫',
-        r'\partial': '∂', r'\nabla': '∇', r'\cdot': '·'
-    }
-    
-    # 首先处理希腊字母和符号
-    for latex, unicode_char in greek_letters.items():
-        text = text.replace(latex, unicode_char)
-    for latex, unicode_char in symbols.items():
-        text = text.replace(latex, unicode_char)
-    
-    # 处理上标 ^{...}
-    def replace_superscript(match):
-        content = match.group(1)
-        result = ''
-        for char in content:
-            result += superscripts.get(char, char)
-        return result
-    
-    text = re.sub(r'\^{([^}]+)}', replace_superscript, text)
-    
-    # 处理简单上标 ^x
-    def replace_simple_superscript(match):
-        char = match.group(1)
-        return superscripts.get(char, '^' + char)
-    
-    text = re.sub(r'\^([0-9+-])', replace_simple_superscript, text)
-    
-    # 处理下标 _{...}
-    def replace_subscript(match):
-        content = match.group(1)
-        result = ''
-        for char in content:
-            result += subscripts.get(char, char)
-        return result
-    
-    text = re.sub(r'_{([^}]+)}', replace_subscript, text)
-    
-    # 处理简单下标 _x
-    def replace_simple_subscript(match):
-        char = match.group(1)
-        return subscripts.get(char, '_' + char)
-    
-    text = re.sub(r'_([0-9+-])', replace_simple_subscript, text)
-    
-    # 处理 \mathrm{...}
-    text = re.sub(r'\\mathrm{([^}]+)}', r'\1', text)
-    
-    # 移除剩余的反斜杠命令
-    text = re.sub(r'\\[a-zA-Z]+', '', text)
-    
-    # 移除多余的花括号
-    text = text.replace('{', '').replace('}', '')
-    
+    'sim': '∼', 'approx': '≈', 'pm': '±', 'mp': '∓', 'times': '×',
+    'div': '÷', 'leq': '≤', 'le': '≤', 'geq': '≥', 'ge': '≥', 'neq': '≠',
+    'ne': '≠', 'equiv': '≡', 'll': '≪', 'gg': '≫', 'propto': '∝',
+    'infty': '∞', 'sum': '∑', 'prod': '∏', 'int': '∫', 'sqrt': '√',
+    'partial': '∂', 'nabla': '∇', 'cdot': '·', 'circ': '∘', 'degree': '°',
+    'to': '→', 'rightarrow': '→', 'leftarrow': '←', 'leftrightarrow': '↔',
+    'ldots': '...', 'cdots': '...', 'prime': "'",
+}
+
+# 只起排版作用、内容需要原样保留的命令（其参数视为普通内容）
+_LATEX_TEXT_COMMANDS = frozenset({
+    'mathrm', 'mathbf', 'mathit', 'mathsf', 'mathtt', 'mathcal', 'boldsymbol',
+    'text', 'textrm', 'textbf', 'textit', 'operatorname', 'mbox',
+})
+
+# 只影响排版、直接丢弃不会改变含义的命令（其他未知命令丢弃后会丢失内容，如 \frac、\begin）
+_LATEX_IGNORED_COMMANDS = frozenset({
+    'left', 'right', 'big', 'Big', 'bigl', 'bigr', 'Bigl', 'Bigr', 'displaystyle', 'textstyle', 'limits',
+})
+
+# 转义字符：\, \; 等间距命令转为空格，\% \$ 等输出字符本身
+_LATEX_ESCAPES = {',': ' ', ';': ' ', ':': ' ', ' ': ' ', '!': ''}
+
+# 行内公式 $...$ 与行间公式 $$...$$
+_INLINE_MATH_RE = re.compile(r'\$([^\$]+)\$')
+_DISPLAY_MATH_RE = re.compile(r'\$\$([^\$]+)\$\$')
+
+_LATEX_TOKEN_RE = re.compile(r'\\([a-zA-Z]+)|\\(.?)|([\^_{}])|([^\\^_{}]+)', re.DOTALL)
+
+
+def _latex_tokenize(text):
+    tokens = []
+    for command, escape, special, plain in _LATEX_TOKEN_RE.findall(text):
+        if command:
+            tokens.append(('cmd', command))
+        elif special:
+            tokens.append((special, special))
+        elif plain:
+            tokens.append(('text', plain))
+        else:
+            tokens.append(('esc', escape))
+    return tokens
+
+
+def _latex_render_command(name, tokens, pos, lossy):
+    """渲染一个命令，返回 (输出, 新位置)；未知命令直接丢弃，其后的参数作为普通内容保留"""
+    if name in _LATEX_TEXT_COMMANDS:
+        return _latex_parse_argument(tokens, pos, lossy)[:2]
+    if name == 'sqrt' and pos < len(tokens) and tokens[pos][0] == '{':
+        # √ 后的多字符参数失去了根号的作用范围
+        content, pos, _ = _latex_parse_argument(tokens, pos, lossy)
+        if len(content) > 1:
+            lossy.append('sqrt')
+        return '√' + content, pos
+    if name not in _LATEX_COMMANDS and name not in _LATEX_IGNORED_COMMANDS:
+        lossy.append(name)
+    return _LATEX_COMMANDS.get(name, ''), pos
+
+
+def _latex_parse_argument(tokens, pos, lossy):
+    """解析上/下标或命令的参数，返回 (内容, 新位置, 是否为花括号分组)"""
+    if pos >= len(tokens):
+        return '', pos, False
+    kind, value = tokens[pos]
+    if kind == '{':
+        content, pos = _latex_parse(tokens, pos + 1, lossy, in_group=True)
+        return content, pos, True
+    if kind == 'text':
+        # 只取第一个字符作为参数，剩余文本留给后续解析
+        if len(value) > 1:
+            tokens[pos] = ('text', value[1:])
+            return value[0], pos, False
+        return value, pos + 1, False
+    if kind == 'cmd':
+        content, pos = _latex_render_command(value, tokens, pos + 1, lossy)
+        return content, pos, False
+    if kind == 'esc':
+        return _latex_escape(value, lossy), pos + 1, False
+    return '', pos, False
+
+
+def _latex_escape(value, lossy):
+    if value in ('\\', ''):
+        # 换行 \\（矩阵、多行公式）或孤立的反斜杠
+        lossy.append('\\' + value)
+    return _LATEX_ESCAPES.get(value, value)
+
+
+def _latex_parse(tokens, pos, lossy, in_group=False):
+    """单次扫描解析token序列，返回 (输出, 新位置)；无法用Unicode完整表达的结构记入 lossy"""
+    out = []
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        pos += 1
+        if kind == 'text':
+            out.append(value)
+        elif kind == 'cmd':
+            content, pos = _latex_render_command(value, tokens, pos, lossy)
+            out.append(content)
+        elif kind == 'esc':
+            out.append(_latex_escape(value, lossy))
+        elif kind == '{':
+            content, pos = _latex_parse(tokens, pos, lossy, in_group=True)
+            out.append(content)
+        elif kind == '}':
+            if in_group:
+                break
+            # 多余的右花括号直接丢弃
+        else:
+            # 上标 ^ 或下标 _
+            script_map = _LATEX_SUPERSCRIPTS if kind == '^' else _LATEX_SUBSCRIPTS
+            content, pos, is_group = _latex_parse_argument(tokens, pos, lossy)
+            if is_group:
+                # 没有对应上/下标字符的内容（字母、嵌套上下标等）只能原样输出
+                if any(ch not in script_map and ch not in ', ' for ch in content):
+                    lossy.append(kind + content)
+                out.append(''.join(script_map.get(ch, ch) for ch in content))
+            elif content and content in _LATEX_SIMPLE_SCRIPT_CHARS:
+                out.append(script_map[content])
+            else:
+                lossy.append(kind + content)
+                out.append(kind + content)
+    return ''.join(out), pos
+
+
+def _latex_convert(text):
+    """转换公式，返回 (Unicode文本, 是否完整转换)"""
+    lossy = []
+    result, _ = _latex_parse(_latex_tokenize(text), 0, lossy)
     # 清理可能残留的问题Unicode字符
-    text = clean_unicode_characters(text, debug=False)
-    
-    # 如果转换有变化，打印调试信息
-    if text != original_text:
-        print(f"✓ 公式转换: '{original_text}' → '{text}'")
-    
-    return text
+    return clean_unicode_characters(result, debug=False), not lossy
 
 
-def markdown_to_pdf(markdown_text, output_path):
-    """将Markdown转换为PDF"""
-    import sys
-    from reportlab.lib.pagesizes import A4
+@functools.lru_cache(maxsize=8192)
+def convert_latex_to_unicode(text):
+    """将常见的 LaTeX 数学符号转换为 Unicode（纯函数，按公式字符串缓存）"""
+    return _latex_convert(text)[0]
+
+
+@functools.lru_cache(maxsize=8192)
+def latex_fully_convertible(text):
+    """公式能否由 convert_latex_to_unicode 完整表达；分式、矩阵、字母上下标和未知命令等会丢失结构"""
+    return _latex_convert(text)[1]
+
+
+# 进程级字体注册表：字体发现、TTF解析和样式构建每个进程只做一次
+_pdf_font_registry = None
+_pdf_font_registry_lock = threading.Lock()
+
+
+def _in_symbol_ranges(cp):
+    """主字体没有 cmap 时使用的经验区段：上/下标、希腊字母、数学与技术符号"""
+    return (cp in (0x00B2, 0x00B3, 0x00B9)
+            or 0x2070 <= cp <= 0x209F
+            or 0x0370 <= cp <= 0x03FF
+            or 0x2100 <= cp <= 0x214F
+            or 0x2190 <= cp <= 0x21FF
+            or 0x2200 <= cp <= 0x22FF
+            or 0x25A0 <= cp <= 0x25FF)
+
+
+def _compile_char_runs_re(code_points):
+    """把码点集合压缩为区间，编译成匹配连续字符段的正则；集合为空时返回 None"""
+    if not code_points:
+        return None
+    ranges = []
+    start = prev = None
+    for cp in sorted(code_points):
+        if prev is not None and cp == prev + 1:
+            prev = cp
+            continue
+        if start is not None:
+            ranges.append((start, prev))
+        start = prev = cp
+    ranges.append((start, prev))
+    parts = []
+    for lo, hi in ranges:
+        parts.append(re.escape(chr(lo)) if lo == hi else f'{re.escape(chr(lo))}-{re.escape(chr(hi))}')
+    return re.compile('[' + ''.join(parts) + ']+')
+
+
+def _load_pdf_fonts():
+    """查找并注册PDF字体，构建段落样式"""
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Image
     from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_JUSTIFY
-    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-    
-    # 在开始处理前，先进行一次完整的字符清理（启用调试）
-    print("\n" + "="*50, flush=True)
-    print("开始清理Markdown文本中的问题字符...", flush=True)
-    print(f"原始文本长度: {len(markdown_text)}", flush=True)
-    print("="*50, flush=True)
-    sys.stdout.flush()
-    
-    markdown_text = clean_unicode_characters(markdown_text, debug=True)
-    
-    print(f"清理后文本长度: {len(markdown_text)}", flush=True)
-    print("="*50 + "\n", flush=True)
-    sys.stdout.flush()
-    
-    # 创建PDF文档
-    doc = SimpleDocTemplate(output_path, pagesize=A4,
-                           rightMargin=72, leftMargin=72,
-                           topMargin=72, bottomMargin=18)
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_JUSTIFY
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
     
-    story = []
     styles = getSampleStyleSheet()
     
     # 注册字体 - 优先使用支持完整 Unicode 的字体
     font_registered = False
+    primary_font_path = None
 
     # 允许通过环境/配置或项目内 fonts 目录挂载字体，以便在精简容器（如 Zeabur）中避免乱码
     local_font_dir = os.path.join(os.path.dirname(__file__), 'fonts')
@@ -1181,6 +2620,7 @@ def markdown_to_pdf(markdown_text, output_path):
             if os.path.exists(font_path):
                 pdfmetrics.registerFont(TTFont('UnicodeFont', font_path))
                 font_registered = True
+                primary_font_path = font_path
                 print(f"✓ 成功注册字体: {font_path}")
                 font_name = 'UnicodeFont'
                 break
@@ -1224,6 +2664,9 @@ def markdown_to_pdf(markdown_text, output_path):
 
     for fp in fallback_candidates:
         try:
+            # 与主字体是同一个文件时没有意义，换下一个候选以补充主字体缺少的字形
+            if primary_font_path and os.path.exists(fp) and os.path.samefile(fp, primary_font_path):
+                continue
             if os.path.exists(fp):
                 pdfmetrics.registerFont(TTFont('UnicodeFallback', fp))
                 fallback_font_name = 'UnicodeFallback'
@@ -1233,50 +2676,21 @@ def markdown_to_pdf(markdown_text, output_path):
             print(f"⚠️ 无法注册备用字体 {fp}: {e}")
             continue
 
-    # 包装一个工具：对文本中上/下标字符用备用字体渲染，避免缺字形
-    import html as _html
-    def _escape_html(s: str) -> str:
-        return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    # 根据字体 cmap 建立字形覆盖索引：只有主字体缺少、备用字体具备的字符才切换字体
+    fallback_re = None
+    if fallback_font_name:
+        fallback_cps = set(pdfmetrics.getFont(fallback_font_name).face.charToGlyph)
+        primary_cps = getattr(getattr(pdfmetrics.getFont(font_name), 'face', None), 'charToGlyph', None)
+        if primary_cps is not None:
+            needed = fallback_cps.difference(primary_cps)
+        else:
+            # CID/内置字体没有可读的 cmap，退回按常见符号区段判断
+            needed = {cp for cp in fallback_cps if _in_symbol_ranges(cp)}
+        # ASCII 始终使用主字体（也避免拆开 &amp; 等转义实体）
+        needed = {cp for cp in needed if cp >= 0x80}
+        fallback_re = _compile_char_runs_re(needed)
+        print(f"✓ 字形覆盖索引: 备用字体补充 {len(needed)} 个字符")
 
-    def _apply_supsub_fallback(s: str) -> str:
-        t = _escape_html(s)
-        if not fallback_font_name:
-            return t
-        def need_fallback(cp: int) -> bool:
-            # 上/下标
-            if cp in (0x00B2, 0x00B3, 0x00B9) or 0x2070 <= cp <= 0x209F or 0x2080 <= cp <= 0x208E:
-                return True
-            # 希腊字母
-            if 0x0370 <= cp <= 0x03FF:
-                return True
-            # 数学和技术符号常见区段
-            if 0x2100 <= cp <= 0x214F:
-                return True
-            if 0x2190 <= cp <= 0x21FF:
-                return True
-            if 0x2200 <= cp <= 0x22FF:
-                return True
-            if 0x25A0 <= cp <= 0x25FF:
-                return True
-            return False
-        out = []
-        open_tag = False
-        for ch in t:
-            cp = ord(ch)
-            if need_fallback(cp):
-                if not open_tag:
-                    out.append(f'<font face="{fallback_font_name}">')
-                    open_tag = True
-                out.append(ch)
-            else:
-                if open_tag:
-                    out.append('</font>')
-                    open_tag = False
-                out.append(ch)
-        if open_tag:
-            out.append('</font>')
-        return ''.join(out)
-    
     # 创建中文样式
     chinese_style = ParagraphStyle(
         'Chinese',
@@ -1315,6 +2729,90 @@ def markdown_to_pdf(markdown_text, output_path):
         spaceBefore=10,
     )
     
+    return {
+        'font_name': font_name,
+        'fallback_font_name': fallback_font_name,
+        'fallback_re': fallback_re,
+        'normal': chinese_style,
+        'title': chinese_title,
+        'heading1': chinese_heading1,
+        'heading2': chinese_heading2,
+    }
+
+
+def get_pdf_font_registry():
+    """返回本进程的字体注册表（首次调用时加载，线程安全）"""
+    global _pdf_font_registry
+    if _pdf_font_registry is None:
+        with _pdf_font_registry_lock:
+            if _pdf_font_registry is None:
+                start = time.time()
+                _pdf_font_registry = _load_pdf_fonts()
+                print(f"✓ 字体注册表加载完成，耗时 {time.time() - start:.2f} 秒（进程 {os.getpid()}）", flush=True)
+    return _pdf_font_registry
+
+
+def warm_up_pdf_fonts():
+    """预热字体注册表：在 gunicorn master 中调用时，fork 出的 worker 以写时复制方式共享已解析的字体"""
+    try:
+        get_pdf_font_registry()
+    except Exception as e:
+        print(f"⚠️ 字体预热失败，将在首次生成PDF时重试: {e}", flush=True)
+
+
+@timed_stage('render')
+def markdown_to_pdf(markdown_text, output_path):
+    """将Markdown转换为PDF"""
+    import sys
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Image
+    
+    # 在开始处理前，先进行一次完整的字符清理（启用调试）
+    print("\n" + "="*50, flush=True)
+    print("开始清理Markdown文本中的问题字符...", flush=True)
+    print(f"原始文本长度: {len(markdown_text)}", flush=True)
+    print("="*50, flush=True)
+    sys.stdout.flush()
+    
+    markdown_text = clean_unicode_characters(markdown_text, debug=True)
+    
+    print(f"清理后文本长度: {len(markdown_text)}", flush=True)
+    print("="*50 + "\n", flush=True)
+    sys.stdout.flush()
+    
+    # 创建PDF文档
+    doc = SimpleDocTemplate(output_path, pagesize=A4,
+                           rightMargin=72, leftMargin=72,
+                           topMargin=72, bottomMargin=18)
+    
+    story = []
+    
+    # 字体与样式每个进程只加载一次
+    with trace_span('load_fonts'):
+        fonts = get_pdf_font_registry()
+    font_name = fonts['font_name']
+    fallback_font_name = fonts['fallback_font_name']
+    chinese_style = fonts['normal']
+    chinese_title = fonts['title']
+    chinese_heading1 = fonts['heading1']
+    chinese_heading2 = fonts['heading2']
+    
+    # 包装一个工具：对文本中上/下标字符用备用字体渲染，避免缺字形
+    import html as _html
+    def _escape_html(s: str) -> str:
+        return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+    # 按字形覆盖索引把主字体缺字的连续字符段切换到备用字体
+    fallback_re = fonts['fallback_re']
+    fallback_repl = f'<font face="{fallback_font_name}">\\g<0></font>'
+
+    def _apply_supsub_fallback(s: str) -> str:
+        t = _escape_html(s)
+        if fallback_re is None:
+            return t
+        return fallback_re.sub(fallback_repl, t)
+    
     # 处理Markdown文本
     lines = markdown_text.split('\n')
     
@@ -1338,8 +2836,8 @@ def markdown_to_pdf(markdown_text, output_path):
                 latex = match.group(1)
                 return convert_latex_to_unicode(latex)
             
-            text = re.sub(r'\$([^\$]+)\$', replace_math, text)
-            text = re.sub(r'\$\$([^\$]+)\$\$', replace_math, text)
+            text = _INLINE_MATH_RE.sub(replace_math, text)
+            text = _DISPLAY_MATH_RE.sub(replace_math, text)
             
             # HTML转义 + 对上/下标字符应用备用字体
             text = _apply_supsub_fallback(text)
@@ -1427,10 +2925,10 @@ def markdown_to_pdf(markdown_text, output_path):
                 return convert_latex_to_unicode(latex)
             
             # 先处理行内公式 $...$
-            text = re.sub(r'\$([^\$]+)\$', replace_math, text)
+            text = _INLINE_MATH_RE.sub(replace_math, text)
             
             # 处理行间公式 $$...$$（通常单独一行）
-            text = re.sub(r'\$\$([^\$]+)\$\$', replace_math, text)
+            text = _DISPLAY_MATH_RE.sub(replace_math, text)
             
             # HTML转义 + 对上/下标字符应用备用字体（在公式转换之后）
             text = _apply_supsub_fallback(text)
@@ -1451,7 +2949,8 @@ def markdown_to_pdf(markdown_text, output_path):
     
     # 生成PDF
     try:
-        doc.build(story)
+        with trace_span('doc.build', flowables=len(story)):
+            doc.build(story)
         print(f"✓ PDF生成成功: {output_path}")
     except Exception as e:
         print(f"❌ PDF生成失败: {e}")
@@ -1491,100 +2990,841 @@ def test():
 
 # ============== 异步任务 API ==============
 
+# 任务存储
+# 结构: {task_id: {status, progress, message, result_path, error, created_at, updated_at}}
+
+def _job_reusable(record):
+    """任务是否可被相同的新提交复用：排队中、进行中，或已完成且结果文件仍在"""
+    if not record:
+        return False
+    if record.get('status') in ('pending', 'processing'):
+        return True
+    result_path = record.get('result_path')
+    return record.get('status') == 'completed' and bool(result_path) and os.path.exists(result_path)
+
+
+class MemoryTaskStore:
+    """进程内任务存储（仅适用于单个 worker）"""
+
+    def __init__(self):
+        self.tasks = {}
+        self.jobs = {}  # {作业键: 执行该作业的任务ID}
+        self.lock = threading.Lock()
+
+    def create(self, task_id, record):
+        with self.lock:
+            self.tasks[task_id] = dict(record)
+
+    def update(self, task_id, **fields):
+        with self.lock:
+            if task_id in self.tasks:
+                self.tasks[task_id].update(fields)
+
+    def get(self, task_id):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def delete(self, task_id):
+        with self.lock:
+            self.tasks.pop(task_id, None)
+            for job_key in [key for key, owner in self.jobs.items() if owner == task_id]:
+                del self.jobs[job_key]
+
+    def list_by_status(self, *statuses):
+        with self.lock:
+            return [(task_id, dict(task)) for task_id, task in self.tasks.items() if task.get('status') in statuses]
+
+    def claim_owner(self, task_id, expected_owner, new_owner):
+        """仅当任务仍属于 expected_owner 时改为 new_owner，返回是否成功"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None or task.get('owner') != expected_owner:
+                return False
+            task['owner'] = new_owner
+            return True
+
+    def claim_job(self, job_key, task_id):
+        """登记作业键；已有可复用的相同作业时返回其任务ID，否则由 task_id 执行并返回None"""
+        with self.lock:
+            owner = self.jobs.get(job_key)
+            if owner and owner != task_id and _job_reusable(self.tasks.get(owner)):
+                return owner
+            self.jobs[job_key] = task_id
+            return None
+
+
+class SQLiteTaskStore:
+    """基于 SQLite（WAL）的任务存储，同一主机上的多个 gunicorn worker 共享，进程重启后任务不丢失"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS tasks ("
+        " task_id TEXT PRIMARY KEY, status TEXT, data TEXT,"
+        " created_at TEXT, updated_at TEXT)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)",
+        "CREATE TABLE IF NOT EXISTS jobs (job_key TEXT PRIMARY KEY, task_id TEXT)",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self._connect()
+
+    def _connect(self):
+        return _sqlite_connection(self.local, self.path, self.SCHEMA)
+
+    def create(self, task_id, record):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO tasks (task_id, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (task_id, record.get('status'), json.dumps(record, ensure_ascii=False),
+             record.get('created_at'), record.get('updated_at'))
+        )
+
+    def update(self, task_id, **fields):
+        conn = self._connect()
+        # 读-改-写放在同一个写事务中，避免多进程同时更新时互相覆盖
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is not None:
+                record = json.loads(row[0])
+                record.update(fields)
+                conn.execute(
+                    "UPDATE tasks SET status = ?, data = ?, updated_at = ? WHERE task_id = ?",
+                    (record.get('status'), json.dumps(record, ensure_ascii=False),
+                     record.get('updated_at'), task_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, task_id):
+        row = self._connect().execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def delete(self, task_id):
+        conn = self._connect()
+        conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+
+    def list_by_status(self, *statuses):
+        placeholders = ', '.join('?' * len(statuses))
+        rows = self._connect().execute(
+            f"SELECT task_id, data FROM tasks WHERE status IN ({placeholders})", statuses
+        ).fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    def claim_owner(self, task_id, expected_owner, new_owner):
+        """仅当任务仍属于 expected_owner 时改为 new_owner，返回是否成功"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            record = json.loads(row[0]) if row is not None else None
+            if record is None or record.get('owner') != expected_owner:
+                conn.execute("COMMIT")
+                return False
+            record['owner'] = new_owner
+            conn.execute("UPDATE tasks SET data = ? WHERE task_id = ?",
+                         (json.dumps(record, ensure_ascii=False), task_id))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim_job(self, job_key, task_id):
+        """登记作业键；已有可复用的相同作业时返回其任务ID，否则由 task_id 执行并返回None"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT j.task_id, t.data FROM jobs j LEFT JOIN tasks t ON t.task_id = j.task_id"
+                " WHERE j.job_key = ?", (job_key,)
+            ).fetchone()
+            if row is not None and row[0] != task_id and row[1] is not None \
+                    and _job_reusable(json.loads(row[1])):
+                conn.execute("COMMIT")
+                return row[0]
+            conn.execute("INSERT OR REPLACE INTO jobs (job_key, task_id) VALUES (?, ?)", (job_key, task_id))
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def create_task_store(kind=None):
+    """按配置创建任务存储：sqlite（默认，多 worker 共享）或 memory"""
+    kind = (kind or Config.TASK_STORE).lower()
+    if kind == 'memory':
+        return MemoryTaskStore()
+    if kind == 'sqlite':
+        return SQLiteTaskStore(Config.TASK_STORE_PATH)
+    raise ValueError(f"未知的任务存储类型: {kind}")
+
+
+task_store = create_task_store()
+
+
+class TaskEvents:
+    """进程内的任务状态变更通知：按任务登记等待中的 SSE 连接，只唤醒关注该任务的连接"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = {}  # {任务ID: {threading.Event}}
+
+    @contextlib.contextmanager
+    def listen(self, *task_ids):
+        """登记一个连接，返回其唤醒事件；退出时注销"""
+        event = threading.Event()
+        with self.lock:
+            for task_id in task_ids:
+                self.listeners.setdefault(task_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            with self.lock:
+                for task_id in task_ids:
+                    listeners = self.listeners.get(task_id)
+                    if listeners is not None:
+                        listeners.discard(event)
+                        if not listeners:
+                            del self.listeners[task_id]
+
+    def notify(self, task_id):
+        with self.lock:
+            for event in self.listeners.get(task_id, ()):
+                event.set()
+
+
+task_events = TaskEvents()
+
+
+class StreamSlots:
+    """限制本进程同时保持的推送连接数（上限在获取时读取配置）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.active >= Config.TASK_EVENTS_MAX_STREAMS:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active = max(self.active - 1, 0)
+
+
+task_event_streams = StreamSlots()
+
+
 def update_task(task_id, **kwargs):
     """更新任务状态"""
-    with tasks_lock:
-        if task_id in translation_tasks:
-            translation_tasks[task_id].update(kwargs)
-            translation_tasks[task_id]['updated_at'] = datetime.now().isoformat()
+    kwargs['updated_at'] = datetime.now().isoformat()
+    task_store.update(task_id, **kwargs)
+    if kwargs.get('status') in ('completed', 'failed', 'cancelled'):
+        # 复用该作业的任务随之结束（仍关联到本作业以读取结果），之后与本作业一起清理
+        followers = _live_followers(task_id)
+        if followers:
+            job = task_store.get(task_id)
+            for follower_id in followers:
+                _finish_follower(follower_id, job)
+    task_events.notify(task_id)
+
+
+def _live_followers(owner_id):
+    """仍在等待 owner_id 作业结果的复用任务"""
+    return [task_id for task_id, task in task_store.list_by_status('pending', 'processing')
+            if task.get('attached_to') == owner_id]
+
+
+def _finish_follower(follower_id, job):
+    """复用作业的任务随作业结束：复制作业的结束状态、结果和错误；作业记录已不存在时标记为失败"""
+    if job is None:
+        job = {'status': 'failed', 'error': '关联的翻译任务不存在'}
+    task_store.update(follower_id, updated_at=datetime.now().isoformat(),
+                      **{field: job.get(field) for field in ('status', 'error', 'result_path', 'result_filename')})
+
+
+def get_task(task_id):
+    """读取任务状态；复用了相同作业的任务返回被复用作业的进度和结果，已放弃的作业对提交者显示为已取消"""
+    task = task_store.get(task_id)
+    if task and task.get('abandoned'):
+        # 提交者已取消、作业仍为复用任务继续运行
+        return dict(task, status='cancelled', progress=0, message='任务已取消',
+                    result_path=None, result_filename=None)
+    if not task or not task.get('attached_to'):
+        return task
+    job = task_store.get(task['attached_to'])
+    if not job:
+        return dict(task, status='failed', error='关联的翻译任务不存在')
+    return dict(job, attached_to=task['attached_to'], created_at=task['created_at'])
+
+
+def _process_identity(pid=None):
+    """进程标识（pid + 启动时间），避免容器重启后 pid 复用被误判为仍在运行"""
+    pid = pid or os.getpid()
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            start_time = f.read().rsplit(')', 1)[1].split()[19]
+        return f"{pid}:{start_time}"
+    except (OSError, IndexError):
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except OSError:
+        pass
+    return str(pid)
 
 
-def run_translation_task(task_id, upload_path, original_filename, mineru_options,
-                         parse_api_token, translate_api_url, translate_api_key,
-                         translate_api_model, translation_mode):
-    """在后台线程中执行翻译任务"""
-    try:
-        # 1. 使用MinerU解析PDF
-        update_task(task_id, status='processing', progress=10, message='正在解析PDF...')
-        print(f"[任务 {task_id}] 正在解析PDF...")
+def _owner_alive(owner):
+    if not owner:
+        return False
+    return _process_identity(int(owner.split(':')[0])) == owner
 
-        result = parse_pdf_with_mineru(upload_path, mineru_options, api_token=parse_api_token)
-        mineru_task_id = result.get("task_id")
 
-        if not mineru_task_id:
-            update_task(task_id, status='failed', error='MinerU任务创建失败')
+class TaskCheckpoint:
+    """
+    任务检查点：每个任务一个目录，保存作业参数、解析出的Markdown和已完成的翻译/修正块。
+    块按阶段和原文哈希命名，进程重启后重新执行任务时已完成的块直接读取。
+    """
+
+    def __init__(self, task_id):
+        self.directory = os.path.join(Config.CHECKPOINT_DIR, task_id)
+
+    def _write(self, name, content):
+        if not Config.CHECKPOINT_ENABLED:
             return
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            path = os.path.join(self.directory, name)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ 无法写入检查点 {name}: {e}", flush=True)
+
+    def _read(self, name):
+        if not Config.CHECKPOINT_ENABLED:
+            return None
+        try:
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def save_job(self, job):
+        self._write('job.json', json.dumps(job, ensure_ascii=False))
+
+    def load_job(self):
+        content = self._read('job.json')
+        return json.loads(content) if content is not None else None
+
+    def save_markdown(self, markdown):
+        self._write('markdown.md', markdown)
+
+    def load_markdown(self):
+        return self._read('markdown.md')
+
+    @staticmethod
+    def _chunk_name(stage, source):
+        return f"{stage}_{hashlib.sha1(source.encode('utf-8')).hexdigest()}.txt"
+
+    def save_chunk(self, stage, source, result):
+        self._write(self._chunk_name(stage, source), result)
+
+    def load_chunk(self, stage, source):
+        return self._read(self._chunk_name(stage, source))
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _checkpointed(stage, source, compute):
+    """后台任务中的分块结果先查检查点，未完成时计算并保存"""
+    task_id = current_task_id.get()
+    if task_id is None:
+        return compute()
+    check_cancelled()
+    checkpoint = TaskCheckpoint(task_id)
+    with trace_span(f"chunk:{stage}", chars=len(source)) as span:
+        result = checkpoint.load_chunk(stage, source)
+        span['checkpoint_hit'] = result is not None
+        if result is None:
+            result = compute()
+            checkpoint.save_chunk(stage, source, result)
+    return result
 
-        print(f"[任务 {task_id}] MinerU任务ID: {mineru_task_id}")
-        update_task(task_id, progress=20, message='等待MinerU处理...')
 
-        # 2. 等待MinerU处理完成
-        task_result = poll_mineru_task(mineru_task_id, api_token=parse_api_token)
+def resume_interrupted_tasks():
+    """
+    启动时重新排队上次进程退出时未完成的任务（其所属进程已不存在），
+    已保存的解析结果和翻译块会被复用；缺少作业参数或使用了用户自定义密钥（未保存）的任务标记为失败。
+    """
+    resumed = 0
+    for task_id, task in task_store.list_by_status('pending', 'processing'):
+        if task.get('attached_to') or _owner_alive(task.get('owner')):
+            continue
+        if not task_store.claim_owner(task_id, task.get('owner'), _process_identity()):
+            continue  # 已被其他 worker 接管
+        checkpoint = TaskCheckpoint(task_id)
+        job = checkpoint.load_job()
+        if job is None or (checkpoint.load_markdown() is None and not os.path.exists(job['upload_path'])):
+            update_task(task_id, status='failed', error='服务重启，任务已中断，请重新提交')
+            checkpoint.remove()
+            continue
+        # 旧版本保存的作业参数可能含有密钥，一并按自定义密钥处理
+        secrets = [job.pop(key, None) for key in ('parse_api_token', 'translate_api_key')]
+        if job.pop('user_credentials', False) or any(secrets):
+            update_task(task_id, status='failed', error='服务重启，使用自定义API密钥的任务无法自动恢复，请重新提交')
+            checkpoint.remove()
+            continue
+        update_task(task_id, status='pending', message='服务重启，正在恢复任务...')
+        try:
+            job_queue.submit(task_id, functools.partial(
+                run_translation_task, task_id, parse_api_token=None, translate_api_key=None, **job))
+        except JobQueueFull:
+            update_task(task_id, status='failed', error='服务重启后队列已满，请重新提交')
+            checkpoint.remove()
+            continue
+        resumed += 1
+        print(f"[任务 {task_id}] 服务重启后恢复执行", flush=True)
+    return resumed
 
-        if task_result.get("status") != "success":
-            update_task(task_id, status='failed', error='PDF解析失败')
-            return
 
-        update_task(task_id, progress=40, message='PDF解析完成，正在提取内容...')
+class Janitor:
+    """
+    后台清理线程：定期删除过期的结果文件、同步接口的中间文件、调试日志、遗留的检查点和已结束的任务记录；
+    文件总大小超过配额时从最旧的开始淘汰。排队中和进行中的任务的文件不会被删除。
+    """
 
-        # 3. 获取Markdown内容
-        markdown_content = None
-        if "output" in task_result:
-            output = task_result["output"]
+    # 最近修改的文件不参与配额淘汰，避免删掉同步接口正在使用的文件
+    MIN_AGE = 10 * 60
+
+    def __init__(self, directories, checkpoint_dir, ttl, max_bytes, task_ttl, interval):
+        self.directories = directories
+        self.checkpoint_dir = checkpoint_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.task_ttl = task_ttl
+        self.interval = interval
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """启动清理线程（每个进程一个，在 fork 之后调用）"""
+        with self.lock:
+            if self.pid == os.getpid() or self.interval <= 0:
+                return
+            self.pid = os.getpid()
+        threading.Thread(target=self._loop, name="janitor", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ 清理任务出错: {e}", flush=True)
+            time.sleep(self.interval)
 
-            if "segments" in output and isinstance(output["segments"], list):
-                segments = output["segments"]
-                content_parts = []
-                for segment in segments:
-                    if "content" in segment:
-                        content_parts.append(segment["content"])
-                if content_parts:
-                    markdown_content = "\n\n".join(content_parts)
-            elif "text_result" in output:
-                markdown_content = output["text_result"]
-            elif "file_url" in output:
-                file_url = output["file_url"]
-                response = requests.get(file_url, timeout=30)
-                markdown_content = response.text
-            elif "content" in output:
-                markdown_content = output["content"]
+    @staticmethod
+    def _remove(path):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
 
-        if not markdown_content:
-            update_task(task_id, status='failed', error='无法获取解析内容')
+    def sweep(self):
+        """执行一次清理，返回删除的文件数和任务记录数"""
+        now = time.time()
+        active_tasks = task_store.list_by_status('pending', 'processing')
+        active = {task_id for task_id, _ in active_tasks}
+        # 作业已结束或已删除、却仍显示等待中的复用任务：补上作业的结束状态，之后与作业一起清理
+        settled = set()
+        for task_id, task in active_tasks:
+            owner_id = task.get('attached_to')
+            if owner_id and owner_id not in active:
+                _finish_follower(task_id, task_store.get(owner_id))
+                settled.add(task_id)
+        active -= settled
+        # 还有任务在等待其结果（且仍在运行）的作业
+        awaited = {task['attached_to'] for task_id, task in active_tasks
+                   if task.get('attached_to') and task_id not in settled}
+
+        def is_active(name):
+            return name.split('_', 1)[0] in active
+
+        removed_files = 0
+        files = []
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if not entry.is_file() or is_active(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.ttl:
+                    removed_files += self._remove(entry.path)
+                else:
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # 超过磁盘配额时从最旧的文件开始删除
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < self.MIN_AGE:
+                break
+            removed_files += self._remove(path)
+            total -= size
+
+        # 遗留的检查点（任务已不在运行）
+        if os.path.isdir(self.checkpoint_dir):
+            for entry in os.scandir(self.checkpoint_dir):
+                if entry.name not in active and now - entry.stat().st_mtime > self.ttl:
+                    removed_files += self._remove(entry.path)
+
+        # 已结束的任务记录（连同其结果文件）；复用作业的任务记录与被复用的作业一起删除
+        removed_tasks = 0
+        cutoff = datetime.fromtimestamp(now - self.task_ttl).isoformat()
+        finished = task_store.list_by_status('completed', 'failed', 'cancelled')
+        existing = active | {task_id for task_id, _ in finished}
+        followers = collections.defaultdict(list)
+        for task_id, task in finished:
+            if task.get('attached_to'):
+                followers[task['attached_to']].append(task_id)
+        for task_id, task in finished:
+            if task.get('attached_to') in existing or task_id in awaited:
+                continue
+            if (task.get('updated_at') or '') < cutoff:
+                if task.get('result_path'):
+                    self._remove(task['result_path'])
+                for follower_id in followers.get(task_id, ()):
+                    task_store.delete(follower_id)
+                    removed_tasks += 1
+                task_store.delete(task_id)
+                removed_tasks += 1
+
+        if removed_files or removed_tasks:
+            print(f"🧹 清理完成：删除 {removed_files} 个文件，{removed_tasks} 条任务记录，"
+                  f"剩余文件 {total / 1024 / 1024:.1f} MB", flush=True)
+        return removed_files, removed_tasks
+
+
+janitor = Janitor(
+    [UPLOAD_DIR, DEBUG_DIR, Config.TRACE_DIR],
+    Config.CHECKPOINT_DIR,
+    ttl=Config.ARTIFACT_TTL,
+    max_bytes=Config.ARTIFACT_MAX_BYTES,
+    task_ttl=Config.TASK_RECORD_TTL,
+    interval=Config.JANITOR_INTERVAL
+)
+
+
+def _save_upload(file, path):
+    """边写入磁盘边计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for block in iter(lambda: file.stream.read(1024 * 1024), b''):
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+
+def _job_key(file_hash, mineru_options, translation_mode, translate_api_url, translate_api_model):
+    """相同文件、解析参数和翻译配置的提交共享同一个作业（不含密钥）"""
+    spec = {
+        'file': file_hash,
+        'mineru': _mineru_payload(mineru_options),
+        'mode': translation_mode,
+        'api_url': translate_api_url or '',
+        'model': translate_api_model or '',
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"任务队列已满，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    有界 FIFO 任务队列：最多同时运行 max_running 个任务，最多排队 max_queued 个。
+    排队位置和预计开始时间写入任务记录，任何 worker 的状态接口都能读到。
+    """
+
+    def __init__(self, max_running, max_queued, default_duration):
+        self.max_running = max(1, max_running)
+        self.max_queued = max(0, max_queued)
+        self.avg_duration = float(default_duration)
+        self.cond = threading.Condition()
+        self.queue = collections.deque()  # [(task_id, fn, args)]
+        self.running = {}  # {task_id: 开始时间}
+        self.pid = None
+
+    def _ensure_workers(self):
+        # 工作线程在首次提交时才启动：gunicorn 预加载时 master 中不会产生线程，fork 后各 worker 自行启动
+        if self.pid == os.getpid():
             return
+        self.pid = os.getpid()
+        self.queue.clear()
+        self.running.clear()
+        for i in range(self.max_running):
+            threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True).start()
+
+    def _slot_waits(self, now):
+        """每个执行槽位还需多久空出（基于历史平均耗时估算）"""
+        waits = [max(0.0, self.avg_duration - (now - started)) for started in self.running.values()]
+        waits += [0.0] * (self.max_running - len(waits))
+        heapq.heapify(waits)
+        return waits
+
+    def _schedule(self):
+        """估算每个排队任务的位置和开始时间（调用方持有锁）"""
+        now = time.time()
+        waits = self._slot_waits(now)
+        schedule = []
+        for position, (task_id, _, _) in enumerate(self.queue, 1):
+            wait = heapq.heappop(waits)
+            schedule.append((task_id, position, now + wait))
+            heapq.heappush(waits, wait + self.avg_duration)
+        return schedule
+
+    def _publish(self):
+        """把当前排队位置写入任务记录（调用方持有锁，避免较旧的快照覆盖已开始运行的任务状态）"""
+        for task_id, position, start_at in self._schedule():
+            update_task(task_id,
+                        queue_position=position,
+                        estimated_start_at=datetime.fromtimestamp(start_at).isoformat(),
+                        message=f'排队中，前面还有 {position - 1} 个任务...')
+
+    def is_full(self):
+        with self.cond:
+            return len(self.queue) >= self.max_queued
+
+    def retry_after(self):
+        """队列已满时建议客户端等待的秒数：最早空出一个槽位的时间"""
+        with self.cond:
+            return max(1, math.ceil(self._slot_waits(time.time())[0]))
+
+    def cancel(self, task_id):
+        """从队列中移除尚未开始的任务，返回是否移除成功"""
+        with self.cond:
+            for item in self.queue:
+                if item[0] == task_id:
+                    self.queue.remove(item)
+                    break
+            else:
+                return False
+            self._publish()
+        return True
+
+    def submit(self, task_id, fn, *args):
+        with self.cond:
+            self._ensure_workers()
+            if len(self.queue) >= self.max_queued:
+                raise JobQueueFull(max(1, math.ceil(self._slot_waits(time.time())[0])))
+            self.queue.append((task_id, fn, args))
+            self._publish()
+            self.cond.notify()
+
+    def _worker_loop(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                task_id, fn, args = self.queue.popleft()
+                self.running[task_id] = time.time()
+                update_task(task_id, queue_position=0, estimated_start_at=None)
+                self._publish()
+
+            started = time.time()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[任务 {task_id}] 未处理的错误: {e}", flush=True)
+            finally:
+                with self.cond:
+                    self.running.pop(task_id, None)
+                    # 指数滑动平均，用于估算排队任务的开始时间
+                    self.avg_duration = 0.7 * self.avg_duration + 0.3 * (time.time() - started)
+                    self._publish()
 
-        print(f"[任务 {task_id}] Markdown内容长度: {len(markdown_content)}")
-        update_task(task_id, progress=50, message='正在翻译内容...')
 
-        # 4. 翻译
-        print(f"[任务 {task_id}] 翻译模式: {translation_mode}")
+job_queue = JobQueue(Config.MAX_RUNNING_JOBS, Config.MAX_QUEUED_JOBS, Config.JOB_DURATION_ESTIMATE)
+metrics.register(MetricGauge(
+    'translater_queue_depth', '任务队列中的任务数', ['state'],
+    collect=lambda: {('queued',): len(job_queue.queue), ('running',): len(job_queue.running)}))
 
-        if translation_mode == 'hybrid':
-            translated_content = translate_markdown_hybrid(
-                markdown_content,
-                api_url=translate_api_url,
-                api_key=translate_api_key,
-                model=translate_api_model
-            )
-        elif translation_mode == 'ai':
-            translated_content = translate_markdown_content_with_ai(
-                markdown_content,
-                api_url=translate_api_url,
-                api_key=translate_api_key,
-                model=translate_api_model
-            )
-        elif translation_mode == 'deeplx':
-            translated_content = translate_markdown_content(markdown_content)
+
+def _translation_progress_reporter(task_id):
+    """
+    把翻译进度快照写入任务状态，总进度在 50%~80% 之间单调递增。
+    DeepLX和公式修正线程池的回调会并发调用，较旧的快照（完成块数更少）直接丢弃
+    """
+    lock = threading.Lock()
+    state = {'progress': 50, 'seen': (-1, -1)}
+
+    def report(snapshot):
+        done, total = snapshot['chunks_done'], snapshot['chunks_total']
+        with lock:
+            if (done, total) < state['seen']:
+                return
+            state['seen'] = (done, total)
+            if total:
+                state['progress'] = max(state['progress'], 50 + int(30 * done / total))
+            message = f'正在翻译内容... 已完成 {done}/{total} 块'
+            if snapshot['eta_seconds'] is not None and done < total:
+                message += f"，预计剩余 {snapshot['eta_seconds']} 秒"
+            update_task(task_id, progress=state['progress'], message=message, translation=snapshot)
+
+    return report
+
+
+def _parse_pdf_for_task(task_id, upload_path, mineru_options, parse_api_token):
+    """调用MinerU解析PDF并提取Markdown，失败时更新任务状态并返回None"""
+    print(f"[任务 {task_id}] 正在解析PDF...")
+
+    result = parse_pdf_with_mineru(upload_path, mineru_options, api_token=parse_api_token)
+    mineru_task_id = result.get("task_id")
+
+    if not mineru_task_id:
+        update_task(task_id, status='failed', error='MinerU任务创建失败')
+        return None
+
+    print(f"[任务 {task_id}] MinerU任务ID: {mineru_task_id}")
+    update_task(task_id, progress=20, message='等待MinerU处理...')
+
+    # 2. 等待MinerU处理完成
+    task_result = poll_mineru_task(mineru_task_id, api_token=parse_api_token,
+                                   size_bytes=os.path.getsize(upload_path))
+
+    if task_result.get("status") != "success":
+        update_task(task_id, status='failed', error='PDF解析失败')
+        return None
+
+    update_task(task_id, progress=40, message='PDF解析完成，正在提取内容...')
+
+    # 3. 获取Markdown内容
+    markdown_content = None
+    if "output" in task_result:
+        output = task_result["output"]
+
+        if "segments" in output and isinstance(output["segments"], list):
+            segments = output["segments"]
+            content_parts = []
+            for segment in segments:
+                if "content" in segment:
+                    content_parts.append(segment["content"])
+            if content_parts:
+                markdown_content = "\n\n".join(content_parts)
+        elif "text_result" in output:
+            markdown_content = output["text_result"]
+        elif "file_url" in output:
+            file_url = output["file_url"]
+            response = get_http_session(file_url).get(file_url, timeout=30)
+            markdown_content = response.text
+        elif "content" in output:
+            markdown_content = output["content"]
+
+    if not markdown_content:
+        update_task(task_id, status='failed', error='无法获取解析内容')
+        return None
+
+    return markdown_content
+
+
+def run_translation_task(task_id, upload_path, original_filename, mineru_options,
+                         parse_api_token, translate_api_url, translate_api_key,
+                         translate_api_model, translation_mode):
+    """在后台线程中执行翻译任务"""
+    context_token = current_task_id.set(task_id)
+    checkpoint = TaskCheckpoint(task_id)
+    cancel_token = register_cancel_token(task_id)
+    tracer = register_tracer(task_id)
+    task_started = time.time()
+    try:
+        # 排队期间可能已被取消
+        cancel_token.check()
+
+        # 1. 使用MinerU解析PDF（中断后恢复的任务直接读取检查点，相同文件与参数复用缓存的解析结果）
+        update_task(task_id, status='processing', progress=10, message='正在解析PDF...')
+        markdown_content = checkpoint.load_markdown()
+        if markdown_content is not None:
+            print(f"[任务 {task_id}] 从检查点恢复解析结果")
+            update_task(task_id, progress=40, message='从检查点恢复解析结果...')
         else:
-            translated_content = translate_markdown_hybrid(
-                markdown_content,
-                api_url=translate_api_url,
-                api_key=translate_api_key,
-                model=translate_api_model
-            )
+            parse_key = parse_cache.make_key(upload_path, mineru_options)
+            markdown_content = parse_cache.get(parse_key)
+            if markdown_content is not None:
+                print(f"[任务 {task_id}] 命中解析缓存，跳过MinerU解析")
+                update_task(task_id, progress=40, message='命中解析缓存，跳过PDF解析...', parse_cache_hit=True)
+            else:
+                with trace_span('parse_pdf'):
+                    markdown_content = _parse_pdf_for_task(task_id, upload_path, mineru_options, parse_api_token)
+                if not markdown_content:
+                    return
+                parse_cache.put(parse_key, markdown_content)
+            checkpoint.save_markdown(markdown_content)
+
+        print(f"[任务 {task_id}] Markdown内容长度: {len(markdown_content)}")
+        update_task(task_id, progress=50, message='正在翻译内容...')
 
-        print(f"[任务 {task_id}] 翻译完成！")
-        update_task(task_id, progress=80, message='正在生成PDF...')
+        # 4. 翻译（进度映射到 50%~80%）
+        print(f"[任务 {task_id}] 翻译模式: {translation_mode}")
+        report_progress = _translation_progress_reporter(task_id)
+
+        with trace_span('translate', mode=translation_mode, chars=len(markdown_content)):
+            if translation_mode == 'hybrid':
+                translated_content = translate_markdown_hybrid(
+                    markdown_content,
+                    api_url=translate_api_url,
+                    api_key=translate_api_key,
+                    model=translate_api_model,
+                    progress_callback=report_progress
+                )
+            elif translation_mode == 'ai':
+                translated_content = translate_markdown_content_with_ai(
+                    markdown_content,
+                    api_url=translate_api_url,
+                    api_key=translate_api_key,
+                    model=translate_api_model,
+                    progress_callback=report_progress
+                )
+            elif translation_mode == 'deeplx':
+                translated_content = translate_markdown_content(markdown_content, progress_callback=report_progress)
+            else:
+                translated_content = translate_markdown_hybrid(
+                    markdown_content,
+                    api_url=translate_api_url,
+                    api_key=translate_api_key,
+                    model=translate_api_model,
+                    progress_callback=report_progress
+                )
+
+        cache_stats = translation_memory.pop_task_stats(task_id)
+        print(f"[任务 {task_id}] 翻译完成！翻译记忆命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
+        update_task(task_id, progress=80, message='正在生成PDF...', cache=cache_stats)
 
         # 5. 生成PDF
         output_filename = f"translated_{os.path.splitext(original_filename)[0]}.pdf"
@@ -1595,10 +3835,21 @@ def run_translation_task(task_id, upload_path, original_filename, mineru_options
         update_task(task_id, status='completed', progress=100, message='翻译完成',
                    result_path=output_path, result_filename=output_filename)
 
+    except TaskCancelled:
+        print(f"[任务 {task_id}] 已取消")
+        update_task(task_id, status='cancelled', message='任务已取消')
     except Exception as e:
         print(f"[任务 {task_id}] 错误: {str(e)}")
         update_task(task_id, status='failed', error=str(e))
     finally:
+        tracer.record('run_translation_task', task_started, time.time(), mode=translation_mode,
+                      status=(task_store.get(task_id) or {}).get('status'))
+        release_tracer(task_id)
+        release_cancel_token(task_id)
+        current_task_id.reset(context_token)
+        translation_memory.pop_task_stats(task_id)
+        # 任务已结束（成功或失败），不再需要检查点；进程被杀死时不会执行到这里
+        checkpoint.remove()
         # 清理上传的原始文件
         try:
             if os.path.exists(upload_path):
@@ -1607,6 +3858,16 @@ def run_translation_task(task_id, upload_path, original_filename, mineru_options
             pass
 
 
+def _queue_full_response(retry_after):
+    response = jsonify({
+        'error': f'服务繁忙，任务队列已满，请 {retry_after} 秒后重试',
+        'retry_after': retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
 @app.route('/translate/submit', methods=['POST'])
 def submit_translation():
     """提交翻译任务（异步）"""
@@ -1621,20 +3882,24 @@ def submit_translation():
     if not file.filename.endswith('.pdf'):
         return jsonify({'error': '只支持PDF文件'}), 400
 
+    # 准入控制：队列已满时直接拒绝，不再接收文件
+    if job_queue.is_full():
+        return _queue_full_response(job_queue.retry_after())
+
     try:
         # 生成任务ID
         task_id = str(uuid.uuid4())[:8]
 
         # 保存上传的文件
         upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}_{file.filename}")
-        file.save(upload_path)
+        file_hash = _save_upload(file, upload_path)
 
         # 解析配置
         mineru_options = {
-            "is_ocr": _to_bool(request.form.get('is_ocr'), True),
-            "include_image_base64": _to_bool(request.form.get('include_image_base64'), True),
-            "formula_enable": _to_bool(request.form.get('formula_enable'), True),
-            "table_enable": _to_bool(request.form.get('table_enable'), True),
+            "is_ocr": to_bool(request.form.get('is_ocr'), True),
+            "include_image_base64": to_bool(request.form.get('include_image_base64'), True),
+            "formula_enable": to_bool(request.form.get('formula_enable'), True),
+            "table_enable": to_bool(request.form.get('table_enable'), True),
             "layout_model": request.form.get('layout_model', 'doclayout_yolo'),
             "output_format": request.form.get('output_format', 'md'),
         }
@@ -1655,28 +3920,59 @@ def submit_translation():
         translation_mode = request.form.get('translation_mode', 'hybrid')
 
         # 创建任务记录
-        with tasks_lock:
-            translation_tasks[task_id] = {
-                'status': 'pending',
-                'progress': 0,
-                'message': '任务已创建，等待处理...',
-                'error': None,
-                'result_path': None,
-                'result_filename': None,
-                'original_filename': file.filename,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat()
-            }
+        task_store.create(task_id, {
+            'status': 'pending',
+            'progress': 0,
+            'message': '任务已创建，等待处理...',
+            'error': None,
+            'result_path': None,
+            'result_filename': None,
+            'original_filename': file.filename,
+            'owner': _process_identity(),
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        })
 
-        # 启动后台线程执行翻译
-        thread = threading.Thread(
-            target=run_translation_task,
-            args=(task_id, upload_path, file.filename, mineru_options,
-                  parse_api_token, translate_api_url, translate_api_key,
-                  translate_api_model, translation_mode)
-        )
-        thread.daemon = True
-        thread.start()
+        # 相同文件与配置的作业已在排队、进行中或已完成时，直接复用其结果
+        job_key = _job_key(file_hash, mineru_options, translation_mode, translate_api_url, translate_api_model)
+        owner = task_store.claim_job(job_key, task_id)
+        if owner:
+            update_task(task_id, attached_to=owner)
+            # 作业可能在登记之前（或登记与关联之间）就已结束，此时不会再通知本任务，直接补上结束状态
+            job = task_store.get(owner)
+            if job is None or job.get('status') in ('completed', 'failed', 'cancelled'):
+                _finish_follower(task_id, job)
+            os.remove(upload_path)
+            print(f"[任务 {task_id}] 与任务 {owner} 内容相同，复用其结果")
+            return jsonify({
+                'task_id': task_id,
+                'message': '任务已提交'
+            })
+
+        # 保存作业参数，进程重启后可以恢复执行；用户提供的密钥不写入磁盘，
+        # 使用了自定义密钥的任务重启后无法恢复
+        TaskCheckpoint(task_id).save_job({
+            'upload_path': upload_path,
+            'original_filename': file.filename,
+            'mineru_options': mineru_options,
+            'translate_api_url': translate_api_url,
+            'translate_api_model': translate_api_model,
+            'translation_mode': translation_mode,
+            'user_credentials': bool(parse_api_token or translate_api_key),
+        })
+
+        # 放入有界任务队列，由固定数量的工作线程执行
+        try:
+            job_queue.submit(task_id, run_translation_task,
+                             task_id, upload_path, file.filename, mineru_options,
+                             parse_api_token, translate_api_url, translate_api_key,
+                             translate_api_model, translation_mode)
+        except JobQueueFull as e:
+            task_store.delete(task_id)
+            TaskCheckpoint(task_id).remove()
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            return _queue_full_response(e.retry_after)
 
         print(f"[任务 {task_id}] 任务已创建，文件: {file.filename}")
 
@@ -1690,31 +3986,84 @@ def submit_translation():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/translate/status/<task_id>')
-def get_translation_status(task_id):
-    """查询翻译任务状态"""
-    with tasks_lock:
-        task = translation_tasks.get(task_id)
-
-    if not task:
-        return jsonify({'error': '任务不存在'}), 404
-
-    return jsonify({
+def _task_status_payload(task_id, task):
+    return {
         'task_id': task_id,
         'status': task['status'],
         'progress': task['progress'],
         'message': task['message'],
         'error': task['error'],
+        'cache': task.get('cache'),
+        'translation': task.get('translation'),
+        'parse_cache_hit': task.get('parse_cache_hit', False),
+        'queue_position': task.get('queue_position'),
+        'estimated_start_at': task.get('estimated_start_at'),
+        'attached_to': task.get('attached_to'),
         'created_at': task['created_at'],
         'updated_at': task['updated_at']
-    })
+    }
+
+
+@app.route('/translate/status/<task_id>')
+def get_translation_status(task_id):
+    """查询翻译任务状态"""
+    task = get_task(task_id)
+
+    if not task:
+        return jsonify({'error': '任务不存在'}), 404
+
+    return jsonify(_task_status_payload(task_id, task))
+
+
+@app.route('/translate/events/<task_id>')
+def stream_translation_status(task_id):
+    """
+    以 Server-Sent Events 推送任务状态变更，替代前端每秒轮询。
+    本进程内的更新只唤醒关注该任务（及其复用的作业）的连接；其他 worker 的更新每
+    TASK_EVENTS_CHECK_INTERVAL 秒检查一次。每条连接最长保持 TASK_EVENTS_MAX_DURATION 秒，
+    之后由浏览器自动重连。每条连接在等待时占用一个 worker 线程，因此每个进程最多同时保持
+    TASK_EVENTS_MAX_STREAMS 条，超出时返回503，前端改用 /translate/status 轮询。
+    """
+    task = get_task(task_id)
+    if not task:
+        return jsonify({'error': '任务不存在'}), 404
+    watched = [task_id] + ([task['attached_to']] if task.get('attached_to') else [])
+
+    if not task_event_streams.acquire():
+        response = jsonify({'error': '推送连接已满，请改用轮询'})
+        response.headers['Retry-After'] = str(Config.TASK_EVENTS_MAX_DURATION)
+        return response, 503
+
+    def generate():
+        deadline = time.time() + Config.TASK_EVENTS_MAX_DURATION
+        last_payload = None
+        yield "retry: 1000\n\n"
+        with task_events.listen(*watched) as changed:
+            while True:
+                task = get_task(task_id)
+                if not task:
+                    yield f"event: error\ndata: {json.dumps({'error': '任务不存在'}, ensure_ascii=False)}\n\n"
+                    return
+                payload = _task_status_payload(task_id, task)
+                if payload != last_payload:
+                    last_payload = payload
+                    yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                if task['status'] in ('completed', 'failed', 'cancelled') or time.time() >= deadline:
+                    return
+                changed.wait(Config.TASK_EVENTS_CHECK_INTERVAL)
+                changed.clear()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 连接关闭（包括生成器尚未开始时客户端就断开）后释放名额
+    response.call_on_close(task_event_streams.release)
+    return response
 
 
 @app.route('/translate/download/<task_id>')
 def download_translation(task_id):
     """下载翻译结果"""
-    with tasks_lock:
-        task = translation_tasks.get(task_id)
+    task = get_task(task_id)
 
     if not task:
         return jsonify({'error': '任务不存在'}), 404
@@ -1734,6 +4083,82 @@ def download_translation(task_id):
     )
 
 
+@app.route('/translate/trace/<task_id>')
+def get_translation_trace(task_id):
+    """任务耗时跟踪（Chrome trace 格式）"""
+    task = task_store.get(task_id)
+    if not task:
+        return jsonify({'error': '任务不存在'}), 404
+
+    trace = load_trace(task.get('attached_to') or task_id)
+    if trace is None:
+        return jsonify({'error': '暂无跟踪数据'}), 404
+    return jsonify(trace)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus 指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _cancel_job(task_id, task):
+    """真正停止作业：排队中的直接移出队列，运行中的在下一个检查点停止；返回当前状态"""
+    update_task(task_id, cancel_requested=True, message='正在取消...')
+    if job_queue.cancel(task_id):
+        checkpoint = TaskCheckpoint(task_id)
+        upload_path = (checkpoint.load_job() or {}).get('upload_path')
+        if upload_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+        checkpoint.remove()
+        update_task(task_id, status='cancelled', message='任务已取消')
+        return 'cancelled'
+
+    with _cancel_tokens_lock:
+        token = _cancel_tokens.get(task_id)
+    if token is not None:
+        token.cancel()
+    # 由其他 worker 运行的任务会在一秒内从任务存储读到取消请求
+    print(f"[任务 {task_id}] 已请求取消")
+    return task['status']
+
+
+@app.route('/translate/cancel/<task_id>', methods=['POST'])
+def cancel_translation(task_id):
+    """
+    取消翻译任务：排队中的任务直接移除，运行中的任务在下一个检查点停止。
+    作业还有其他复用任务在等待时只对提交者标记为已取消，最后一个等待者取消后才真正停止作业。
+    """
+    task = task_store.get(task_id)
+
+    if not task:
+        return jsonify({'error': '任务不存在'}), 404
+
+    # 复用其他作业结果的任务解除关联；被复用的作业已被提交者取消且没人再等待时一并停止
+    owner_id = task.get('attached_to')
+    if owner_id:
+        if task['status'] not in ('pending', 'processing'):
+            return jsonify({'error': '任务已结束，无法取消'}), 400
+        update_task(task_id, attached_to=None, status='cancelled', progress=0, message='任务已取消')
+        owner = task_store.get(owner_id)
+        if owner and owner.get('abandoned') and owner['status'] in ('pending', 'processing') \
+                and not _live_followers(owner_id):
+            _cancel_job(owner_id, owner)
+        return jsonify({'task_id': task_id, 'status': 'cancelled', 'message': '任务已取消'})
+
+    if task['status'] not in ('pending', 'processing') or task.get('abandoned'):
+        return jsonify({'error': '任务已结束，无法取消'}), 400
+
+    if _live_followers(task_id):
+        update_task(task_id, abandoned=True)
+        print(f"[任务 {task_id}] 提交者已取消，作业继续为复用任务运行")
+        return jsonify({'task_id': task_id, 'status': 'cancelled', 'message': '任务已取消'})
+
+    status = _cancel_job(task_id, task)
+    return jsonify({'task_id': task_id, 'status': status,
+                    'message': '任务已取消' if status == 'cancelled' else '正在取消...'})
+
+
 # ============== 原有同步 API（保留兼容） ==============
 
 @app.route('/translate', methods=['POST'])
@@ -1757,10 +4182,10 @@ def translate_pdf():
 
         # 解析 MinerU 配置
         mineru_options = {
-            "is_ocr": _to_bool(request.form.get('is_ocr'), True),
-            "include_image_base64": _to_bool(request.form.get('include_image_base64'), True),
-            "formula_enable": _to_bool(request.form.get('formula_enable'), True),
-            "table_enable": _to_bool(request.form.get('table_enable'), True),
+            "is_ocr": to_bool(request.form.get('is_ocr'), True),
+            "include_image_base64": to_bool(request.form.get('include_image_base64'), True),
+            "formula_enable": to_bool(request.form.get('formula_enable'), True),
+            "table_enable": to_bool(request.form.get('table_enable'), True),
             "layout_model": request.form.get('layout_model', 'doclayout_yolo'),
             "output_format": request.form.get('output_format', 'md'),
         }
@@ -1818,7 +4243,8 @@ def translate_pdf():
         
         # 2. 等待MinerU处理完成
         print("等待MinerU处理...")
-        task_result = poll_mineru_task(task_id, api_token=parse_api_token)
+        task_result = poll_mineru_task(task_id, api_token=parse_api_token,
+                                       size_bytes=os.path.getsize(upload_path))
         
         # 3. 获取解析结果
         if task_result.get("status") != "success":
@@ -1858,7 +4284,7 @@ def translate_pdf():
             elif "file_url" in output:
                 file_url = output["file_url"]
                 print(f"下载文件: {file_url}")
-                response = requests.get(file_url, timeout=30)
+                response = get_http_session(file_url).get(file_url, timeout=30)
                 markdown_content = response.text
                 print(f"✓ 下载内容长度: {len(markdown_content)}")
             
@@ -1970,6 +4396,9 @@ def translate_pdf():
 
 
 if __name__ == '__main__':
+    resume_interrupted_tasks()
+    janitor.start()
+    metrics.start()
     print("启动PDF翻译器...")
     print("访问 http://localhost:8000 使用应用")
     app.run(debug=False, host='0.0.0.0', port=8000)
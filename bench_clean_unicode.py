@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+clean_unicode_characters 性能对比
+在多MB文档（含内联base64图片）上对比旧的逐条 str.replace + 逐字符循环实现
+与新的单次扫描实现，并验证两者输出完全一致。
+
+用法: python bench_clean_unicode.py [文档MB数，默认4]
+"""
+
+import base64
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from config import Config
+from app import clean_unicode_characters
+
+
+def legacy_clean_unicode_characters(text):
+    """旧实现（用于对比）：约60次全文 str.replace，再逐字符过滤"""
+    for old_char, new_char in Config.UNICODE_REPLACEMENTS.items():
+        text = text.replace(old_char, new_char)
+
+    cleaned_text = []
+    for char in text:
+        code_point = ord(char)
+        if code_point == 0xFFFD:
+            continue
+        if (0xE000 <= code_point <= 0xF8FF or
+                0xF0000 <= code_point <= 0xFFFFD or
+                0x100000 <= code_point <= 0x10FFFD):
+            continue
+        if 0x00 <= code_point <= 0x1F and code_point not in [0x09, 0x0A, 0x0D]:
+            continue
+        cleaned_text.append(char)
+    return ''.join(cleaned_text)
+
+
+def build_document(size_mb, seed=42):
+    """生成一篇中英文混排、带公式和base64图片的合成论文"""
+    rng = random.Random(seed)
+    noisy = list(Config.UNICODE_REPLACEMENTS) + ['\ue000', '\U000f0010', '\x07', '\u200b']
+    paragraph = (
+        "The δ¹³C excursion — known as the “Shuram” event — lasted ∼7 Myr… "
+        "研究表明，海洋氧化事件持续了约七百万年。 $^{13}C$ and O₂ levels rose. "
+    )
+    image = "![Figure](data:image/png;base64," + base64.b64encode(rng.randbytes(300_000)).decode() + ")"
+
+    parts = []
+    size = 0
+    target = size_mb * 1024 * 1024
+    while size < target:
+        if rng.random() < 0.02:
+            part = image
+        else:
+            part = paragraph + ''.join(rng.choice(noisy) for _ in range(3)) + paragraph
+        parts.append(part)
+        size += len(part)
+    return "\n\n".join(parts)
+
+
+def bench(func, text, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    document = build_document(size_mb)
+
+    print("=" * 60)
+    print(f"clean_unicode_characters 性能对比（文档 {len(document) / 1024 / 1024:.1f} MB）")
+    print("=" * 60)
+
+    # 单字符全量验证：整个BMP（0–0xFFFF）以及补充平面私用区边界都必须与旧实现一致
+    sample = ''.join(chr(cp) for cp in range(0x0, 0x10000)) + ''.join(
+        chr(cp) for cp in (0xF0000, 0xFFFFD, 0x100000, 0x10FFFD, 0x1F600))
+    assert clean_unicode_characters(sample) == legacy_clean_unicode_characters(sample)
+    assert clean_unicode_characters(document) == legacy_clean_unicode_characters(document)
+    print("✓ 输出与旧实现完全一致（含全部BMP码点）")
+
+    legacy = bench(legacy_clean_unicode_characters, document)
+    current = bench(clean_unicode_characters, document)
+
+    print(f"  旧实现: {legacy * 1000:.1f} ms")
+    print(f"  新实现: {current * 1000:.1f} ms")
+    print(f"  加速比: {legacy / current:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
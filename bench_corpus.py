@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+合成学术论文生成器（供基准测试使用）
+按目标大小生成 MinerU 风格的 Markdown：标题、作者上标、摘要、章节、行内/独立公式、
+base64 内联图片、表格和参考文献。可调节公式密度、图片数量和中文比例，同一种子输出相同。
+
+用法: python bench_corpus.py [KB数，默认10] > paper.md
+"""
+
+import base64
+import random
+import struct
+import sys
+import zlib
+
+WORDS = (
+    "isotope carbon oxygen sulfate excursion ocean sediment record marine basin "
+    "analysis sample measurement model data result method value event interval "
+    "global regional profile section signal variation composition ratio flux "
+    "evidence climate biological cycle anomaly fractionation precipitation "
+    "significant consistent observed suggest indicate reveal support increase"
+).split()
+
+CJK_SENTENCES = [
+    "研究表明，海洋氧化事件持续了约七百万年。",
+    "样品的碳同位素组成在剖面上呈现明显的负偏移。",
+    "这一结果与全球其他地区的记录一致。",
+    "我们采用高精度质谱仪测定了硫酸盐的氧同位素。",
+    "沉积速率的变化可能影响了信号的保存。",
+]
+
+INLINE_FORMULAS = [
+    r"$\delta^{13}\mathrm{C}$", r"$\Delta^{17}\mathrm{O}$", r"$^{12-14}$", r"$\mathrm{SO}_4^{2-}$",
+    r"$5.0 \pm 0.3$", r"$10^{-3}$", r"$\mu\mathrm{m}$", r"$\sim 7$", r"$^{87}\mathrm{Sr}/^{86}\mathrm{Sr}$",
+    r"$\mathrm{O}_2$", r"$p < 0.05$", r"$\alpha = 0.98$",
+]
+
+DISPLAY_FORMULAS = [
+    r"$$\delta^{13}\mathrm{C} = \left(\frac{R_{sample}}{R_{standard}} - 1\right) \times 1000$$",
+    r"$$F = \sum_{i=1}^{n} k_i c_i \exp\left(-\frac{E_a}{RT}\right)$$",
+    r"$$\Delta^{17}\mathrm{O} = \ln(\delta^{17}\mathrm{O} + 1) - 0.528 \ln(\delta^{18}\mathrm{O} + 1)$$",
+]
+
+SECTIONS = ["Introduction", "Geological Setting", "Methods", "Results", "Discussion", "Conclusions"]
+
+
+def make_png(width, height, rng):
+    """生成一张随机灰度PNG（噪声数据几乎不可压缩，大小约为 width×height 字节）"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rows = b''.join(b'\x00' + rng.randbytes(width) for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, 1))
+            + chunk(b'IEND', b''))
+
+
+def _sentence(rng, formula_density, cjk_ratio):
+    if rng.random() < cjk_ratio:
+        return rng.choice(CJK_SENTENCES)
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+    if rng.random() < formula_density:
+        words.insert(rng.randint(1, len(words)), rng.choice(INLINE_FORMULAS))
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+
+def _paragraph(rng, formula_density, cjk_ratio):
+    return " ".join(_sentence(rng, formula_density, cjk_ratio) for _ in range(rng.randint(3, 7)))
+
+
+def generate_paper(target_bytes=10 * 1024, formula_density=0.3, images=2, cjk_ratio=0.0,
+                   seed=0, image_size=64):
+    """
+    生成一篇约 target_bytes 字节（UTF-8）的合成论文
+
+    formula_density: 含行内公式的句子比例，另按该比例插入独立公式段落
+    images: 内联 base64 图片数量，均匀分布在正文中
+    cjk_ratio: 中文句子比例
+    image_size: 图片边长（像素），每张图片约 image_size² 字节
+    """
+    rng = random.Random(seed)
+    parts = [
+        f"# {' '.join(w.capitalize() for w in rng.sample(WORDS, 6))}",
+        "Wang $^{1,2}$, Li $^{1}$, Smith $^{2,3}$",
+        "## Abstract",
+        _paragraph(rng, formula_density, cjk_ratio),
+    ]
+    size = sum(len(part.encode('utf-8')) + 2 for part in parts)
+    # 预留图片和参考文献的空间，正文填满其余部分
+    image_markdown = [
+        f"![Figure {i + 1}](data:image/png;base64,{base64.b64encode(make_png(image_size, image_size, rng)).decode()})"
+        for i in range(images)
+    ]
+    references = ["## References"] + [
+        f"{i + 1}. {rng.choice(WORDS).capitalize()}, A. et al. Journal of {rng.choice(WORDS).capitalize()} "
+        f"{rng.randint(10, 99)}, {rng.randint(100, 999)} ({rng.randint(1990, 2024)})."
+        for i in range(10)
+    ]
+    reserved = sum(len(part.encode('utf-8')) + 2 for part in image_markdown + references)
+
+    body = []
+    section = 0
+    while size + reserved < target_bytes:
+        if section < len(SECTIONS) and (not body or rng.random() < 0.15):
+            part = f"## {section + 1}. {SECTIONS[section]}"
+            section += 1
+        elif rng.random() < formula_density * 0.2:
+            part = rng.choice(DISPLAY_FORMULAS)
+        elif rng.random() < 0.03:
+            part = "| Sample | δ¹³C (‰) | Depth (m) |\n|---|---|---|\n" + "\n".join(
+                f"| S{i} | {rng.uniform(-8, 4):.2f} | {rng.uniform(0, 300):.1f} |" for i in range(5))
+        else:
+            part = _paragraph(rng, formula_density, cjk_ratio)
+        body.append(part)
+        size += len(part.encode('utf-8')) + 2
+
+    for i, image in enumerate(image_markdown):
+        body.insert((i + 1) * len(body) // (images + 1) + i, image)
+
+    return "\n\n".join(parts + body + references)
+
+
+if __name__ == "__main__":
+    kb = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    sys.stdout.write(generate_paper(int(kb * 1024)))
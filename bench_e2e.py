@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+端到端吞吐量基准测试（离线）
+在本机启动模拟 MinerU（提交/状态查询）、DeepLX（/translate）和 OpenAI 兼容（/v1/chat/completions）
+接口的桩服务，可配置延迟、错误率和周期性429突发；用合成论文语料驱动 /translate/submit，
+报告每分钟完成文档数、任务耗时 p50/p95 以及各后端的外部调用次数。
+
+用法: python bench_e2e.py --docs 20 --mode hybrid --deeplx-latency 0.2 --ai-latency 1.5 --burst-every 30
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_corpus import generate_paper
+
+
+class StubBehaviour:
+    """一个桩接口的延迟与故障模型"""
+
+    def __init__(self, latency=0.0, jitter=0.5, error_rate=0.0, burst_every=0, burst_length=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter  # 延迟在 latency×(1±jitter) 之间均匀分布
+        self.error_rate = error_rate
+        self.burst_every = burst_every  # 每隔多少秒出现一次429突发（0 表示不出现）
+        self.burst_length = burst_length  # 每次突发持续的秒数
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def delay(self):
+        with self.lock:
+            return max(self.latency * (1 + self.rng.uniform(-self.jitter, self.jitter)), 0)
+
+    def failure(self):
+        """返回本次请求应返回的错误状态码，正常时返回None"""
+        if self.burst_every and (time.time() - self.started) % self.burst_every < self.burst_length:
+            return 429
+        with self.lock:
+            if self.rng.random() < self.error_rate:
+                return 500
+        return None
+
+
+# 模拟翻译时保持原样的部分：图片、公式、占位符
+PROTECTED = re.compile(r'(!\[[^\]]*\]\([^)]*\)|\$\$.*?\$\$|\$[^$\n]*\$|<<<[A-Z_]+_\d+>>>)', re.DOTALL)
+
+
+def fake_translate(text):
+    """把英文单词替换为中文字符，使译文能通过完整性检查"""
+    parts = PROTECTED.split(text)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'[A-Za-z]{2,}', lambda m: '译' * max(1, len(m.group()) // 3), parts[i])
+    return ''.join(parts)
+
+
+class StubServers:
+    """本机桩服务：一个HTTP服务器按路径模拟 MinerU、DeepLX 和 AI 接口"""
+
+    def __init__(self, documents, mineru, deeplx, ai, parse_seconds=3.0):
+        self.documents = documents  # 文档ID -> Markdown，按上传内容中的标记查找
+        self.behaviours = {'mineru': mineru, 'deeplx': deeplx, 'ai': ai}
+        self.parse_seconds = parse_seconds
+        self.calls = Counter()  # (后端, 状态码) -> 次数
+        self.mineru_tasks = {}  # MinerU任务ID -> (完成时间, 文档ID)
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='bench-stubs', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    @property
+    def env(self):
+        """让被测应用指向桩服务的环境变量"""
+        return {
+            'MINERU_API_URL': f"{self.base_url}/v1/async/documents/parse",
+            'MINERU_TASK_URL': f"{self.base_url}/v1/task/{{task_id}}",
+            'DEEPLX_API_URL': f"{self.base_url}/translate",
+            'AI_TRANSLATE_API_URL': f"{self.base_url}/v1/chat/completions",
+        }
+
+    def _handler(self):
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, backend, status, body):
+                with stubs.lock:
+                    stubs.calls[(backend, status)] += 1
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _serve(self, backend, handle):
+                behaviour = stubs.behaviours[backend]
+                time.sleep(behaviour.delay())
+                status = behaviour.failure()
+                if status is not None:
+                    self._reply(backend, status, {'error': 'stub failure', 'message': f'HTTP {status}'})
+                else:
+                    self._reply(backend, 200, handle())
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def do_POST(self):
+                body = self._body()
+                if self.path.startswith('/v1/async/documents/parse'):
+                    self._serve('mineru', lambda: stubs._submit_parse(body))
+                elif self.path.startswith('/translate'):
+                    text = json.loads(body)['text']
+                    self._serve('deeplx', lambda: {'code': 200, 'data': fake_translate(text)})
+                elif self.path.startswith('/v1/chat/completions'):
+                    content = json.loads(body)['messages'][-1]['content']
+                    # 公式修正请求在正文前带有一行中文说明
+                    if content.startswith('请') and '：\n\n' in content:
+                        content = content.split('：\n\n', 1)[1]
+                    self._serve('ai', lambda: {
+                        'choices': [{'message': {'role': 'assistant', 'content': fake_translate(content)}}]
+                    })
+                else:
+                    self._reply('unknown', 404, {'error': 'not found'})
+
+            def do_GET(self):
+                if self.path.startswith('/v1/task/'):
+                    self._serve('mineru', lambda: stubs._parse_status(self.path.rsplit('/', 1)[-1]))
+                else:
+                    self._reply('unknown', 404, {'error': 'not found'})
+
+        return Handler
+
+    def _submit_parse(self, body):
+        match = re.search(rb'bench-doc ([0-9a-f]+)', body)
+        task_id = uuid.uuid4().hex[:12]
+        with self.lock:
+            self.mineru_tasks[task_id] = (time.time() + self.parse_seconds, match.group(1).decode() if match else None)
+        return {'task_id': task_id, 'status': 'pending'}
+
+    def _parse_status(self, task_id):
+        with self.lock:
+            ready_at, doc_id = self.mineru_tasks.get(task_id, (None, None))
+        if ready_at is None or doc_id not in self.documents:
+            return {'status': 'failed'}
+        if time.time() < ready_at:
+            return {'status': 'processing'}
+        return {'status': 'success', 'output': {'segments': [{'content': self.documents[doc_id]}]}}
+
+
+def percentile(values, q):
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)), 1) - 1]
+
+
+def build_corpus(count, kb, seed):
+    """生成长度、公式密度、图片数量和中文比例各不相同的论文"""
+    rng = random.Random(seed)
+    documents = {}
+    for i in range(count):
+        doc_id = f"{seed:04x}{i:04x}"
+        documents[doc_id] = generate_paper(
+            int(kb * 1024 * rng.uniform(0.5, 1.5)),
+            formula_density=rng.uniform(0.1, 0.6),
+            images=rng.randint(0, 4),
+            cjk_ratio=rng.choice([0, 0, 0.1]),
+            seed=seed * 1000 + i,
+        )
+    return documents
+
+
+def run(args):
+    documents = build_corpus(args.docs, args.doc_kb, args.seed)
+    stubs = StubServers(
+        documents,
+        mineru=StubBehaviour(args.mineru_latency, error_rate=args.mineru_error_rate, seed=args.seed),
+        deeplx=StubBehaviour(args.deeplx_latency, error_rate=args.deeplx_error_rate,
+                             burst_every=args.burst_every, burst_length=args.burst_length, seed=args.seed + 1),
+        ai=StubBehaviour(args.ai_latency, error_rate=args.ai_error_rate,
+                         burst_every=args.burst_every, burst_length=args.burst_length, seed=args.seed + 2),
+        parse_seconds=args.parse_seconds,
+    ).start()
+
+    # 被测应用指向桩服务，并使用独立的临时存储（不读写已有缓存）
+    workdir = tempfile.mkdtemp(prefix='bench_e2e_')
+    os.environ.update(stubs.env)
+    os.environ.update({
+        'TASK_STORE_PATH': os.path.join(workdir, 'tasks.sqlite3'),
+        'TRANSLATION_CACHE_ENABLED': 'false',
+        'PARSE_CACHE_ENABLED': 'false',
+        'CHECKPOINT_DIR': os.path.join(workdir, 'checkpoints'),
+        'TRACE_DIR': os.path.join(workdir, 'traces'),
+        'JANITOR_INTERVAL': '0',
+    })
+    log = open(os.path.join(workdir, 'app.log'), 'w', encoding='utf-8')
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log)
+
+    with output:
+        import app
+        client = app.app.test_client()
+        submitted = {}  # 任务ID -> 提交时间
+        finished = {}  # 任务ID -> (状态, 耗时)
+        rejected = 0
+        start = time.time()
+
+        for doc_id in documents:
+            while True:
+                pdf = b'%PDF-1.4\n% bench-doc ' + doc_id.encode() + b'\n' + os.urandom(64) + b'\n%%EOF\n'
+                response = client.post('/translate/submit', data={
+                    'file': (io.BytesIO(pdf), f'{doc_id}.pdf'),
+                    'translation_mode': args.mode,
+                }, content_type='multipart/form-data')
+                if response.status_code != 429:
+                    break
+                rejected += 1
+                time.sleep(int(response.headers.get('Retry-After', 1)))
+            submitted[response.get_json()['task_id']] = time.time()
+            if args.arrival_interval:
+                time.sleep(args.arrival_interval)
+
+        deadline = start + args.timeout
+        while len(finished) < len(submitted) and time.time() < deadline:
+            for task_id, submitted_at in submitted.items():
+                if task_id in finished:
+                    continue
+                status = client.get(f'/translate/status/{task_id}').get_json()['status']
+                if status in ('completed', 'failed', 'cancelled'):
+                    finished[task_id] = (status, time.time() - submitted_at)
+            time.sleep(0.2)
+        elapsed = time.time() - start
+        retries = {backend: app.OUTBOUND_RETRIES.value(backend=backend) for backend in ('ai', 'deeplx')}
+
+    stubs.stop()
+    log.close()
+
+    completed = [duration for status, duration in finished.values() if status == 'completed']
+    return {
+        'docs': len(documents),
+        'completed': len(completed),
+        'failed': sum(status != 'completed' for status, _ in finished.values()),
+        'unfinished': len(submitted) - len(finished),
+        'submit_rejected': rejected,
+        'elapsed_seconds': round(elapsed, 2),
+        'docs_per_minute': round(len(completed) / elapsed * 60, 2) if elapsed else 0,
+        'latency_p50': percentile(completed, 50),
+        'latency_p95': percentile(completed, 95),
+        'outbound_calls': {f"{backend} {status}": count for (backend, status), count in sorted(stubs.calls.items())},
+        'retries': retries,
+        'log': log.name,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端吞吐量基准测试（本机桩服务）')
+    parser.add_argument('--docs', type=int, default=10, help='文档数量')
+    parser.add_argument('--doc-kb', type=float, default=30, help='平均文档大小（KB）')
+    parser.add_argument('--mode', default='hybrid', choices=['hybrid', 'ai', 'deeplx'], help='翻译模式')
+    parser.add_argument('--arrival-interval', type=float, default=0, help='相邻两次提交的间隔（秒）')
+    parser.add_argument('--parse-seconds', type=float, default=3, help='MinerU解析耗时（秒）')
+    parser.add_argument('--mineru-latency', type=float, default=0.05, help='MinerU接口延迟（秒）')
+    parser.add_argument('--deeplx-latency', type=float, default=0.2, help='DeepLX接口延迟（秒）')
+    parser.add_argument('--ai-latency', type=float, default=1.0, help='AI接口延迟（秒）')
+    parser.add_argument('--mineru-error-rate', type=float, default=0, help='MinerU接口500错误比例')
+    parser.add_argument('--deeplx-error-rate', type=float, default=0, help='DeepLX接口500错误比例')
+    parser.add_argument('--ai-error-rate', type=float, default=0, help='AI接口500错误比例')
+    parser.add_argument('--burst-every', type=float, default=0, help='DeepLX/AI接口每隔多少秒出现一次429突发')
+    parser.add_argument('--burst-length', type=float, default=2, help='每次429突发持续秒数')
+    parser.add_argument('--timeout', type=float, default=900, help='等待所有任务完成的最长时间（秒）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--json', help='把结果写入JSON文件')
+    parser.add_argument('--verbose', action='store_true', help='显示应用日志（默认写入临时文件）')
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print("=" * 60)
+    print(f"端到端基准测试（{args.docs} 篇，模式 {args.mode}）")
+    print("=" * 60)
+    print(f"  完成: {result['completed']}，失败: {result['failed']}，未完成: {result['unfinished']}，"
+          f"提交被拒(429): {result['submit_rejected']}")
+    print(f"  总耗时: {result['elapsed_seconds']} 秒，吞吐量: {result['docs_per_minute']} 篇/分钟")
+    if result['completed']:
+        print(f"  任务耗时 p50: {result['latency_p50']:.1f} 秒，p95: {result['latency_p95']:.1f} 秒")
+    print("  外部调用:")
+    for key, count in result['outbound_calls'].items():
+        print(f"    {key}: {count}")
+    print(f"  应用层重试: {result['retries']}")
+    print(f"  应用日志: {result['log']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+文本处理热点函数的微基准测试
+用合成论文在 10KB / 1MB / 10MB 输入上计时 clean_unicode_characters、convert_latex_to_unicode、
+clean_html_tags、check_translation_completeness 和 markdown_to_pdf，并与 bench_baselines.json
+中保存的基准比较：
+  - 耗时超过基准 (1 + tolerance) 倍即判定为回归；
+  - 相邻两档输入之间的增长指数超过 MAX_SCALING_EXPONENT（接近平方增长）也判定为失败，
+    这一项与机器快慢无关。
+有失败项时退出码为1。
+
+用法: python bench_hotpaths.py [--sizes 10KB,1MB] [--functions markdown_to_pdf] [--update]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_corpus import generate_paper
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baselines.json')
+SIZES = {'10KB': 10 * 1024, '1MB': 1024 * 1024, '10MB': 10 * 1024 * 1024}
+MAX_SCALING_EXPONENT = 1.5  # 线性为1，平方为2
+MIN_SCALING_SECONDS = 0.05  # 较大一档耗时低于此值时计时噪声太大，不检查增长指数
+MIN_REGRESSION_SECONDS = 0.005  # 与基准相差不足此值时不算回归
+
+
+def build_benchmarks(app, document, translated, workdir):
+    """函数名 -> 无参调用"""
+    output_path = os.path.join(workdir, 'bench.pdf')
+    return {
+        'clean_unicode_characters': lambda: app.clean_unicode_characters(document),
+        # 绕过按公式字符串的缓存，测量词法/语法分析本身
+        'convert_latex_to_unicode': lambda: app.convert_latex_to_unicode.__wrapped__(document),
+        'clean_html_tags': lambda: app.clean_html_tags(translated),
+        'check_translation_completeness': lambda: app.check_translation_completeness(document, translated),
+        'markdown_to_pdf': lambda: app.markdown_to_pdf(translated, output_path),
+    }
+
+
+def measure(func, max_repeat=5, budget=1.0):
+    """取多次运行中的最短耗时；单次超过预算时只运行一次"""
+    best = float('inf')
+    spent = 0
+    for _ in range(max_repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        if spent > budget:
+            break
+    return best
+
+
+def scaling_exponent(small_size, small_time, large_size, large_time):
+    return math.log(large_time / small_time) / math.log(large_size / small_size)
+
+
+def load_baselines(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文本处理热点函数微基准测试')
+    parser.add_argument('--sizes', default=','.join(SIZES), help=f"输入大小，可选 {', '.join(SIZES)}")
+    parser.add_argument('--functions', help='只测试这些函数（逗号分隔）')
+    parser.add_argument('--formula-density', type=float, default=0.3, help='含公式的句子比例')
+    parser.add_argument('--images', type=int, default=4, help='图片数量')
+    parser.add_argument('--cjk-ratio', type=float, default=0.0, help='原文中文句子比例')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='允许比基准慢的比例')
+    parser.add_argument('--baselines', default=BASELINE_PATH, help='基准文件路径')
+    parser.add_argument('--update', action='store_true', help='用本次结果更新基准文件')
+    args = parser.parse_args()
+
+    import app
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"未知的输入大小: {', '.join(unknown)}")
+    sizes.sort(key=SIZES.get)
+
+    workdir = tempfile.mkdtemp(prefix='bench_hotpaths_')
+    results = {}  # 函数名 -> {大小: 秒}
+    for size in sizes:
+        document = generate_paper(SIZES[size], formula_density=args.formula_density, images=args.images,
+                                  cjk_ratio=args.cjk_ratio, seed=1)
+        # 模拟译文：同样结构、以中文为主，并带有AI常见的 <sup>/<sub> 标签
+        translated = generate_paper(SIZES[size], formula_density=args.formula_density, images=args.images,
+                                    cjk_ratio=0.9, seed=2).replace('$^{1,2}$', '<sup>1,2</sup>')
+        benchmarks = build_benchmarks(app, document, translated, workdir)
+        if args.functions:
+            wanted = {name.strip() for name in args.functions.split(',')}
+            benchmarks = {name: func for name, func in benchmarks.items() if name in wanted}
+        for name, func in benchmarks.items():
+            results.setdefault(name, {})[size] = measure(func)
+
+    baselines = load_baselines(args.baselines)
+    failures = []
+
+    print("=" * 78)
+    print(f"文本处理热点函数微基准（容差 {args.tolerance:.0%}，基准文件 {os.path.basename(args.baselines)}）")
+    print("=" * 78)
+    print(f"  {'函数':32} {'大小':>6} {'耗时(ms)':>10} {'基准(ms)':>10} {'增长指数':>8}")
+    for name, timings in results.items():
+        previous = None
+        for size in sizes:
+            if size not in timings:
+                continue
+            seconds = timings[size]
+            baseline = baselines.get('results', {}).get(name, {}).get(size)
+            exponent = None
+            if previous and seconds >= MIN_SCALING_SECONDS:
+                exponent = scaling_exponent(SIZES[previous[0]], max(previous[1], 1e-6), SIZES[size], seconds)
+            previous = (size, seconds)
+
+            status = '✅'
+            if baseline is not None and seconds > baseline * (1 + args.tolerance) \
+                    and seconds - baseline > MIN_REGRESSION_SECONDS:
+                status = '❌'
+                failures.append(f"{name} @ {size}: {seconds * 1000:.1f} ms，基准 {baseline * 1000:.1f} ms")
+            if exponent is not None and exponent > MAX_SCALING_EXPONENT:
+                status = '❌'
+                failures.append(f"{name} @ {size}: 增长指数 {exponent:.2f}（超过 {MAX_SCALING_EXPONENT}）")
+
+            print(f"{status} {name:32} {size:>6} {seconds * 1000:>10.1f} "
+                  f"{'-' if baseline is None else f'{baseline * 1000:.1f}':>10} "
+                  f"{'-' if exponent is None else f'{exponent:.2f}':>8}")
+
+    if args.update:
+        merged = baselines.get('results', {})
+        for name, timings in results.items():
+            merged.setdefault(name, {}).update({size: round(seconds, 6) for size, seconds in timings.items()})
+        with open(args.baselines, 'w', encoding='utf-8') as f:
+            json.dump({
+                'machine': f"{platform.machine()} {platform.processor() or platform.system()}".strip(),
+                'python': platform.python_version(),
+                'results': merged,
+            }, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"\n✓ 基准已更新: {args.baselines}")
+
+    if failures:
+        print(f"\n❌ {len(failures)} 项回归:")
+        for failure in failures:
+            print(f"  - {failure}")
+        if not args.update:
+            sys.exit(1)
+        return
+    print("\n✓ 没有发现回归")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,19 @@
 
 import os
 
+
+def to_bool(value, default=False):
+    """把表单值或环境变量解析为布尔值（true/1/yes/on 为真），未设置或为空时返回默认值"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if not value:
+        return default
+    return value in {"true", "1", "yes", "on"}
+
+
 class Config:
     """基础配置"""
     
@@ -17,10 +30,14 @@ class Config:
     ALLOWED_EXTENSIONS = {'pdf'}
     
     # MinerU API配置
-    MINERU_API_URL = "https://ai.gitee.com/v1/async/documents/parse"
+    MINERU_API_URL = os.environ.get('MINERU_API_URL') or "https://ai.gitee.com/v1/async/documents/parse"
+    MINERU_TASK_URL = os.environ.get('MINERU_TASK_URL') or "https://ai.gitee.com/v1/task/{task_id}"  # 任务状态查询地址
     MINERU_API_TOKEN = os.environ.get('MINERU_API_TOKEN') or "V5PWW7GYB8NOTZGQ6EEF4IJL3TIGXJF3YU2L371P"
     MINERU_TIMEOUT = 30 * 60  # 30分钟
     MINERU_RETRY_INTERVAL = 5  # 5秒
+    MINERU_POLL_MIN_INTERVAL = 2  # 状态轮询初始间隔（秒），随后按1.5倍退避
+    MINERU_POLL_MAX_INTERVAL = 20  # 状态轮询最大间隔（秒）
+    MINERU_POLL_TIMEOUT = 10 * 60  # 等待MinerU任务完成的总超时（秒）
     
     # MinerU 解析参数
     MINERU_PARAMS = {
@@ -36,8 +53,12 @@ class Config:
     # DeepLX API配置（快速翻译模式）
     DEEPLX_API_URL = os.environ.get('DEEPLX_API_URL') or "https://api.deeplx.org/7cLJfW49zRcsx7lZ9bKjAnoMIGDMXP67_cLUrShX2Ik/translate"
     DEEPLX_TIMEOUT = 30  # 30秒
-    DEEPLX_RATE_LIMIT = 0.3  # 每次翻译间隔0.3秒（加快速度）
+    DEEPLX_RATE_PER_SECOND = float(os.environ.get('DEEPLX_RATE_PER_SECOND') or 3)  # 令牌桶：每秒允许的请求数（<=0 表示不限流）
+    DEEPLX_BURST = int(os.environ.get('DEEPLX_BURST') or 3)  # 令牌桶：允许的突发请求数
+    DEEPLX_CONCURRENCY = int(os.environ.get('DEEPLX_CONCURRENCY') or 4)  # 同时进行的DeepLX请求数
     DEEPLX_MAX_RETRIES = 3  # DeepLX请求失败时的最大重试次数
+    DEEPLX_BATCH_MAX_CHARS = 4000  # 纯DeepLX模式：单个批量请求的最大字符数
+    DEEPLX_BATCH_MAX_LINES = 50  # 纯DeepLX模式：单个批量请求的最大行数
     
     # AI翻译API配置（OpenAI兼容接口）
     AI_TRANSLATE_API_URL = os.environ.get('AI_TRANSLATE_API_URL') or "https://b4u.qzz.io/v1/chat/completions"
@@ -47,6 +68,58 @@ class Config:
     AI_TRANSLATE_MAX_TOKENS = 16000  # 增加到16000以支持更长的输出
     AI_TRANSLATE_MAX_RETRIES = 3  # API请求失败时的最大重试次数
     AI_TRANSLATE_CHUNK_SIZE = 3000  # 分块翻译时每块的最大字符数（降低以提高稳定性）
+    AI_TRANSLATE_CONCURRENCY = int(os.environ.get('AI_TRANSLATE_CONCURRENCY') or 4)  # 分块并发翻译的最大线程数（按部署环境调整）
+    
+    # 出站HTTP连接池（MinerU / DeepLX / AI 接口共用，每个目标主机一个连接池）
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE') or 16)  # 每个主机保持的最大连接数
+    HTTP_KEEPALIVE = to_bool(os.environ.get('HTTP_KEEPALIVE'), True)  # 是否复用连接
+    HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES') or 2)  # 传输层（连接失败）重试次数
+    HTTP_RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF') or 0.5)  # 传输层重试退避系数（秒）
+    
+    # 翻译记忆（持久化缓存，相同原文直接复用译文）
+    TRANSLATION_CACHE_ENABLED = to_bool(os.environ.get('TRANSLATION_CACHE_ENABLED'), True)
+    TRANSLATION_CACHE_PATH = os.environ.get('TRANSLATION_CACHE_PATH') or '/tmp/translation_cache/memory.sqlite3'
+    TRANSLATION_CACHE_MAX_BYTES = int(os.environ.get('TRANSLATION_CACHE_MAX_MB') or 200) * 1024 * 1024  # 容量上限，超出后按LRU淘汰
+    
+    # MinerU解析结果缓存（相同PDF与解析参数再次提交时跳过解析）
+    PARSE_CACHE_ENABLED = to_bool(os.environ.get('PARSE_CACHE_ENABLED'), True)
+    PARSE_CACHE_DIR = os.environ.get('PARSE_CACHE_DIR') or '/tmp/mineru_cache'
+    PARSE_CACHE_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_MB') or 1000) * 1024 * 1024  # 缓存容量上限
+    PARSE_CACHE_TTL = int(os.environ.get('PARSE_CACHE_TTL_HOURS') or 7 * 24) * 3600  # 缓存有效期
+    
+    # 任务存储：sqlite（默认，同一主机上的多个 gunicorn worker 共享，重启不丢失）或 memory（单进程）
+    TASK_STORE = os.environ.get('TASK_STORE') or 'sqlite'
+    TASK_STORE_PATH = os.environ.get('TASK_STORE_PATH') or '/tmp/translation_tasks/tasks.sqlite3'
+    
+    # 任务检查点（进程重启后从已完成的块继续）
+    CHECKPOINT_ENABLED = to_bool(os.environ.get('CHECKPOINT_ENABLED'), True)
+    CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR') or '/tmp/translation_checkpoints'
+    
+    # 任务耗时跟踪（Chrome trace 格式，任务结束后写入文件）
+    TRACE_DIR = os.environ.get('TRACE_DIR') or '/tmp/translation_traces'
+    
+    # Prometheus 指标：各 worker 定期把计数写入共享目录，/metrics 合并所有 worker 的数据
+    METRICS_DIR = os.environ.get('METRICS_DIR') or '/tmp/translation_metrics'
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL') or 5)  # 写入间隔（秒）
+    
+    # 后台清理（结果文件、中间文件、调试日志、跟踪数据、任务记录）
+    JANITOR_INTERVAL = int(os.environ.get('JANITOR_INTERVAL') or 600)  # 清理间隔（秒），0 表示不清理
+    ARTIFACT_TTL = int(os.environ.get('ARTIFACT_TTL_HOURS') or 24) * 3600  # 文件保留时间
+    ARTIFACT_MAX_BYTES = int(os.environ.get('ARTIFACT_MAX_MB') or 2048) * 1024 * 1024  # 文件总大小上限，超出后删除最旧的文件
+    TASK_RECORD_TTL = int(os.environ.get('TASK_RECORD_TTL_HOURS') or 24) * 3600  # 已结束任务记录的保留时间
+    
+    # 任务队列（每个 worker 进程各自限制）
+    MAX_RUNNING_JOBS = int(os.environ.get('MAX_RUNNING_JOBS') or 2)  # 同时运行的翻译任务数
+    MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS') or 20)  # 排队上限，超出后返回429
+    JOB_DURATION_ESTIMATE = 300  # 尚无历史数据时假定的单个任务耗时（秒），用于估算开始时间
+    
+    # 任务状态推送（SSE）
+    TASK_EVENTS_CHECK_INTERVAL = 1  # 检查其他 worker 写入的状态变更的间隔（秒）
+    TASK_EVENTS_MAX_DURATION = int(os.environ.get('TASK_EVENTS_MAX_DURATION') or 60)  # 单条推送连接最长保持时间（秒）
+    # 每个 worker 同时保持的推送连接上限，超出后返回503，前端改用轮询；
+    # 默认为 gunicorn 线程数减4，留出线程处理提交和下载
+    TASK_EVENTS_MAX_STREAMS = int(os.environ.get('TASK_EVENTS_MAX_STREAMS')
+                                  or max(int(os.environ.get('GUNICORN_THREADS') or 32) - 4, 1))
     
     # 翻译参数
     TRANSLATION_SOURCE_LANG = "EN"  # 源语言：英文
@@ -3,12 +3,17 @@ Gunicorn configuration for production (Zeabur/Heroku-like).
 
 - Increases request timeout to avoid worker being killed while
   parsing/translating/AI-fixing long PDFs.
--
+- Preloads the app and warms the PDF font registry in the master so
+  workers share the parsed fonts.
+
 Usage: gunicorn -c gunicorn.conf.py app:app
 You can also set GUNICORN_CMD_ARGS="--config gunicorn.conf.py".
 """
 
 import os
+import shutil
+
+from config import Config, to_bool
 
 # Bind to the platform provided port or default 8000
 bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
@@ -17,8 +22,12 @@ bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
 worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
 
 # Concurrency (be conservative for small containers)
+# Each open /translate/events stream holds one (mostly idle) thread for up to
+# a minute, so there are enough threads for a few dozen browsers per worker;
+# TASK_EVENTS_MAX_STREAMS (default GUNICORN_THREADS - 4) keeps some free for
+# submit/download, and extra clients fall back to polling
 workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
-threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+threads = int(os.environ.get('GUNICORN_THREADS', '32'))
 
 # Avoid 30s default timeout — long translation jobs need more time
 timeout = int(os.environ.get('GUNICORN_TIMEOUT', '600'))
@@ -32,3 +41,33 @@ accesslog = '-'
 errorlog = '-'
 loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
 
+
+# Import the app in the master before forking so that fonts parsed during
+# warm-up are shared copy-on-write by all workers instead of being parsed
+# again in every worker (set GUNICORN_PRELOAD_APP=false to disable)
+preload_app = to_bool(os.environ.get('GUNICORN_PRELOAD_APP'), True)
+
+
+def when_ready(server):
+    # Runs in the master before workers are spawned
+    # Counter files left by the previous run would otherwise be added to
+    # this run's /metrics totals
+    shutil.rmtree(Config.METRICS_DIR, ignore_errors=True)
+    if preload_app:
+        from app import warm_up_pdf_fonts
+        warm_up_pdf_fonts()
+
+
+def post_worker_init(worker):
+    # Without preloading each worker warms its own registry at start-up,
+    # so the first PDF render does not pay for font discovery and parsing
+    from app import warm_up_pdf_fonts, resume_interrupted_tasks, janitor, metrics
+    warm_up_pdf_fonts()
+    # Re-queue jobs whose worker died mid-translation (each job is claimed
+    # by exactly one worker)
+    resume_interrupted_tasks()
+    # Periodically evict old results, debug dumps and finished task records
+    janitor.start()
+    # Write this worker's counters to METRICS_DIR so /metrics on any worker
+    # reports totals for all of them
+    metrics.start()
@@ -414,74 +414,45 @@ async function translatePDF() {
         const taskId = submitResult.task_id;
         console.log('任务已提交，ID:', taskId);
 
-        // 轮询任务状态
-        let pollCount = 0;
-        const maxPolls = 1800; // 最多轮询30分钟（每秒一次）
-
-        while (pollCount < maxPolls) {
-            await new Promise(resolve => setTimeout(resolve, 1000)); // 等待1秒
-            pollCount++;
-
-            try {
-                const statusResponse = await fetch(`/translate/status/${taskId}`);
-
-                if (!statusResponse.ok) {
-                    const error = await statusResponse.json();
-                    throw new Error(error.error || '查询状态失败');
-                }
-
-                const status = await statusResponse.json();
-
-                // 更新进度
-                progressFill.style.width = status.progress + '%';
-                progressText.textContent = status.message || '处理中...';
-
-                // 检查状态
-                if (status.status === 'completed') {
-                    // 下载文件
-                    progressText.textContent = '下载中...';
-
-                    const downloadResponse = await fetch(`/translate/download/${taskId}`);
-                    if (!downloadResponse.ok) {
-                        throw new Error('下载失败');
-                    }
-
-                    const blob = await downloadResponse.blob();
-                    const url = window.URL.createObjectURL(blob);
-                    const a = document.createElement('a');
-                    a.href = url;
-                    a.download = `translated_${selectedFile.name}`;
-                    document.body.appendChild(a);
-                    a.click();
-                    window.URL.revokeObjectURL(url);
-                    document.body.removeChild(a);
-
-                    // 显示成功
-                    progressSection.style.display = 'none';
-                    resultSection.style.display = 'block';
-
-                    setTimeout(() => {
-                        translateBtn.disabled = false;
-                        translateBtn.textContent = '重新翻译';
-                    }, 1000);
-                    return;
-
-                } else if (status.status === 'failed') {
-                    throw new Error(status.error || '翻译失败');
-                }
-                // 继续轮询 pending 或 processing 状态
-            } catch (pollError) {
-                // 网络错误时继续重试几次
-                if (pollCount % 5 === 0) {
-                    console.warn('轮询出错，继续重试...', pollError);
-                }
-                if (pollCount > 10 && pollError.message.includes('翻译失败')) {
-                    throw pollError;
-                }
-            }
+        // 等待任务完成（优先使用服务器推送，不支持或连接失败时回退到轮询）
+        const status = await waitForTask(taskId, (status) => {
+            progressFill.style.width = status.progress + '%';
+            progressText.textContent = status.message || '处理中...';
+        });
+
+        if (status.status === 'failed') {
+            throw new Error(status.error || '翻译失败');
+        }
+        if (status.status === 'cancelled') {
+            throw new Error('任务已取消');
         }
 
-        throw new Error('任务超时，请稍后重试');
+        // 下载文件
+        progressText.textContent = '下载中...';
+
+        const downloadResponse = await fetch(`/translate/download/${taskId}`);
+        if (!downloadResponse.ok) {
+            throw new Error('下载失败');
+        }
+
+        const blob = await downloadResponse.blob();
+        const url = window.URL.createObjectURL(blob);
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = `translated_${selectedFile.name}`;
+        document.body.appendChild(a);
+        a.click();
+        window.URL.revokeObjectURL(url);
+        document.body.removeChild(a);
+
+        // 显示成功
+        progressSection.style.display = 'none';
+        resultSection.style.display = 'block';
+
+        setTimeout(() => {
+            translateBtn.disabled = false;
+            translateBtn.textContent = '重新翻译';
+        }, 1000);
 
     } catch (error) {
         console.error('Error:', error);
@@ -492,6 +463,73 @@ async function translatePDF() {
     }
 }
 
+function isFinished(status) {
+    return ['completed', 'failed', 'cancelled'].includes(status.status);
+}
+
+// 等待任务结束，返回最终状态；每次状态变化时调用 onStatus
+function waitForTask(taskId, onStatus) {
+    if (!window.EventSource) {
+        return pollTaskStatus(taskId, onStatus);
+    }
+
+    return new Promise((resolve) => {
+        const source = new EventSource(`/translate/events/${taskId}`);
+        let errors = 0;
+
+        source.onmessage = (event) => {
+            errors = 0;
+            const status = JSON.parse(event.data);
+            onStatus(status);
+            if (isFinished(status)) {
+                source.close();
+                resolve(status);
+            }
+        };
+
+        // 服务器定期关闭连接后浏览器会自动重连；连续失败则改用轮询
+        source.onerror = () => {
+            errors++;
+            if (source.readyState === EventSource.CLOSED || errors >= 3) {
+                source.close();
+                console.warn('状态推送不可用，改用轮询');
+                resolve(pollTaskStatus(taskId, onStatus));
+            }
+        };
+    });
+}
+
+// 轮询任务状态（推送不可用时的回退方案）
+async function pollTaskStatus(taskId, onStatus) {
+    const maxPolls = 1800; // 最多轮询30分钟（每秒一次）
+
+    for (let pollCount = 1; pollCount <= maxPolls; pollCount++) {
+        await new Promise(resolve => setTimeout(resolve, 1000)); // 等待1秒
+
+        try {
+            const statusResponse = await fetch(`/translate/status/${taskId}`);
+
+            if (!statusResponse.ok) {
+                const error = await statusResponse.json();
+                throw new Error(error.error || '查询状态失败');
+            }
+
+            const status = await statusResponse.json();
+            onStatus(status);
+            if (isFinished(status)) {
+                return status;
+            }
+        } catch (pollError) {
+            // 网络错误时继续重试
+            if (pollCount % 5 === 0) {
+                console.warn('轮询出错，继续重试...', pollError);
+            }
+        }
+    }
+
+    throw new Error('任务超时，请稍后重试');
+}
+
 // 显示消息
 function showMessage(message, type = 'info') {
     // 创建toast元素
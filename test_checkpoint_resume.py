@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+测试任务检查点与重启恢复
+验证进程退出时未完成的任务被重新排队，并跳过检查点中已完成的块
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+from config import Config
+
+
+class InlineQueue:
+    """提交后立即在当前线程执行的任务队列"""
+
+    def submit(self, task_id, fn, *args):
+        fn(*args)
+
+
+def _create(task_id, owner):
+    now = datetime.now().isoformat()
+    app.task_store.create(task_id, {
+        'status': 'processing', 'progress': 60, 'message': '正在翻译内容...', 'error': None,
+        'owner': owner, 'created_at': now, 'updated_at': now,
+    })
+
+
+def test_resume_from_first_missing_chunk():
+    """测试恢复的任务读取已保存的Markdown和翻译块，只翻译缺失的块"""
+    translated = []
+
+    def fake_deeplx(text, **kwargs):
+        translated.append(text)
+        return f"[译]{text}"
+
+    original = (app.task_store, app.job_queue, app.translate_with_deeplx, app.markdown_to_pdf,
+                Config.CHECKPOINT_DIR, Config.DEEPLX_BATCH_MAX_LINES)
+    app.task_store = app.MemoryTaskStore()
+    app.job_queue = InlineQueue()
+    app.translate_with_deeplx = fake_deeplx
+    app.markdown_to_pdf = lambda text, path: None
+    Config.CHECKPOINT_DIR = tempfile.mkdtemp()
+    Config.DEEPLX_BATCH_MAX_LINES = 1
+    try:
+        job = {
+            'upload_path': '/nonexistent/paper.pdf', 'original_filename': 'paper.pdf',
+            'mineru_options': {}, 'translate_api_url': None, 'translate_api_model': None,
+            'translation_mode': 'deeplx', 'user_credentials': False,
+        }
+        # 上次运行的进程已退出：解析结果和第一块译文已保存
+        _create('crashed', owner='999999:1')
+        checkpoint = app.TaskCheckpoint('crashed')
+        checkpoint.save_job(job)
+        checkpoint.save_markdown("First line\nSecond line")
+        checkpoint.save_chunk('line_batch', "First line", json.dumps(["[旧译]First line"], ensure_ascii=False))
+
+        # 仍在运行的进程拥有的任务不应被接管
+        _create('alive', owner=app._process_identity())
+        # 没有作业参数的任务无法恢复
+        _create('lost', owner='999998:1')
+        # 使用了用户密钥的任务（密钥未保存）无法恢复
+        _create('keyed', owner='999997:1')
+        app.TaskCheckpoint('keyed').save_job(dict(job, user_credentials=True))
+        app.TaskCheckpoint('keyed').save_markdown("Keyed line")
+
+        resumed = app.resume_interrupted_tasks()
+        crashed, alive, lost, keyed = (app.task_store.get(t) for t in ('crashed', 'alive', 'lost', 'keyed'))
+        checkpoint_left = os.path.exists(checkpoint.directory)
+    finally:
+        (app.task_store, app.job_queue, app.translate_with_deeplx, app.markdown_to_pdf,
+         Config.CHECKPOINT_DIR, Config.DEEPLX_BATCH_MAX_LINES) = original
+
+    print("=" * 60)
+    print("测试检查点恢复")
+    print("=" * 60)
+    print(f"  恢复任务数: {resumed}，重新翻译: {translated}")
+    print(f"  crashed: {crashed['status']}，alive: {alive['status']}，lost: {lost['status']}")
+    assert resumed == 1
+    assert translated == ["Second line"]
+    assert crashed['status'] == 'completed'
+    assert alive['status'] == 'processing'
+    assert lost['status'] == 'failed'
+    assert keyed['status'] == 'failed' and '密钥' in keyed['error']
+    assert not checkpoint_left
+
+
+def test_submit_does_not_persist_credentials():
+    """测试提交时保存的作业参数不包含用户提供的密钥"""
+    class RecordingQueue:
+        def is_full(self):
+            return False
+
+        def submit(self, task_id, fn, *args):
+            self.task_id = task_id
+
+    original = (app.task_store, app.job_queue, Config.CHECKPOINT_DIR)
+    app.task_store = app.MemoryTaskStore()
+    app.job_queue = RecordingQueue()
+    Config.CHECKPOINT_DIR = tempfile.mkdtemp()
+    try:
+        response = app.app.test_client().post('/translate/submit', data={
+            'file': (io.BytesIO(b'%PDF-1.4 credentials'), 'paper.pdf'),
+            'parse_api_token': 'mineru-secret', 'translate_api_key': 'sk-secret',
+        }, content_type='multipart/form-data')
+        task_id = response.get_json()['task_id']
+        with open(os.path.join(Config.CHECKPOINT_DIR, task_id, 'job.json'), encoding='utf-8') as f:
+            saved = f.read()
+        job = app.TaskCheckpoint(task_id).load_job()
+        os.remove(job['upload_path'])
+    finally:
+        app.task_store, app.job_queue, Config.CHECKPOINT_DIR = original
+
+    print(f"\n保存的作业参数: {saved}")
+    assert 'secret' not in saved
+    assert job['user_credentials'] is True
+
+
+if __name__ == "__main__":
+    test_resume_from_first_missing_chunk()
+    test_submit_does_not_persist_credentials()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+测试分块并发翻译
+验证并发执行后结果仍按原文顺序重组
+"""
+
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+from config import Config
+
+
+def _fake_translate(text, **kwargs):
+    """模拟耗时不一的翻译接口"""
+    time.sleep(random.uniform(0, 0.05))
+    return f"[译]{text}"
+
+
+def test_ai_chunks_keep_order():
+    """测试AI模式分块并发后顺序不变"""
+    print("=" * 60)
+    print("测试AI模式分块并发翻译")
+    print("=" * 60)
+
+    paragraphs = [f"Paragraph {i} " + "word " * 120 for i in range(30)]
+    markdown = "\n\n".join(paragraphs)
+
+    original_translate = app.translate_with_ai
+    original_concurrency = Config.AI_TRANSLATE_CONCURRENCY
+    app.translate_with_ai = _fake_translate
+    Config.AI_TRANSLATE_CONCURRENCY = 8
+    try:
+        start = time.time()
+        result = app.translate_markdown_content_with_ai(markdown)
+        elapsed = time.time() - start
+    finally:
+        app.translate_with_ai = original_translate
+        Config.AI_TRANSLATE_CONCURRENCY = original_concurrency
+
+    chunks = app._split_markdown_chunks(markdown, Config.AI_TRANSLATE_CHUNK_SIZE)
+    expected = "\n\n".join(f"[译]{chunk}" for chunk in chunks)
+
+    print(f"  分块数: {len(chunks)}")
+    print(f"  耗时: {elapsed:.2f} 秒")
+    print(f"  顺序: {'✅ 正确' if result == expected else '❌ 错乱'}")
+    assert result == expected
+
+
+def test_split_matches_serial_chunking():
+    """测试超大段落的二次分割"""
+    long_para = ". ".join(f"Sentence number {i} is here" for i in range(400))
+    chunks = app._split_markdown_chunks("Intro\n\n" + long_para + "\n\nOutro", 3000)
+
+    print(f"\n超大段落分块数: {len(chunks)}")
+    assert chunks[0] == "Intro"
+    assert chunks[-1] == "Outro"
+    assert all(len(chunk) <= 3000 for chunk in chunks)
+
+
+def test_token_bucket_rate():
+    """测试令牌桶限流速率"""
+    bucket = app.TokenBucket(rate=20, burst=5)
+    start = time.time()
+    for _ in range(25):
+        bucket.acquire()
+    elapsed = time.time() - start
+
+    # 前5个令牌为突发额度，剩余20个按每秒20个补充，约需1秒
+    print(f"\n令牌桶获取25个令牌耗时: {elapsed:.2f} 秒")
+    assert 0.8 <= elapsed <= 1.5
+
+
+def test_hybrid_deeplx_keeps_image_position():
+    """测试混合模式并发DeepLX后图片位置不变"""
+    paragraphs = []
+    for i in range(12):
+        paragraphs.append(f"Paragraph {i} " + "text " * 400)
+        if i % 4 == 1:
+            paragraphs.append(f"![fig{i}](data:image/png;base64,AAAA)")
+    markdown = "\n\n".join(paragraphs)
+
+    original_deeplx = app.translate_with_deeplx
+    original_fix = app.fix_formulas_with_ai
+    app.translate_with_deeplx = _fake_translate
+    app.fix_formulas_with_ai = lambda text, **kwargs: text
+    try:
+        result = app.translate_markdown_hybrid(markdown)
+    finally:
+        app.translate_with_deeplx = original_deeplx
+        app.fix_formulas_with_ai = original_fix
+
+    order = re.findall(r'Paragraph \d+|!\[fig\d+\]', result)
+    expected = re.findall(r'Paragraph \d+|!\[fig\d+\]', markdown)
+    print(f"\n混合模式段落顺序: {'✅ 正确' if order == expected else '❌ 错乱'}")
+    assert order == expected
+
+
+def test_hybrid_pipeline_overlaps_stages():
+    """测试混合模式DeepLX与公式修正两个阶段重叠执行"""
+    # 带有HTML上标的段落才会进入公式修正
+    markdown = "\n\n".join(f"Paragraph {i}<sup>2</sup> " + "text " * 900 for i in range(8))
+
+    def slow_stage(text, **kwargs):
+        time.sleep(0.1)
+        return text
+
+    original_deeplx = app.translate_with_deeplx
+    original_fix = app.fix_formulas_with_ai
+    original_concurrency = (Config.DEEPLX_CONCURRENCY, Config.AI_TRANSLATE_CONCURRENCY)
+    app.translate_with_deeplx = slow_stage
+    app.fix_formulas_with_ai = slow_stage
+    Config.DEEPLX_CONCURRENCY = Config.AI_TRANSLATE_CONCURRENCY = 1
+    try:
+        start = time.time()
+        result = app.translate_markdown_hybrid(markdown)
+        elapsed = time.time() - start
+    finally:
+        app.translate_with_deeplx = original_deeplx
+        app.fix_formulas_with_ai = original_fix
+        Config.DEEPLX_CONCURRENCY, Config.AI_TRANSLATE_CONCURRENCY = original_concurrency
+
+    # 串行需要 8×0.1 + 8×0.1 = 1.6 秒，流水线约 0.9 秒
+    print(f"\n流水线耗时: {elapsed:.2f} 秒（串行约 1.6 秒）")
+    assert result == markdown
+    assert elapsed < 1.3
+
+
+def test_deeplx_line_batching():
+    """测试纯DeepLX模式的行批量翻译，以及行被合并又拆分（行数不变）时按编号标记发现并拆分重试"""
+    lines = []
+    for i in range(120):
+        lines.append(f"Line {i} text")
+        if i % 10 == 0:
+            lines.extend(["", "```", f"![img{i}](a.png)"])
+    markdown = "\n".join(lines)
+    requests_sent = []
+
+    def fake_deeplx(text, **kwargs):
+        requests_sent.append(text)
+        translated = re.sub(r'Line (\d+) text', r'[译]Line \1 text', text)
+        # 模拟DeepLX把第37行并入上一行、又把第38行拆成两行：总行数不变，只有编号标记能发现错位
+        translated, merged = re.subn(r'\n(?:<<<LINE_\d+>>> )?(\[译\]Line 37 text)', r' \1', translated)
+        if merged:
+            translated = translated.replace("[译]Line 38 text", "[译]Line 38\ntext")
+        return translated
+
+    original_deeplx = app.translate_with_deeplx
+    app.translate_with_deeplx = fake_deeplx
+    try:
+        result = app.translate_markdown_content(markdown)
+    finally:
+        app.translate_with_deeplx = original_deeplx
+
+    expected = "\n".join(
+        line if not line.strip() or line.startswith(("```", "![")) else f"[译]{line}"
+        for line in lines
+    )
+    print(f"\n行批量翻译: {len(requests_sent)} 个请求（逐行需要 120 个）")
+    assert result == expected
+    assert len(requests_sent) < 30
+
+
+def test_deeplx_line_with_newline_in_translation():
+    """测试单行译文中含有换行时，后续行不错位也不丢失"""
+    markdown = "Alpha SPLIT one\nBeta two\nGamma three"
+
+    def fake_deeplx(text, **kwargs):
+        # 译文中带有换行
+        return "\n".join(line.replace("SPLIT", "x\ny") for line in text.split("\n"))
+
+    original_deeplx = app.translate_with_deeplx
+    app.translate_with_deeplx = fake_deeplx
+    token = app.current_task_id.set('line-newline')
+    original_checkpoint_dir = Config.CHECKPOINT_DIR
+    Config.CHECKPOINT_DIR = tempfile.mkdtemp()
+    try:
+        result = app.translate_markdown_content(markdown)
+    finally:
+        app.current_task_id.reset(token)
+        app.translate_with_deeplx = original_deeplx
+        Config.CHECKPOINT_DIR = original_checkpoint_dir
+
+    print(f"\n含换行的单行译文: {result!r}")
+    assert result == "Alpha x\ny one\nBeta two\nGamma three"
+
+
+def test_progress_callback_reports_chunks_and_rate():
+    """测试翻译函数通过进度回调报告块数、吞吐量和剩余时间"""
+    markdown = "\n\n".join(f"Paragraph {i}<sup>2</sup> " + "text " * 900 for i in range(6))
+    snapshots = []
+
+    original_deeplx = app.translate_with_deeplx
+    original_fix = app.fix_formulas_with_ai
+    app.translate_with_deeplx = _fake_translate
+    app.fix_formulas_with_ai = _fake_translate
+    try:
+        app.translate_markdown_hybrid(markdown, progress_callback=snapshots.append)
+    finally:
+        app.translate_with_deeplx = original_deeplx
+        app.fix_formulas_with_ai = original_fix
+
+    final = snapshots[-1]
+    print(f"\n进度快照 {len(snapshots)} 次，最终: {final}")
+    assert final['chunks_done'] == final['chunks_total'] == 12
+    assert final['eta_seconds'] == 0
+    assert set(final['stages']) == {'deeplx', 'fix'}
+    assert all(stage['chars_per_sec'] > 0 for stage in final['stages'].values())
+    done = [snapshot['stages']['deeplx']['chunks_done'] for snapshot in snapshots]
+    assert done == sorted(done)
+
+
+def test_progress_reporter_drops_stale_snapshots():
+    """测试多个线程并发报告进度时，较旧的快照不会覆盖较新的进度"""
+    original_store = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    try:
+        app.task_store.create('p', {'status': 'processing', 'progress': 50})
+        report = app._translation_progress_reporter('p')
+        snapshots = [{'chunks_done': done, 'chunks_total': 40, 'eta_seconds': 40 - done, 'stages': {}}
+                     for done in range(41)]
+        random.Random(3).shuffle(snapshots)
+        threads = [threading.Thread(target=report, args=(snapshot,)) for snapshot in snapshots]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        task = app.task_store.get('p')
+    finally:
+        app.task_store = original_store
+
+    print(f"\n并发报告后: 进度 {task['progress']}，{task['message']}")
+    assert task['progress'] == 80
+    assert task['translation']['chunks_done'] == 40
+
+
+def test_hybrid_protects_math_from_deeplx():
+    """测试混合模式公式不经过DeepLX，恢复为公式原文；能完整转换的公式无需AI修正，分式交给AI；占位符丢失时回退并修正"""
+    markdown = ("The $\\delta^{13}\\mathrm{C}$ excursion lasted $\\sim 7$ Myr.\n\n"
+                "$$\\mathrm{SO}_4^{2-}$$\n\n"
+                "Samples cost $5 and $10 each.")
+    fraction = "The ratio $\\frac{R_{s}}{R_{std}}$ was measured."
+    sent, fixed = [], []
+
+    def fake_deeplx(text, **kwargs):
+        sent.append(text)
+        return f"[译]{text}"
+
+    def fake_fix(text, **kwargs):
+        fixed.append(text)
+        return text
+
+    def mangling_deeplx(text, **kwargs):
+        sent.append(text)
+        return text.replace('MATH_PLACEHOLDER', '数学占位符')
+
+    original_deeplx = app.translate_with_deeplx
+    original_fix = app.fix_formulas_with_ai
+    app.translate_with_deeplx = fake_deeplx
+    app.fix_formulas_with_ai = fake_fix
+    try:
+        result = app.translate_markdown_hybrid(markdown)
+        protected_sent, protected_fixed = list(sent), list(fixed)
+
+        fraction_result = app.translate_markdown_hybrid(fraction)
+        fraction_fixed = list(fixed)
+
+        # 模拟DeepLX把占位符翻译掉：回退为直接翻译原文，并整块交给AI修正
+        sent.clear()
+        fixed.clear()
+        app.translate_with_deeplx = mangling_deeplx
+        fallback = app.translate_markdown_hybrid(markdown)
+    finally:
+        app.translate_with_deeplx = original_deeplx
+        app.fix_formulas_with_ai = original_fix
+
+    print(f"\n发送给DeepLX: {protected_sent}")
+    print(f"公式保护结果: {result!r}")
+    assert '<<<MATH_PLACEHOLDER_0>>>' in protected_sent[0]
+    assert '\\delta' not in protected_sent[0] and '$5 and $10' in protected_sent[0]
+    # 公式原样恢复，生成PDF时再转换
+    assert '$\\delta^{13}\\mathrm{C}$' in result and '$$\\mathrm{SO}_4^{2-}$$' in result
+    assert '$5 and $10' in result
+    assert protected_fixed == []
+    assert '$\\frac{R_{s}}{R_{std}}$' in fraction_result
+    assert len(fraction_fixed) == 1 and '\\frac' in fraction_fixed[0]
+    assert len(sent) == 2 and '$\\delta' in sent[1]
+    assert '$\\delta^{13}\\mathrm{C}$' in fallback
+    assert len(fixed) == 1 and '$\\delta' in fixed[0]
+
+if __name__ == "__main__":
+    test_ai_chunks_keep_order()
+    test_split_matches_serial_chunking()
+    test_token_bucket_rate()
+    test_hybrid_deeplx_keeps_image_position()
+    test_hybrid_pipeline_overlaps_stages()
+    test_deeplx_line_batching()
+    test_deeplx_line_with_newline_in_translation()
+    test_progress_callback_reports_chunks_and_rate()
+    test_progress_reporter_drops_stale_snapshots()
+    test_hybrid_protects_math_from_deeplx()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+测试后台清理
+验证过期文件、超出配额的旧文件和已结束的任务记录被删除，进行中任务的文件保留
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+
+
+def _touch(directory, name, size, age):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_sweep_ttl_quota_and_records():
+    """测试按TTL、磁盘配额和任务记录有效期清理"""
+    uploads, debug, checkpoints = tempfile.mkdtemp(), tempfile.mkdtemp(), tempfile.mkdtemp()
+    hour = 3600
+    expired = _touch(uploads, 'old1_translated_a.pdf', 100, 30 * hour)
+    debug_dump = _touch(debug, 'mineru_result_x.json', 100, 30 * hour)
+    oldest = _touch(uploads, 'markdown_m1.md', 600, 5 * hour)
+    newer = _touch(uploads, 'translated_m2.md', 600, 2 * hour)
+    recent = _touch(uploads, 'fresh_upload.pdf', 600, 60)
+    active_upload = _touch(uploads, 'live_paper.pdf', 100, 30 * hour)
+    os.makedirs(os.path.join(checkpoints, 'gone'))
+    stale = time.time() - 30 * hour
+    os.utime(os.path.join(checkpoints, 'gone'), (stale, stale))
+
+    original_store = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    try:
+        old = (datetime.now() - timedelta(hours=30)).isoformat()
+        now = datetime.now().isoformat()
+        app.task_store.create('live', {'status': 'processing', 'updated_at': old})
+        app.task_store.create('done_old', {'status': 'completed', 'updated_at': old, 'result_path': expired})
+        app.task_store.create('done_new', {'status': 'completed', 'updated_at': now})
+        app.task_store.claim_job('job-key', 'done_old')
+
+        janitor = app.Janitor([uploads, debug], checkpoints, ttl=24 * hour, max_bytes=1300,
+                              task_ttl=24 * hour, interval=0)
+        removed_files, removed_tasks = janitor.sweep()
+        remaining = {task_id for task_id in ('live', 'done_old', 'done_new') if app.task_store.get(task_id)}
+        jobs = dict(app.task_store.jobs)
+    finally:
+        app.task_store = original_store
+
+    print("=" * 60)
+    print("测试后台清理")
+    print("=" * 60)
+    print(f"  删除文件 {removed_files} 个，任务记录 {removed_tasks} 条，保留任务: {sorted(remaining)}")
+    assert not os.path.exists(expired) and not os.path.exists(debug_dump)
+    # 配额1300字节：删除最旧的文件直到不超过配额，最近修改的文件不参与淘汰
+    assert not os.path.exists(oldest)
+    assert os.path.exists(newer) and os.path.exists(recent)
+    assert os.path.exists(active_upload)
+    assert not os.path.exists(os.path.join(checkpoints, 'gone'))
+    assert remaining == {'live', 'done_new'}
+    assert jobs == {}
+
+
+def test_owner_finish_ends_followers():
+    """测试被复用的作业结束时，等待其结果的任务记录也进入相同的结束状态"""
+    original_store = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    try:
+        now = datetime.now().isoformat()
+        app.task_store.create('owner', {'status': 'processing', 'updated_at': now})
+        app.task_store.create('follower', {'status': 'pending', 'updated_at': now, 'attached_to': 'owner'})
+        app.task_store.create('left', {'status': 'cancelled', 'updated_at': now})
+        app.update_task('owner', status='failed', error='PDF解析失败')
+        follower = app.task_store.get('follower')
+        left = app.task_store.get('left')
+    finally:
+        app.task_store = original_store
+
+    print(f"\n作业失败后复用任务的状态: {follower['status']}")
+    assert follower['status'] == 'failed' and follower['attached_to'] == 'owner'
+    assert left['status'] == 'cancelled'
+
+
+def test_sweep_owner_with_followers():
+    """测试复用作业的任务记录与作业一起删除，仍有任务等待的作业不被删除"""
+    results = tempfile.mkdtemp()
+    hour = 3600
+    shared_result = _touch(results, 'shared_translated.pdf', 100, 60)
+
+    original_store = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    try:
+        old = (datetime.now() - timedelta(hours=30)).isoformat()
+        now = datetime.now().isoformat()
+        app.task_store.create('shared', {'status': 'completed', 'updated_at': old, 'result_path': shared_result})
+        app.task_store.create('shared_f1', {'status': 'completed', 'updated_at': old, 'attached_to': 'shared'})
+        app.task_store.create('shared_f2', {'status': 'completed', 'updated_at': now, 'attached_to': 'shared'})
+        app.task_store.create('awaited', {'status': 'processing', 'updated_at': old})
+        app.task_store.create('waiting', {'status': 'pending', 'updated_at': old, 'attached_to': 'awaited'})
+        app.task_store.create('recent', {'status': 'completed', 'updated_at': now})
+        app.task_store.create('recent_f', {'status': 'completed', 'updated_at': old, 'attached_to': 'recent'})
+
+        janitor = app.Janitor([], tempfile.mkdtemp(), ttl=24 * hour, max_bytes=1 << 30,
+                              task_ttl=24 * hour, interval=0)
+        _, removed_tasks = janitor.sweep()
+        remaining = set(app.task_store.tasks)
+    finally:
+        app.task_store = original_store
+
+    print(f"\n删除任务记录 {removed_tasks} 条，保留: {sorted(remaining)}")
+    assert removed_tasks == 3
+    assert not os.path.exists(shared_result)
+    assert remaining == {'awaited', 'waiting', 'recent', 'recent_f'}
+
+
+def test_sweep_settles_followers_of_finished_job():
+    """测试作业已结束但仍显示等待中的复用任务被补上结束状态，并与作业一起删除"""
+    original_store = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    try:
+        old = (datetime.now() - timedelta(days=3)).isoformat()
+        app.task_store.create('done', {'status': 'failed', 'updated_at': old, 'error': 'PDF解析失败'})
+        app.task_store.create('stuck', {'status': 'pending', 'updated_at': old, 'attached_to': 'done'})
+        app.task_store.create('orphan', {'status': 'pending', 'updated_at': old, 'attached_to': 'gone'})
+
+        janitor = app.Janitor([], tempfile.mkdtemp(), ttl=24 * 3600, max_bytes=1 << 30,
+                              task_ttl=24 * 3600, interval=0)
+        first = janitor.sweep()
+        orphan = app.task_store.get('orphan')
+        remaining = set(app.task_store.tasks)
+    finally:
+        app.task_store = original_store
+
+    print(f"\n第一次清理: {first}，剩余: {sorted(remaining)}，孤立任务: {orphan}")
+    assert first[1] == 2 and remaining == {'orphan'}
+    assert orphan['status'] == 'failed' and orphan['error'] == '关联的翻译任务不存在'
+
+
+if __name__ == "__main__":
+    test_sweep_ttl_quota_and_records()
+    test_owner_finish_ends_followers()
+    test_sweep_owner_with_followers()
+    test_sweep_settles_followers_of_finished_job()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试相同上传的作业合并
+验证相同文件与配置只执行一次，各提交者仍有独立的任务ID和状态
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+
+
+class RecordingQueue:
+    """只记录提交、不执行的任务队列"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def is_full(self):
+        return False
+
+    def submit(self, task_id, fn, *args):
+        self.submitted.append(task_id)
+
+
+def _submit(client, content, **form):
+    data = {'file': (io.BytesIO(content), 'paper.pdf'), 'translation_mode': 'deeplx'}
+    data.update(form)
+    return client.post('/translate/submit', data=data, content_type='multipart/form-data').get_json()['task_id']
+
+
+def test_identical_uploads_share_one_job():
+    """测试相同上传复用排队中和已完成的作业，失败后重新执行"""
+    original = (app.task_store, app.job_queue)
+    app.task_store = app.SQLiteTaskStore(os.path.join(tempfile.mkdtemp(), 'tasks.sqlite3'))
+    app.job_queue = RecordingQueue()
+    client = app.app.test_client()
+    try:
+        first = _submit(client, b'%PDF-1.4 paper')
+        second = _submit(client, b'%PDF-1.4 paper')
+        other_mode = _submit(client, b'%PDF-1.4 paper', translation_mode='ai')
+        other_file = _submit(client, b'%PDF-1.4 another')
+
+        app.update_task(first, status='processing', progress=60, message='正在翻译内容...')
+        second_status = client.get(f'/translate/status/{second}').get_json()
+
+        result_path = os.path.join(tempfile.mkdtemp(), 'result.pdf')
+        with open(result_path, 'wb') as f:
+            f.write(b'%PDF result')
+        app.update_task(first, status='completed', progress=100, result_path=result_path,
+                        result_filename='translated_paper.pdf')
+        third = _submit(client, b'%PDF-1.4 paper')
+        download = client.get(f'/translate/download/{third}')
+        third_record = app.task_store.get(third)
+        second_record = app.task_store.get(second)
+
+        os.remove(result_path)
+        fourth = _submit(client, b'%PDF-1.4 paper')
+        submitted = list(app.job_queue.submitted)
+    finally:
+        # 队列未实际执行，清理留下的上传文件
+        for task_id in app.job_queue.submitted:
+            path = os.path.join(app.app.config['UPLOAD_FOLDER'], f"{task_id}_paper.pdf")
+            if os.path.exists(path):
+                os.remove(path)
+        app.task_store, app.job_queue = original
+
+    print("=" * 60)
+    print("测试相同上传的作业合并")
+    print("=" * 60)
+    print(f"  实际执行: {submitted}")
+    print(f"  复用任务状态: {second_status}")
+    assert len({first, second, third, fourth}) == 4
+    assert submitted == [first, other_mode, other_file, fourth]
+    assert second_status['task_id'] == second
+    assert second_status['status'] == 'processing' and second_status['progress'] == 60
+    assert second_status['attached_to'] == first
+    assert download.status_code == 200 and download.data == b'%PDF result'
+    # 关联到已完成作业的任务自身记录也是结束状态，不会一直停在等待中
+    assert third_record['status'] == 'completed' and third_record['result_path'] == result_path
+    assert second_record['status'] == 'completed'
+
+
+if __name__ == "__main__":
+    test_identical_uploads_share_one_job()
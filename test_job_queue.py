@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+测试有界任务队列
+验证排队位置、预计开始时间以及队列满时的准入控制
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+
+
+def test_queue_positions_and_admission():
+    """测试排队位置写入任务记录，队列满时拒绝并给出重试时间"""
+    original_store = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    queue = app.JobQueue(max_running=1, max_queued=2, default_duration=60)
+    release = threading.Event()
+    started = []
+
+    def job(name):
+        started.append(name)
+        release.wait(5)
+
+    try:
+        for name in ('a', 'b', 'c'):
+            app.task_store.create(name, {'status': 'pending', 'created_at': datetime.now().isoformat()})
+        queue.submit('a', job, 'a')
+        while not started:
+            time.sleep(0.01)
+        queue.submit('b', job, 'b')
+        queue.submit('c', job, 'c')
+
+        rejected = None
+        try:
+            queue.submit('d', job, 'd')
+        except app.JobQueueFull as e:
+            rejected = e
+
+        b, c = app.task_store.get('b'), app.task_store.get('c')
+        release.set()
+        while len(started) < 3:
+            time.sleep(0.01)
+    finally:
+        release.set()
+        app.task_store = original_store
+
+    print("=" * 60)
+    print("测试有界任务队列")
+    print("=" * 60)
+    print(f"  b: 位置 {b['queue_position']}，预计开始 {b['estimated_start_at']}")
+    print(f"  c: 位置 {c['queue_position']}，预计开始 {c['estimated_start_at']}")
+    print(f"  队列满时建议重试: {rejected and rejected.retry_after} 秒")
+    assert (b['queue_position'], c['queue_position']) == (1, 2)
+    assert b['estimated_start_at'] < c['estimated_start_at']
+    assert rejected is not None and 1 <= rejected.retry_after <= 60
+    assert started == ['a', 'b', 'c']
+
+
+def test_submit_route_returns_429_when_full():
+    """测试队列满时提交接口返回429和Retry-After"""
+    original_queue = app.job_queue
+    app.job_queue = app.JobQueue(max_running=1, max_queued=0, default_duration=30)
+    try:
+        response = app.app.test_client().post('/translate/submit', data={
+            'file': (io.BytesIO(b'%PDF-1.4'), 'paper.pdf'),
+        }, content_type='multipart/form-data')
+    finally:
+        app.job_queue = original_queue
+
+    print(f"\n提交接口: {response.status_code}，Retry-After: {response.headers.get('Retry-After')}")
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['retry_after'] == 1
+
+
+def test_stale_queue_position_does_not_overwrite_running_task():
+    """测试较慢写入的排队位置不会覆盖已开始运行的任务状态"""
+
+    class SlowStore(app.MemoryTaskStore):
+        def update(self, task_id, **fields):
+            if fields.get('queue_position'):
+                time.sleep(0.2)  # 放大“取快照后、写入前”的时间窗口
+            super().update(task_id, **fields)
+
+    original_store = app.task_store
+    app.task_store = SlowStore()
+    queue = app.JobQueue(max_running=1, max_queued=2, default_duration=60)
+    finished = threading.Event()
+    try:
+        app.task_store.create('x', {'status': 'pending', 'created_at': datetime.now().isoformat()})
+        queue.submit('x', lambda: finished.set())
+        assert finished.wait(5)
+        time.sleep(0.3)
+        task = app.task_store.get('x')
+    finally:
+        app.task_store = original_store
+
+    print(f"\n任务开始后的排队位置: {task['queue_position']}")
+    assert task['queue_position'] == 0
+
+
+if __name__ == "__main__":
+    test_queue_positions_and_admission()
+    test_submit_route_returns_429_when_full()
+    test_stale_queue_position_does_not_overwrite_running_task()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+测试LaTeX公式转Unicode
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import convert_latex_to_unicode, latex_fully_convertible, protect_math, _needs_formula_fix
+
+
+def test_latex_conversion():
+    """测试常见学术公式的转换结果"""
+
+    test_cases = [
+        (r"^{13}C", "¹³C"),
+        (r"\delta^{13}\mathrm{C}", "δ¹³C"),
+        (r"\Delta^{17}\mathrm{O}", "Δ¹⁷O"),
+        (r"\mathrm{O}_2", "O₂"),
+        (r"^{12-14}", "¹²⁻¹⁴"),
+        (r"^{2,18}", "²,¹⁸"),
+        (r"5.0 \pm 0.3", "5.0 ± 0.3"),
+        (r"10^{-3}", "10⁻³"),
+        (r"\mathrm{SO}_4^{2-}", "SO₄²⁻"),
+        (r"^{\mathrm{13}}C", "¹³C"),
+        (r"\frac{a}{b}", "ab"),
+        (r"x^a", "x^a"),
+        (r"\mu\mathrm{m}", "μm"),
+        # 命令按完整名称匹配，不会把 \pitchfork 误转为 πtchfork
+        (r"\pitchfork", ""),
+        (r"\sqrt{2}", "√2"),
+        (r"50\%", "50%"),
+    ]
+
+    print("=" * 70)
+    print("测试LaTeX公式转Unicode")
+    print("=" * 70)
+
+    failed = 0
+    for latex, expected in test_cases:
+        result = convert_latex_to_unicode(latex)
+        ok = result == expected
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {latex!r:30} → {result!r}（期望 {expected!r}）")
+
+    assert failed == 0
+
+
+def test_latex_conversion_is_memoized():
+    """测试相同公式只解析一次"""
+    convert_latex_to_unicode.cache_clear()
+    for _ in range(100):
+        convert_latex_to_unicode(r"\delta^{18}\mathrm{O}")
+    info = convert_latex_to_unicode.cache_info()
+
+    print(f"\n缓存统计: {info}")
+    assert info.misses == 1 and info.hits == 99
+
+
+def test_lossy_formulas_need_ai_fix():
+    """测试规则转换会丢失结构的公式（分式、矩阵、字母上标）交给AI修正，简单公式不需要"""
+    cases = [
+        (r"\delta^{13}\mathrm{C}", True),
+        (r"\mathrm{SO}_4^{2-}", True),
+        (r"^{1,2}", True),
+        (r"\left(x\right)", True),
+        (r"\frac{a}{b}", False),
+        (r"e^{-x^2}", False),
+        (r"x^n", False),
+        (r"\begin{matrix} a & b \\ c & d \end{matrix}", False),
+        (r"\sqrt{x+1}", False),
+    ]
+    print("\n规则转换能否完整表达:")
+    for latex, expected in cases:
+        result = latex_fully_convertible(latex)
+        print(f"{'✅' if result == expected else '❌'} {latex!r:50} → {result}")
+        assert result == expected
+
+    assert not _needs_formula_fix(r"碳同位素 $\delta^{13}\mathrm{C}$ 负偏移，$$\mathrm{SO}_4^{2-}$$")
+    assert _needs_formula_fix(r"比值 $\frac{R_{s}}{R_{std}}$ 用于计算")
+    assert _needs_formula_fix("$$\\begin{matrix} a & b \\\\ c & d \\end{matrix}$$")
+    assert _needs_formula_fix(r"函数 $e^{-x^2}$ 衰减")
+    assert _needs_formula_fix("上标 <sup>2</sup> 未转换")
+
+
+def test_currency_is_not_math():
+    """测试金额中的 $ 不被当作公式"""
+    for text in ("Samples cost $5 and $10 each.", "Prices rose from $3 to $4.50.", "A $ 5 $ fee"):
+        protected, formulas = protect_math(text)
+        print(f"  {text!r} → {formulas}")
+        assert protected == text and formulas == []
+        assert not _needs_formula_fix(text)
+
+    protected, formulas = protect_math("Cost $5 and $x$ grows.")
+    assert formulas == ["$x$"] and protected == "Cost $5 and <<<MATH_PLACEHOLDER_0>>> grows."
+
+
+if __name__ == "__main__":
+    test_latex_conversion()
+    test_latex_conversion_is_memoized()
+    test_lossy_formulas_need_ai_fix()
+    test_currency_is_not_math()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+测试Prometheus指标
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+
+
+def test_deeplx_call_updates_metrics():
+    """测试DeepLX调用记录请求状态码、重试、字符数、缓存命中和阶段耗时"""
+    responses = iter([500, 200])
+
+    class FakeResponse:
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise app.requests.exceptions.HTTPError(f"{self.status_code}")
+
+        def json(self):
+            return {"code": 200, "data": "你好"}
+
+    class FakeSession:
+        def post(self, *args, **kwargs):
+            return FakeResponse(next(responses))
+
+    def counters():
+        return (app.OUTBOUND_REQUESTS.value(backend='deeplx', status='500'),
+                app.OUTBOUND_REQUESTS.value(backend='deeplx', status='200'),
+                app.OUTBOUND_RETRIES.value(backend='deeplx'),
+                app.CHARACTERS.value(backend='deeplx', direction='input'),
+                app.CACHE_LOOKUPS.value(cache='translation_memory', result='hit'))
+
+    original = (app.get_http_session, app.translation_memory, app.cancellable_sleep)
+    app.get_http_session = lambda url: FakeSession()
+    app.translation_memory = app.TranslationMemory(os.path.join(tempfile.mkdtemp(), 'm.sqlite3'), 1 << 20)
+    app.cancellable_sleep = lambda seconds: None
+    try:
+        before = counters()
+        app.translate_with_deeplx("Hello")
+        app.translate_with_deeplx("Hello")
+        after = counters()
+    finally:
+        app.get_http_session, app.translation_memory, app.cancellable_sleep = original
+
+    delta = tuple(b - a for a, b in zip(before, after))
+    body = app.app.test_client().get('/metrics').get_data(as_text=True)
+
+    print("=" * 60)
+    print("测试Prometheus指标")
+    print("=" * 60)
+    print(f"  500/200/重试/输入字符/缓存命中 增量: {delta}")
+    assert delta == (1, 1, 1, 5, 1)
+    assert '# TYPE translater_stage_duration_seconds histogram' in body
+    assert 'translater_stage_duration_seconds_count{stage="translate_deeplx"}' in body
+    assert 'translater_outbound_requests_total{backend="deeplx",status="200"}' in body
+    assert 'translater_queue_depth{state="queued"}' in body
+    assert 'translater_cache_hit_ratio{cache="translation_memory"}' in body
+
+
+def test_metrics_merge_other_workers():
+    """测试/metrics合并共享目录中其他worker的计数，已退出worker的即时值不计入"""
+    directory = tempfile.mkdtemp()
+    dead = "999999999:0"
+    with open(os.path.join(directory, "other.json"), 'w', encoding='utf-8') as f:
+        json.dump({'process': dead, 'metrics': {
+            'translater_outbound_requests_total': [[['deeplx', '200'], 7]],
+            'translater_cache_lookups_total': [[['parse', 'hit'], 3]],
+            'translater_queue_depth': [[['queued'], 5]],
+        }}, f)
+
+    original = (app.metrics.directory, app._owner_alive)
+    app.metrics.directory = directory
+    try:
+        local = app.OUTBOUND_REQUESTS.value(backend='deeplx', status='200')
+        local_parse = (app.CACHE_LOOKUPS.value(cache='parse', result='hit'),
+                       app.CACHE_LOOKUPS.value(cache='parse', result='miss'))
+        app.metrics.flush()
+        own = os.path.join(directory, app._process_identity().replace(':', '_') + '.json')
+        body = app.app.test_client().get('/metrics').get_data(as_text=True)
+        app._owner_alive = lambda identity: True
+        alive_body = app.app.test_client().get('/metrics').get_data(as_text=True)
+    finally:
+        app.metrics.directory, app._owner_alive = original
+
+    print("=" * 60)
+    print("测试多个worker的指标合并")
+    print("=" * 60)
+    print(f"  本进程200次数: {local}")
+    assert os.path.exists(own)
+    assert f'translater_outbound_requests_total{{backend="deeplx",status="200"}} {local + 7}' in body
+    hits, misses = local_parse[0] + 3, local_parse[1]
+    assert f'translater_cache_hit_ratio{{cache="parse"}} {hits / (hits + misses)!r}' in body
+    # 本进程的文件不会被重复计算，已退出worker的队列深度不计入
+    assert 'translater_queue_depth{state="queued"} 0' in body
+    assert 'translater_queue_depth{state="queued"} 5' in alive_body
+
+
+if __name__ == "__main__":
+    test_deeplx_call_updates_metrics()
+    test_metrics_merge_other_workers()
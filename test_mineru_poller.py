@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+测试共享的MinerU状态轮询器
+验证多个任务由同一个后台线程轮询，且轮询间隔逐步退避
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+from config import Config
+
+
+def test_shared_poller_with_backoff():
+    """测试并发等待的任务全部被唤醒，且状态请求数少于固定间隔轮询"""
+    polls = {}
+    poll_threads = set()
+
+    class FakeResponse:
+        def __init__(self, task_id):
+            self.task_id = task_id
+
+        def json(self):
+            # 每个任务在第4次查询时完成
+            done = polls[self.task_id] >= 4
+            return {"status": "success" if done else "running", "output": {"task": self.task_id}}
+
+    class FakeSession:
+        def get(self, url, **kwargs):
+            task_id = url.rsplit('/', 1)[-1]
+            polls[task_id] = polls.get(task_id, 0) + 1
+            poll_threads.add(threading.current_thread().name)
+            return FakeResponse(task_id)
+
+    original = (app.get_http_session, app.mineru_poller, app._save_mineru_debug_result,
+                Config.MINERU_POLL_MIN_INTERVAL, Config.MINERU_POLL_MAX_INTERVAL)
+    app.get_http_session = lambda url: FakeSession()
+    app.mineru_poller = app.MinerUPoller()
+    app._save_mineru_debug_result = lambda task_id, result: None
+    Config.MINERU_POLL_MIN_INTERVAL = 0.05
+    Config.MINERU_POLL_MAX_INTERVAL = 0.2
+    try:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(lambda i: app.poll_mineru_task(f"m{i}", api_token="t"), range(20)))
+        elapsed = time.time() - start
+    finally:
+        (app.get_http_session, app.mineru_poller, app._save_mineru_debug_result,
+         Config.MINERU_POLL_MIN_INTERVAL, Config.MINERU_POLL_MAX_INTERVAL) = original
+
+    print("=" * 60)
+    print("测试共享MinerU轮询器")
+    print("=" * 60)
+    print(f"  20个任务耗时 {elapsed:.2f} 秒，状态请求 {sum(polls.values())} 次")
+    print(f"  轮询线程: {sorted(poll_threads)}")
+    assert [r["output"]["task"] for r in results] == [f"m{i}" for i in range(20)]
+    assert all(count == 4 for count in polls.values())
+    assert all(name.startswith("mineru-poll") for name in poll_threads)
+    # 间隔 0.05 → 0.075 → 0.1125，约0.24秒后第4次查询
+    assert 0.2 <= elapsed < 2
+
+
+def test_failed_task_raises():
+    """测试MinerU任务失败时等待方收到异常"""
+    class FakeSession:
+        def get(self, url, **kwargs):
+            return type("R", (), {"json": lambda self: {"status": "failed"}})()
+
+    original = (app.get_http_session, app.mineru_poller)
+    app.get_http_session = lambda url: FakeSession()
+    app.mineru_poller = app.MinerUPoller()
+    try:
+        app.poll_mineru_task("bad", api_token="t")
+        raised = None
+    except ValueError as e:
+        raised = e
+    finally:
+        app.get_http_session, app.mineru_poller = original
+
+    print(f"\n失败任务: {raised}")
+    assert raised is not None and "failed" in str(raised)
+
+
+def test_unexpected_error_does_not_kill_poller():
+    """测试状态处理中的意外异常只结束对应任务，非字典响应稍后重试，轮询线程继续工作"""
+    polls = {}
+
+    class FakeSession:
+        def get(self, url, **kwargs):
+            task_id = url.rsplit('/', 1)[-1]
+            polls[task_id] = polls.get(task_id, 0) + 1
+            if task_id == "boom":
+                return type("R", (), {"json": lambda self: {"status": "success"}})()
+            # 先返回非字典JSON，第二次查询时完成
+            body = ["unexpected"] if polls[task_id] == 1 else {"status": "success", "output": {"task": task_id}}
+            return type("R", (), {"json": lambda self: body})()
+
+    def broken_debug_result(task_id, result):
+        if task_id == "boom":
+            raise RuntimeError("磁盘已满")
+
+    original = (app.get_http_session, app.mineru_poller, app._save_mineru_debug_result,
+                Config.MINERU_POLL_MIN_INTERVAL)
+    app.get_http_session = lambda url: FakeSession()
+    app.mineru_poller = app.MinerUPoller()
+    app._save_mineru_debug_result = broken_debug_result
+    Config.MINERU_POLL_MIN_INTERVAL = 0.05
+    try:
+        try:
+            app.poll_mineru_task("boom", api_token="t")
+            raised = None
+        except RuntimeError as e:
+            raised = e
+        result = app.poll_mineru_task("ok", api_token="t")
+    finally:
+        (app.get_http_session, app.mineru_poller, app._save_mineru_debug_result,
+         Config.MINERU_POLL_MIN_INTERVAL) = original
+
+    print(f"\n意外异常: {raised}，后续任务结果: {result}")
+    assert raised is not None and "磁盘已满" in str(raised)
+    assert result["output"]["task"] == "ok" and polls["ok"] == 2
+
+
+if __name__ == "__main__":
+    test_shared_poller_with_backoff()
+    test_failed_task_raises()
+    test_unexpected_error_does_not_kill_poller()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+测试MinerU解析结果缓存
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+
+
+def _write_pdf(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_key_covers_bytes_and_options():
+    """测试键由文件内容与实际解析参数共同决定"""
+    directory = tempfile.mkdtemp()
+    a = _write_pdf(directory, 'a.pdf', b'%PDF-1.4 same')
+    b = _write_pdf(directory, 'b.pdf', b'%PDF-1.4 same')
+    c = _write_pdf(directory, 'c.pdf', b'%PDF-1.4 other')
+
+    make_key = app.ParseCache.make_key
+    print("=" * 60)
+    print("测试解析缓存键")
+    print("=" * 60)
+    assert make_key(a) == make_key(b)
+    assert make_key(a) != make_key(c)
+    assert make_key(a, {'is_ocr': False}) != make_key(a)
+    # 与默认值相同的选项不改变键
+    assert make_key(a, {'is_ocr': True, 'language': None}) == make_key(a)
+    print("  ✅ 相同内容与参数得到相同的键")
+
+
+def test_ttl_and_size_cap():
+    """测试过期条目失效，超过容量时淘汰最久未使用的条目"""
+    cache = app.ParseCache(tempfile.mkdtemp(), max_bytes=2500, ttl=60)
+    cache.put('old', 'x' * 1000)
+    cache.put('mid', 'y' * 1000)
+    past = time.time() - 30
+    os.utime(cache._path('old'), (past, past))
+    os.utime(cache._path('mid'), (past + 1, past + 1))
+    cache.get('old')  # 访问后成为最近使用
+    cache.put('new', 'z' * 1000)
+
+    expired = time.time() - 120
+    os.utime(cache._path('new'), (expired, expired))
+
+    print(f"\n保留: old={cache.get('old') is not None}, mid={cache.get('mid') is not None}, "
+          f"new={cache.get('new') is not None}")
+    assert cache.get('old') == 'x' * 1000
+    assert cache.get('mid') is None
+    assert cache.get('new') is None
+
+
+def test_repeat_submission_skips_parsing():
+    """测试重复提交相同PDF时跳过MinerU解析"""
+    directory = tempfile.mkdtemp()
+    parses = []
+
+    def fake_parse(task_id, upload_path, mineru_options, parse_api_token):
+        parses.append(task_id)
+        return "# Title\n\nBody"
+
+    original = (app.task_store, app.parse_cache, app._parse_pdf_for_task,
+                app.translate_markdown_content, app.markdown_to_pdf)
+    app.task_store = app.MemoryTaskStore()
+    app.parse_cache = app.ParseCache(os.path.join(directory, 'cache'), 1024 * 1024, 3600)
+    app._parse_pdf_for_task = fake_parse
+    app.translate_markdown_content = lambda text, **kwargs: text
+    app.markdown_to_pdf = lambda text, path: None
+    try:
+        for task_id in ('first', 'second'):
+            app.task_store.create(task_id, {'status': 'pending', 'created_at': datetime.now().isoformat()})
+            upload = _write_pdf(directory, f'{task_id}.pdf', b'%PDF-1.4 paper')
+            app.run_translation_task(task_id, upload, 'paper.pdf', {'is_ocr': True},
+                                     None, None, None, None, 'deeplx')
+        second = app.task_store.get('second')
+    finally:
+        (app.task_store, app.parse_cache, app._parse_pdf_for_task,
+         app.translate_markdown_content, app.markdown_to_pdf) = original
+
+    print(f"\n解析次数: {len(parses)}，第二次状态: {second['status']}")
+    assert parses == ['first']
+    assert second['status'] == 'completed'
+    assert second['parse_cache_hit'] is True
+
+
+if __name__ == "__main__":
+    test_key_covers_bytes_and_options()
+    test_ttl_and_size_cap()
+    test_repeat_submission_skips_parsing()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+测试任务取消
+验证取消接口能及时中止进行中的HTTP请求和排队中的任务
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+from config import Config
+
+
+def _create(task_id):
+    now = datetime.now().isoformat()
+    app.task_store.create(task_id, {
+        'status': 'pending', 'progress': 0, 'message': '等待', 'error': None,
+        'created_at': now, 'updated_at': now,
+    })
+
+
+def test_cancel_running_task_aborts_inflight_request():
+    """测试运行中的任务在HTTP请求未返回时也能很快停止"""
+    requests_started = threading.Event()
+
+    class HangingConnection:
+        def __init__(self):
+            self.sock, self.peer = socket.socketpair()
+
+    class HangingSession:
+        def post(self, *args, **kwargs):
+            # 模拟长时间无响应的翻译API：阻塞在连接的套接字上，直到套接字被关闭
+            conn = HangingConnection()
+            app._http_call.current.attach(conn)
+            requests_started.set()
+            conn.sock.settimeout(30)
+            if conn.sock.recv(1) == b'':
+                raise app.requests.exceptions.ConnectionError('连接已断开')
+
+    original = (app.task_store, app.get_http_session, app.translation_memory, app.markdown_to_pdf,
+                Config.CHECKPOINT_DIR)
+    app.task_store = app.MemoryTaskStore()
+    app.get_http_session = lambda url: HangingSession()
+    app.translation_memory = app.TranslationMemory(os.path.join(tempfile.mkdtemp(), 'm.sqlite3'), 1 << 20)
+    app.markdown_to_pdf = lambda text, path: None
+    Config.CHECKPOINT_DIR = tempfile.mkdtemp()
+    try:
+        _create('run')
+        app.TaskCheckpoint('run').save_markdown("A paragraph that needs translating.")
+        worker = threading.Thread(target=app.run_translation_task, args=(
+            'run', '/nonexistent.pdf', 'paper.pdf', {}, None, 'http://ai.invalid', 'key', 'model', 'ai'))
+        worker.start()
+        assert requests_started.wait(5)
+
+        start = time.time()
+        response = app.app.test_client().post('/translate/cancel/run')
+        worker.join(5)
+        elapsed = time.time() - start
+        task = app.task_store.get('run')
+        finished = app.app.test_client().post('/translate/cancel/run')
+    finally:
+        (app.task_store, app.get_http_session, app.translation_memory, app.markdown_to_pdf,
+         Config.CHECKPOINT_DIR) = original
+
+    print("=" * 60)
+    print("测试取消运行中的任务")
+    print("=" * 60)
+    print(f"  取消后 {elapsed:.2f} 秒任务状态: {task['status']}")
+    assert response.status_code == 200
+    assert not worker.is_alive() and elapsed < 2
+    assert task['status'] == 'cancelled'
+    assert finished.status_code == 400
+
+
+def test_cancel_queued_task():
+    """测试排队中的任务被直接移出队列，不会再执行"""
+    release = threading.Event()
+    ran = []
+
+    original = (app.task_store, app.job_queue)
+    app.task_store = app.MemoryTaskStore()
+    app.job_queue = app.JobQueue(max_running=1, max_queued=5, default_duration=60)
+    try:
+        _create('busy')
+        _create('waiting')
+        app.job_queue.submit('busy', lambda: release.wait(5))
+        app.job_queue.submit('waiting', lambda: ran.append('waiting'))
+        response = app.app.test_client().post('/translate/cancel/waiting')
+        release.set()
+        time.sleep(0.2)
+        task = app.task_store.get('waiting')
+    finally:
+        release.set()
+        app.task_store, app.job_queue = original
+
+    print(f"\n排队任务取消: {response.get_json()}")
+    assert response.get_json()['status'] == 'cancelled'
+    assert task['status'] == 'cancelled'
+    assert ran == []
+
+
+def test_cancel_owner_keeps_job_for_followers():
+    """测试取消被复用的作业时，作业继续为其他等待者运行，最后一个等待者取消后才停止"""
+    release = threading.Event()
+    ran = []
+
+    original = (app.task_store, app.job_queue)
+    app.task_store = app.MemoryTaskStore()
+    app.job_queue = app.JobQueue(max_running=1, max_queued=5, default_duration=60)
+    try:
+        _create('busy')
+        _create('owner')
+        _create('follower')
+        app.task_store.update('follower', attached_to='owner')
+        app.job_queue.submit('busy', lambda: release.wait(5))
+        app.job_queue.submit('owner', lambda: ran.append('owner'))
+        client = app.app.test_client()
+
+        owner_response = client.post('/translate/cancel/owner')
+        owner_view = app.get_task('owner')
+        follower_view = app.get_task('follower')
+        still_queued = app.task_store.get('owner')['status']
+
+        follower_response = client.post('/translate/cancel/follower')
+        release.set()
+        time.sleep(0.2)
+        owner_task = app.task_store.get('owner')
+    finally:
+        release.set()
+        app.task_store, app.job_queue = original
+
+    print(f"\n提交者取消: {owner_response.get_json()}，等待者看到的状态: {follower_view['status']}")
+    print(f"最后一个等待者取消后作业状态: {owner_task['status']}")
+    assert owner_response.get_json()['status'] == 'cancelled'
+    assert owner_view['status'] == 'cancelled'
+    assert follower_view['status'] == 'pending' and still_queued == 'pending'
+    assert follower_response.get_json()['status'] == 'cancelled'
+    assert owner_task['status'] == 'cancelled'
+    assert ran == []
+
+
+def test_cancellable_call_closes_connection():
+    """测试取消后正在进行的HTTP请求被真正中止：服务器看到连接断开，调用线程随之结束"""
+    request_received = threading.Event()
+    disconnected = threading.Event()
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            request_received.set()
+            # 一直不响应，直到客户端断开连接
+            self.connection.settimeout(10)
+            try:
+                if self.connection.recv(1) == b'':
+                    disconnected.set()
+            except OSError:
+                disconnected.set()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/slow"
+
+    original = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    _create('http')
+    token = app.register_cancel_token('http')
+    context = app.current_task_id.set('http')
+    cancelled = None
+    try:
+        threading.Timer(0.3, token.cancel).start()
+        start = time.time()
+        try:
+            app.cancellable_call(app.get_http_session(url).get, url, timeout=30)
+        except app.TaskCancelled:
+            cancelled = time.time() - start
+        assert request_received.is_set()
+        assert disconnected.wait(3)
+        deadline = time.time() + 3
+        while time.time() < deadline and any(t.name == 'cancel-watch-http' for t in threading.enumerate()):
+            time.sleep(0.05)
+        watchers = [t for t in threading.enumerate() if t.name == 'cancel-watch-http']
+    finally:
+        app.current_task_id.reset(context)
+        app.release_cancel_token('http')
+        app.task_store = original
+        server.shutdown()
+        server.server_close()
+
+    print(f"\n取消后 {cancelled:.2f} 秒返回，服务器已看到连接断开，剩余监视线程: {len(watchers)}")
+    assert cancelled is not None and cancelled < 2
+    assert watchers == []
+
+
+def test_cancellable_calls_share_one_watcher():
+    """测试同一任务的多次HTTP调用共用一个监视线程，而不是每次调用启动一个线程"""
+    original = app.task_store
+    app.task_store = app.MemoryTaskStore()
+    _create('watch')
+    token = app.register_cancel_token('watch')
+    context = app.current_task_id.set('watch')
+    threads = []
+    try:
+        def fake_request():
+            threads.append(sorted(t.name for t in threading.enumerate() if t.name.startswith('cancel-watch-')))
+            return 'ok'
+
+        results = [app.cancellable_call(fake_request) for _ in range(5)]
+    finally:
+        app.current_task_id.reset(context)
+        app.release_cancel_token('watch')
+        app.task_store = original
+    token.watcher and token.watcher.join(2)
+
+    print(f"调用期间的监视线程: {threads}")
+    assert results == ['ok'] * 5
+    assert all(names == ['cancel-watch-watch'] for names in threads)
+    assert token.watcher is None
+
+
+if __name__ == "__main__":
+    test_cancel_running_task_aborts_inflight_request()
+    test_cancel_queued_task()
+    test_cancel_owner_keeps_job_for_followers()
+    test_cancellable_call_closes_connection()
+    test_cancellable_calls_share_one_watcher()
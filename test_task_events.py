@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+测试任务状态推送（SSE）
+验证状态变更即时推送，以及推送连接数达到上限时返回503
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+from config import Config
+
+
+def test_events_stream_pushes_updates():
+    """测试SSE接口在 update_task 时推送状态，任务结束后关闭"""
+    original_store = app.task_store
+    app.task_store = app.SQLiteTaskStore(os.path.join(tempfile.mkdtemp(), 'tasks.sqlite3'))
+    try:
+        now = datetime.now().isoformat()
+        app.task_store.create('sse', {
+            'status': 'pending', 'progress': 0, 'message': '等待', 'error': None,
+            'created_at': now, 'updated_at': now,
+        })
+
+        def worker():
+            for progress in (20, 50):
+                time.sleep(0.05)
+                app.update_task('sse', status='processing', progress=progress)
+            time.sleep(0.05)
+            app.update_task('sse', status='completed', progress=100)
+
+        response = app.app.test_client().get('/translate/events/sse')
+        threading.Thread(target=worker).start()
+        start = time.time()
+        body = b''.join(response.response).decode('utf-8')
+        response.close()
+        elapsed = time.time() - start
+    finally:
+        app.task_store = original_store
+
+    events = [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+    print(f"\nSSE推送进度: {[e['progress'] for e in events]}，耗时 {elapsed:.2f} 秒")
+    assert response.mimetype == 'text/event-stream'
+    assert [e['progress'] for e in events] == [0, 20, 50, 100]
+    # 同一进程内的更新应立即推送，而不是等待检查间隔
+    assert elapsed < 0.8
+
+
+def test_events_stream_rejects_when_full():
+    """测试推送连接数达到上限时返回503，连接关闭后名额释放"""
+    original = (app.task_store, app.task_event_streams, Config.TASK_EVENTS_MAX_STREAMS)
+    app.task_store = app.MemoryTaskStore()
+    app.task_event_streams = app.StreamSlots()
+    Config.TASK_EVENTS_MAX_STREAMS = 1
+    try:
+        now = datetime.now().isoformat()
+        app.task_store.create('busy', {
+            'status': 'processing', 'progress': 10, 'message': '处理中', 'error': None,
+            'created_at': now, 'updated_at': now,
+        })
+        client = app.app.test_client()
+        first = client.get('/translate/events/busy')
+        second = client.get('/translate/events/busy')
+        first.close()
+        third = client.get('/translate/events/busy')
+        third.close()
+        active = app.task_event_streams.active
+    finally:
+        app.task_store, app.task_event_streams, Config.TASK_EVENTS_MAX_STREAMS = original
+
+    print(f"\n第二条连接: {second.status_code}，释放后: {third.status_code}")
+    assert first.status_code == 200
+    assert second.status_code == 503 and second.headers['Retry-After']
+    assert third.status_code == 200
+    assert active == 0
+
+
+def test_events_wake_only_listeners_of_the_task():
+    """测试状态变更只唤醒关注该任务（或其复用作业）的连接"""
+    events = app.TaskEvents()
+    with events.listen('a') as a, events.listen('b', 'job') as b:
+        events.notify('a')
+        woken = (a.is_set(), b.is_set())
+        events.notify('job')
+        follower_woken = b.is_set()
+    remaining = dict(events.listeners)
+
+    print(f"\n通知任务a后: a={woken[0]}, b={woken[1]}；通知作业后 b={follower_woken}")
+    assert woken == (True, False)
+    assert follower_woken
+    assert remaining == {}
+
+
+if __name__ == "__main__":
+    test_events_stream_pushes_updates()
+    test_events_stream_rejects_when_full()
+    test_events_wake_only_listeners_of_the_task()
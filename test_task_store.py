@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+测试任务存储
+验证 SQLite 任务存储可以在多个进程（gunicorn worker）之间共享
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+
+
+def _update_from_other_process(path, task_id, index):
+    store = app.SQLiteTaskStore(path)
+    store.update(task_id, **{f'field_{index}': index})
+
+
+def test_sqlite_store_shared_across_processes():
+    """测试其他进程的更新对当前进程可见，且并发更新互不覆盖"""
+    path = os.path.join(tempfile.mkdtemp(), 'tasks.sqlite3')
+    store = app.SQLiteTaskStore(path)
+    store.create('t1', {'status': 'pending', 'progress': 0, 'created_at': datetime.now().isoformat()})
+
+    workers = [multiprocessing.Process(target=_update_from_other_process, args=(path, 't1', i))
+               for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    task = store.get('t1')
+    print("=" * 60)
+    print("测试SQLite任务存储")
+    print("=" * 60)
+    print(f"  任务记录: {task}")
+    assert all(task[f'field_{i}'] == i for i in range(4))
+    assert store.get('missing') is None
+
+
+def test_status_route_reads_store():
+    """测试状态接口从共享任务存储读取"""
+    original_store = app.task_store
+    app.task_store = app.SQLiteTaskStore(os.path.join(tempfile.mkdtemp(), 'tasks.sqlite3'))
+    try:
+        now = datetime.now().isoformat()
+        app.task_store.create('abc', {
+            'status': 'pending', 'progress': 0, 'message': '等待', 'error': None,
+            'created_at': now, 'updated_at': now,
+        })
+        app.update_task('abc', status='processing', progress=30)
+        response = app.app.test_client().get('/translate/status/abc')
+        missing = app.app.test_client().get('/translate/status/nope')
+    finally:
+        app.task_store = original_store
+
+    print(f"\n状态接口返回: {response.get_json()}")
+    assert response.get_json()['status'] == 'processing'
+    assert response.get_json()['progress'] == 30
+    assert missing.status_code == 404
+
+
+if __name__ == "__main__":
+    test_sqlite_store_shared_across_processes()
+    test_status_route_reads_store()
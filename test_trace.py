@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试任务耗时跟踪
+验证任务运行后可通过接口获取 Chrome trace 格式的嵌套区间
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+from config import Config
+
+
+def test_trace_records_nested_spans():
+    """测试任务结束后保存跟踪数据，包含根区间、翻译区间和分块区间"""
+    original = (app.task_store, app.translate_with_deeplx, app.markdown_to_pdf,
+                Config.CHECKPOINT_DIR, Config.TRACE_DIR, Config.DEEPLX_BATCH_MAX_LINES)
+    app.task_store = app.MemoryTaskStore()
+    app.translate_with_deeplx = app.timed_stage('translate_deeplx')(lambda text, **kwargs: f"[译]{text}")
+    app.markdown_to_pdf = lambda text, path: None
+    Config.CHECKPOINT_DIR = tempfile.mkdtemp()
+    Config.TRACE_DIR = tempfile.mkdtemp()
+    Config.DEEPLX_BATCH_MAX_LINES = 1
+    try:
+        now = datetime.now().isoformat()
+        app.task_store.create('traced', {
+            'status': 'pending', 'progress': 0, 'message': '等待', 'error': None,
+            'created_at': now, 'updated_at': now,
+        })
+        app.TaskCheckpoint('traced').save_markdown("First line\nSecond line")
+        app.run_translation_task('traced', '/nonexistent/paper.pdf', 'paper.pdf', {}, None,
+                                 None, None, None, 'deeplx')
+        saved = os.path.exists(os.path.join(Config.TRACE_DIR, 'traced.json'))
+        client = app.app.test_client()
+        response = client.get('/translate/trace/traced')
+        missing = client.get('/translate/trace/nope')
+    finally:
+        (app.task_store, app.translate_with_deeplx, app.markdown_to_pdf,
+         Config.CHECKPOINT_DIR, Config.TRACE_DIR, Config.DEEPLX_BATCH_MAX_LINES) = original
+
+    trace = response.get_json()
+    spans = {}
+    for event in trace['traceEvents']:
+        if event['ph'] == 'X':
+            spans.setdefault(event['name'], []).append(event)
+
+    print("=" * 60)
+    print("测试任务耗时跟踪")
+    print("=" * 60)
+    for name, events in spans.items():
+        print(f"  {name}: {len(events)} 个区间，共 {sum(e['dur'] for e in events) / 1000:.2f} ms")
+
+    assert saved and response.status_code == 200
+    assert missing.status_code == 404
+    root = spans['run_translation_task'][0]
+    assert root['args']['status'] == 'completed'
+    assert len(spans['chunk:line_batch']) == 2
+    assert len(spans['<lambda>']) == 2
+    # 子区间的时间范围包含在根区间内
+    for event in spans['translate'] + spans['chunk:line_batch']:
+        assert root['ts'] <= event['ts'] and event['ts'] + event['dur'] <= root['ts'] + root['dur'] + 1
+    assert any(e['ph'] == 'M' and e['name'] == 'thread_name' for e in trace['traceEvents'])
+
+
+if __name__ == "__main__":
+    test_trace_records_nested_spans()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试翻译记忆（持久化缓存）
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app
+
+
+def _new_memory(max_bytes=1024 * 1024):
+    path = os.path.join(tempfile.mkdtemp(), 'memory.sqlite3')
+    return app.TranslationMemory(path, max_bytes)
+
+
+def test_hit_and_miss():
+    """测试规范化后的原文可以命中"""
+    memory = _new_memory()
+    key = memory.make_key("Hello world.\r\n", 'deeplx', 'EN->ZH')
+    assert memory.get(key) is None
+
+    memory.put(key, 'deeplx', '你好，世界。')
+    same_key = memory.make_key("  Hello world.  ", 'deeplx', 'EN->ZH')
+    other_mode = memory.make_key("Hello world.", 'ai', 'EN->ZH')
+    ai_key = memory.make_key("Hello world.", 'ai', 'gpt', 'v1', endpoint='https://a.example/v1/chat/completions')
+    other_endpoint = memory.make_key("Hello world.", 'ai', 'gpt', 'v1', endpoint='https://b.example/v1/chat/completions')
+
+    print("=" * 60)
+    print("测试翻译记忆命中")
+    print("=" * 60)
+    print(f"  规范化后命中: {memory.get(same_key)}")
+    assert memory.get(same_key) == '你好，世界。'
+    assert memory.get(other_mode) is None
+    # 同名模型由不同接口提供时不共用缓存
+    assert ai_key != other_endpoint
+
+
+def test_lru_eviction():
+    """测试超过容量后淘汰最久未使用的条目"""
+    memory = _new_memory(max_bytes=3000)
+    keys = [memory.make_key(f"text {i}", 'deeplx') for i in range(5)]
+    for i, key in enumerate(keys[:3]):
+        memory.put(key, 'deeplx', str(i) * 900)
+    # 访问第一条，使其成为最近使用
+    memory.get(keys[0])
+    memory.put(keys[3], 'deeplx', '3' * 900)
+
+    print(f"\n淘汰后保留: {[memory.get(k) is not None for k in keys[:4]]}")
+    assert memory.get(keys[0]) is not None
+    assert memory.get(keys[1]) is None
+    assert memory.get(keys[3]) is not None
+
+
+def test_deeplx_hit_skips_network():
+    """测试命中时不发出HTTP请求，并按任务统计命中次数"""
+    calls = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"code": 200, "data": "已翻译"}
+
+    class FakeSession:
+        def post(self, *args, **kwargs):
+            calls.append(kwargs)
+            return FakeResponse()
+
+    original_memory = app.translation_memory
+    original_session = app.get_http_session
+    app.translation_memory = _new_memory()
+    app.get_http_session = lambda url: FakeSession()
+    token = app.current_task_id.set('memtest')
+    try:
+        first = app.translate_with_deeplx("Boilerplate license text.")
+        second = app.translate_with_deeplx("Boilerplate license text.")
+        stats = app.translation_memory.pop_task_stats('memtest')
+    finally:
+        app.current_task_id.reset(token)
+        app.translation_memory = original_memory
+        app.get_http_session = original_session
+
+    print(f"\nHTTP请求次数: {len(calls)}，统计: {stats}")
+    assert first == second == "已翻译"
+    assert len(calls) == 1
+    assert stats == {'hits': 1, 'misses': 1}
+
+
+def test_size_total_tracks_writes():
+    """测试总大小由触发器维护：覆盖写入和淘汰后与实际条目一致，旧数据库首次打开时补统计"""
+    memory = _new_memory(max_bytes=3000)
+    for i in range(6):
+        memory.put(memory.make_key(f"text {i % 4}", 'deeplx'), 'deeplx', str(i) * (400 + 100 * i))
+    conn = memory._connect()
+    total = conn.execute("SELECT total FROM memory_size").fetchone()[0]
+    actual = conn.execute("SELECT SUM(size) FROM memory").fetchone()[0]
+
+    # 模拟旧版本创建的数据库：没有 memory_size 表
+    path = os.path.join(tempfile.mkdtemp(), 'old.sqlite3')
+    old = sqlite3.connect(path)
+    old.execute("CREATE TABLE memory (key TEXT PRIMARY KEY, mode TEXT, value TEXT,"
+                " size INTEGER, created_at REAL, last_used REAL)")
+    old.execute("INSERT INTO memory VALUES ('k', 'deeplx', 'v', 1234, 0, 0)")
+    old.commit()
+    old.close()
+    migrated = app.TranslationMemory(path, 1 << 20)._connect().execute("SELECT total FROM memory_size").fetchone()[0]
+
+    print(f"\n维护的总大小: {total}，实际: {actual}，旧数据库: {migrated}")
+    assert total == actual <= 3000
+    assert migrated == 1234
+
+
+if __name__ == "__main__":
+    test_hit_and_miss()
+    test_lru_eviction()
+    test_deeplx_hit_skips_network()
+    test_size_total_tracks_writes()